@@ -1,22 +1,33 @@
-from flask import Flask, current_app, redirect, url_for
+import time
+
+_IMPORT_T0 = time.perf_counter()  # start of the worker's startup clock
+
+from flask import Flask, redirect, url_for, request
 from flask_login import LoginManager
 from .config import Config
-from .models import db, ServiceApiKey, User
+from .models import db
 from .routes import bp
 from .ui import ui_bp
-import secrets
-from werkzeug.security import generate_password_hash
+from .keys import keyring
+from .utils import load_session_user
+from .hashing import HashPoolBusy
 from werkzeug.middleware.proxy_fix import ProxyFix
 
 # NEW
 from .logging_setup import configure_logging, install_flask_hooks
 from . import db_logging
+from . import replicas
+from . import audit
 
 login_manager = LoginManager()
 
 def create_app():
+    """Build the app without touching the database (unless AUTO_BOOTSTRAP),
+    so gunicorn can preload it and fork workers cheaply."""
+    from . import cli, metrics  # only needed while building the app
     # 1) init logging FIRST so bootstrap logs are structured
     configure_logging()
+    metrics.start_boot_clock(_IMPORT_T0)
 
     app = Flask(__name__)
     app.config.from_object(Config)
@@ -29,36 +40,32 @@ def create_app():
 
     # 3) request/access logging
     install_flask_hooks(app)
+    metrics.install(app)
+    audit.install(app)
+    keyring.init_app(app)
+
+    @app.errorhandler(HashPoolBusy)
+    def hash_pool_busy(e):
+        # Fail fast rather than parking a worker behind a login storm.
+        return {"error": "Server busy, retry later"}, 503, {"Retry-After": str(e.retry_after)}
 
     @login_manager.user_loader
     def load_user(user_id):
-        return db.session.get(User, int(user_id))
+        return load_session_user(int(user_id))
 
-    with app.app_context():
-        db.create_all()
+    cli.register(app)
 
-        # 3b) install DB logging once engine exists
+    with app.app_context():
+        # 3b) install DB logging once engine exists (creating it opens no connection)
         db_logging.install(db.engine)
+        app.extensions["readiness"] = db_logging.ReadinessProbe(db.engine)
+        for engine in replicas.init_app(app).engines:
+            db_logging.install(engine, pool_metrics=False)
 
-        # Bootstrap admin & API key (these prints will now be JSON logs if you want)
-        default_admin = current_app.config["DEFAULT_ADMIN"]
-        default_admin_password = current_app.config["DEFAULT_ADMIN_PASSWORD"]
-
-        if not User.query.filter_by(username=default_admin).first():
-            db.session.add(User(username=default_admin,
-                                password=generate_password_hash(default_admin_password),
-                                is_admin=True))
-            db.session.commit()
-            # Optional: use logging instead of print
-            import logging
-            logging.getLogger("bootstrap").info("created_admin", extra={"username": default_admin})
-
-        if not ServiceApiKey.query.first():
-            default_key = secrets.token_hex(32)
-            db.session.add(ServiceApiKey(key=default_key, description="Default service key"))
-            db.session.commit()
-            import logging
-            logging.getLogger("bootstrap").info("created_default_service_key", extra={"key_suffix": default_key[-4:]})
+        # Schema + default admin/API key; production runs `flask bootstrap`
+        # once per deploy instead of every worker doing it.
+        if app.config["AUTO_BOOTSTRAP"]:
+            cli.bootstrap(app)
 
     # 4) register blueprints
     api_prefix = app.config["API_PREFIX"] or ""
@@ -73,8 +80,28 @@ def create_app():
 
     @app.route("/health")
     def health_root():
+        # Liveness only: no DB, no locks
         return {"status": "ok"}, 200
 
+    @app.route("/health/ready")
+    def health_ready():
+        ok, detail = app.extensions["readiness"].check()
+        # Replicas don't gate readiness: reads fall back to the primary
+        detail["replicas"] = app.extensions["replicas"].stats()
+        return {"status": "ready" if ok else "unavailable", **detail}, 200 if ok else 503
+
+    @app.route("/.well-known/jwks.json")
+    def jwks():
+        # Body and ETag are built once when the keys are loaded.
+        headers = {
+            "Cache-Control": f"public, max-age={app.config['JWKS_MAX_AGE']}",
+            "ETag": f'"{keyring.jwks_etag}"',
+        }
+        if keyring.jwks_etag in request.if_none_match:
+            return "", 304, headers
+        return app.response_class(keyring.jwks_body, mimetype="application/json",
+                                  headers=headers)
+
     @app.route("/debug/routes")
     def debug_routes():
         return {
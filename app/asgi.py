@@ -0,0 +1,292 @@
+# app/asgi.py
+"""Async serving path for the hot read-only API endpoints.
+
+`create_asgi_app()` wraps the regular Flask app: POST {API_PREFIX}/verify and
+{API_PREFIX}/userinfo (including the API key check) are answered natively on
+the event loop with an async SQLAlchemy engine and its own connection pool;
+every other request is handed to Flask through asgiref's WSGI adapter.
+
+The async engine always points at the primary: DATABASE_REPLICA_URLS only
+applies to requests Flask serves (app/replicas.py), not to the native
+endpoints above.
+
+Select it at deploy time with SERVER_MODE=async (see Dockerfile), i.e.
+    SERVER_MODE=async gunicorn -c python:app.gunicorn_conf "app.asgi:create_asgi_app()"
+"""
+import hmac, json, logging, os, time, uuid
+
+from asgiref.wsgi import WsgiToAsgi
+from sqlalchemy import delete, select
+from sqlalchemy.exc import InterfaceError, OperationalError, SQLAlchemyError, TimeoutError as PoolTimeout
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from . import create_app, metrics
+from .logging_setup import _request_id, _scrubbed_headers
+from .models import db, CacheVersion, RevokedToken, ServiceApiKey, User, api_key_prefix, hash_api_key
+from .revocation import denylist
+from .routes import bp, _verify_body, _is_stale
+from .utils import (decode_token, api_key_cache, api_key_negative_cache, api_key_version,
+                    clear_api_key_cache, clear_user_caches, token_version_cache, users_version,
+                    USER_GONE)
+
+access = logging.getLogger("access")
+
+# DB down, connection refused/lost or pool exhausted: retryable, so 503
+_UNAVAILABLE = (OperationalError, InterfaceError, PoolTimeout)
+
+MAX_BODY = 64 * 1024
+_ASYNC_DRIVERS = {"mysql+pymysql": "mysql+aiomysql", "mysql": "mysql+aiomysql",
+                  "sqlite": "sqlite+aiosqlite", "sqlite+pysqlite": "sqlite+aiosqlite"}
+
+
+def async_url(uri: str) -> str:
+    scheme, rest = uri.split("://", 1)
+    return f"{_ASYNC_DRIVERS.get(scheme, scheme)}://{rest}"
+
+
+class _LazyConn:
+    """Checks a pooled connection out only if the request misses every cache."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.conn = None
+
+    async def execute(self, stmt):
+        if self.conn is None:
+            self.conn = await self.engine.connect()
+        return await self.conn.execute(stmt)
+
+    async def commit(self):
+        if self.conn is not None:
+            await self.conn.commit()
+
+    async def close(self):
+        if self.conn is not None:
+            await self.conn.close()
+
+
+async def _poll(gate, conn, clear):
+    if gate.due():
+        v = (await conn.execute(
+            select(CacheVersion.version).where(CacheVersion.name == gate.name)
+        )).scalar()
+        if gate.observe(v or 0):
+            clear()
+
+
+async def sync_denylist(conn):
+    """Async twin of revocation.sync_denylist."""
+    if not denylist.due():
+        return
+    stmt, started = denylist.fetch_query()
+    try:
+        denylist.apply((await conn.execute(stmt)).all(), started)
+        if denylist.prune_due():
+            denylist.prune(started)
+            await conn.execute(delete(RevokedToken).where(RevokedToken.expires_at <= started))
+            await conn.commit()
+    except SQLAlchemyError:
+        logging.getLogger("auth.revocation").warning("revocation_sync_failed", exc_info=True)
+
+
+async def lookup_api_key(conn, key: str) -> dict | None:
+    """Async twin of utils.lookup_api_key, sharing the same caches."""
+    await _poll(api_key_version, conn, clear_api_key_cache)
+    digest = hash_api_key(key)
+    svc = api_key_cache.get(digest)
+    if svc is not None:
+        return svc
+    if api_key_negative_cache.get(digest) is not None:
+        return None
+    rows = await conn.execute(
+        select(ServiceApiKey.id, ServiceApiKey.description, ServiceApiKey.key_hash)
+        .where(ServiceApiKey.prefix == api_key_prefix(key))
+    )
+    svc = None
+    for row in rows:
+        if hmac.compare_digest(row.key_hash, digest):
+            svc = {"id": row.id, "desc": row.description}
+    if svc is None:
+        api_key_negative_cache.set(digest, True)
+        return None
+    api_key_cache.set(digest, svc)
+    return svc
+
+
+async def current_token_version(conn, user_id):
+    await _poll(users_version, conn, clear_user_caches)
+    v = token_version_cache.get(user_id)
+    if v is None:
+        v = (await conn.execute(select(User.token_version).where(User.id == user_id))).scalar()
+        v = USER_GONE if v is None else v
+        token_version_cache.set(user_id, v)
+    return None if v is USER_GONE else v
+
+
+async def _load_user(conn, user_id):
+    return (await conn.execute(
+        select(User.id, User.username, User.created_at, User.token_version)
+        .where(User.id == user_id)
+    )).first()
+
+
+class AsyncApi:
+    def __init__(self, flask_app, engine):
+        self.flask_app = flask_app
+        self.config = flask_app.config
+        self.engine = engine
+        self.fallback = WsgiToAsgi(flask_app)
+        prefix = self.config["API_PREFIX"] or ""
+        self.routes = {f"{prefix}/verify": self.verify, f"{prefix}/userinfo": self.userinfo}
+        # Same labels as the Flask views (auth.verify, auth.userinfo), so
+        # dashboards don't depend on SERVER_MODE
+        self.endpoints = {h: f"{bp.name}.{h.__name__}" for h in self.routes.values()}
+        # Sampling and field allowlist shared with the Flask access log
+        self.log_policy = flask_app.extensions["access_log_policy"]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self._lifespan(receive, send)
+        handler = self.routes.get(scope.get("path")) if scope["type"] == "http" else None
+        if handler is None or scope["method"] != "POST":
+            return await self.fallback(scope, receive, send)
+
+        t0 = time.perf_counter()
+        headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope["headers"]}
+        rid = headers.get("x-request-id") or uuid.uuid4().hex
+        _request_id.set(rid)
+        conn = _LazyConn(self.engine)
+        try:
+            body = await self._read_body(receive)
+            if body is None:
+                status, payload = 413, {"error": "Request body too large"}
+            else:
+                status, payload = await self._authorized(handler, conn, headers, body)
+        except _UNAVAILABLE:
+            logging.getLogger("app").exception("unhandled_exception")
+            status, payload = 503, {"error": "Service unavailable, retry later"}
+        except Exception:
+            logging.getLogger("app").exception("unhandled_exception")
+            status, payload = 500, {"error": "Internal server error"}
+        finally:
+            try:
+                await conn.close()
+            except SQLAlchemyError:
+                logging.getLogger("app").warning("connection_close_failed", exc_info=True)
+        await self._respond(send, status, payload, rid)
+        latency_ms = round((time.perf_counter() - t0) * 1000, 2)
+        endpoint = self.endpoints[handler]
+        metrics.observe_request(endpoint, "POST", status, latency_ms)
+        metrics.first_response()
+        rate = self.log_policy.rate_for(endpoint, status, latency_ms)
+        if not rate:
+            return
+        getters = {
+            "method": lambda: "POST",
+            "path": lambda: scope["path"],
+            "endpoint": lambda: endpoint,
+            "status": lambda: status,
+            "ok": lambda: 200 <= status < 400,
+            "latency_ms": lambda: latency_ms,
+            "remote_addr": lambda: headers.get("x-forwarded-for") or (scope.get("client") or [None])[0],
+            "user_agent": lambda: headers.get("user-agent"),
+            "headers": lambda: _scrubbed_headers(headers),
+        }
+        # "json" and "sql" are only collected on the Flask path
+        extra = {f: getters[f]() for f in self.log_policy.fields if f in getters}
+        if rate < 1.0:
+            extra["sample_rate"] = rate
+        access.info("request", extra=extra)
+
+    async def _authorized(self, handler, conn, headers, body):
+        key = headers.get("x-api-key")
+        if not key:
+            logging.getLogger("auth.access").warning("missing_api_key")
+            return 401, {"error": "Missing API key"}
+        if not await lookup_api_key(conn, key):
+            logging.getLogger("auth.access").warning("invalid_api_key", extra={"key_suffix": key[-4:]})
+            return 403, {"error": "Invalid API key"}
+        await sync_denylist(conn)
+        try:
+            data = json.loads(body or b"{}")
+        except ValueError:
+            return 400, {"error": "Invalid JSON"}
+        if not isinstance(data, dict):
+            return 400, {"error": "Invalid JSON"}
+        return await handler(conn, data)
+
+    async def verify(self, conn, data):
+        payload = decode_token(data.get("token"))
+        if not payload:
+            return 401, {"error": "Invalid or expired token"}
+        if (self.config["VERIFY_STATELESS"] and not data.get("strict")
+                and "tv" in payload and "username" in payload
+                and await current_token_version(conn, payload["user_id"]) == payload["tv"]):
+            return 200, {"user_id": payload["user_id"], "username": payload["username"]}
+        user = await _load_user(conn, payload["user_id"])
+        if not user:
+            return 404, {"error": "User not found"}
+        if _is_stale(payload, user):
+            return 401, {"error": "Token revoked"}
+        return 200, _verify_body(user)
+
+    async def userinfo(self, conn, data):
+        payload = decode_token(data.get("token"))
+        if not payload:
+            return 401, {"error": "Invalid or expired token"}
+        user = await _load_user(conn, payload["user_id"])
+        if not user:
+            return 404, {"error": "User not found"}
+        if _is_stale(payload, user):
+            return 401, {"error": "Token revoked"}
+        return 200, {"id": user.id, "username": user.username,
+                     "created_at": user.created_at.isoformat()}
+
+    @staticmethod
+    async def _read_body(receive):
+        chunks, size = [], 0
+        while True:
+            msg = await receive()
+            chunk = msg.get("body", b"")
+            size += len(chunk)
+            if size > MAX_BODY:
+                return None
+            chunks.append(chunk)
+            if not msg.get("more_body"):
+                return b"".join(chunks)
+
+    @staticmethod
+    async def _respond(send, status, payload, rid):
+        body = json.dumps(payload).encode()
+        await send({"type": "http.response.start", "status": status, "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"x-request-id", rid.encode()),
+        ]})
+        await send({"type": "http.response.body", "body": body})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            msg = await receive()
+            if msg["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif msg["type"] == "lifespan.shutdown":
+                await self.engine.dispose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+def create_asgi_app(flask_app=None):
+    flask_app = flask_app or create_app()
+    with flask_app.app_context():
+        # Same database the sync engine was built for
+        uri = db.engine.url.render_as_string(hide_password=False)
+    opts = {"pool_pre_ping": True, "pool_recycle": 1800}
+    if not uri.startswith("sqlite"):
+        opts.update(pool_size=int(os.getenv("ASYNC_DB_POOL_SIZE", "10")),
+                    max_overflow=int(os.getenv("ASYNC_DB_MAX_OVERFLOW", "10")))
+    engine = create_async_engine(async_url(uri), **opts)
+    if flask_app.config["DATABASE_REPLICA_URLS"]:
+        logging.getLogger("auth.replicas").warning(
+            "replicas_not_used_by_async_path", extra={"count": len(flask_app.config["DATABASE_REPLICA_URLS"])})
+    return AsyncApi(flask_app, engine)
@@ -0,0 +1,220 @@
+# app/audit.py
+"""Queryable audit trail: auth.audit log records stored as audit_event rows.
+
+`AuditStoreHandler` sits on the auth.audit logger and only appends a row to
+an in-memory buffer, so no request pays a commit for auditing. A background
+thread per worker writes the buffer out as multi-row INSERTs once
+AUDIT_BATCH_SIZE events are waiting or every AUDIT_FLUSH_INTERVAL seconds.
+The buffer holds at most AUDIT_BUFFER_MAX events: while the DB is
+unavailable, failed batches are kept and retried with exponential backoff
+(AUDIT_FLUSH_INTERVAL doubling up to AUDIT_MAX_BACKOFF seconds), and
+overflow is dropped and counted (auth_audit_events_dropped_total). A worker crash loses
+at most its unflushed buffer; the auth.audit log lines remain complete.
+
+Like the login counters, this sees only what the auth.audit logger emits,
+so it needs LOG_LEVEL at INFO or below.
+"""
+import atexit, json, logging, os, threading, time
+from datetime import datetime, timezone
+
+from flask import current_app, has_app_context, has_request_context, request
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from . import metrics
+from .logging_setup import _request_id
+from .models import db, AuditEvent
+from .pagination import keyset_page
+
+log = logging.getLogger("auth.audit_store")
+
+BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "200"))
+FLUSH_SEC = float(os.getenv("AUDIT_FLUSH_INTERVAL", "1"))
+BUFFER_MAX = int(os.getenv("AUDIT_BUFFER_MAX", "10000"))
+MAX_BACKOFF = float(os.getenv("AUDIT_MAX_BACKOFF", "60"))
+
+# Extras kept in the JSON `detail` column (the rest have columns of their own)
+DETAIL_FIELDS = ("scope", "retry_after", "user_exists", "count", "key_id", "key_prefix", "is_admin")
+
+
+def _text(v, size):
+    return None if v is None else str(v)[:size]
+
+
+def _int(v):
+    try:
+        return None if v is None else int(v)
+    except (TypeError, ValueError):
+        return None
+
+
+def event_row(record) -> dict:
+    """Column values for an auth.audit LogRecord (every key always present,
+    so rows can share one multi-row INSERT)."""
+    svc = getattr(record, "service", None)
+    detail = {k: getattr(record, k) for k in DETAIL_FIELDS if getattr(record, k, None) is not None}
+    if isinstance(svc, str):  # e.g. "ui"
+        detail["service"] = svc
+    return {
+        "created_at": datetime.fromtimestamp(record.created, timezone.utc).replace(tzinfo=None),
+        "event": _text(record.getMessage(), 64),
+        "user_id": _int(getattr(record, "user_id", None)),
+        "username": _text(getattr(record, "username", None), 80),
+        "actor_id": _int(getattr(record, "actor_id", None)),
+        "service_id": _int(svc.get("id")) if isinstance(svc, dict) else None,
+        "reason": _text(getattr(record, "reason", None), 64),
+        "ip": _text(request.remote_addr, 45) if has_request_context() else None,
+        "request_id": _text(getattr(record, "request_id", None) or _request_id.get(), 32),
+        "detail": json.dumps(detail, default=str) if detail else None,
+    }
+
+
+class AuditWriter:
+    def __init__(self, batch_size=BATCH_SIZE, interval=FLUSH_SEC, max_buffered=BUFFER_MAX,
+                 max_backoff=MAX_BACKOFF):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_buffered = max_buffered
+        self.max_backoff = max_backoff
+        self.written = 0
+        self.dropped = 0
+        self._reset()
+
+    def _reset(self):
+        # Also the after-fork hook: the parent's thread and buffer stay there
+        self._cond = threading.Condition()
+        self._pending = {}  # engine -> [row]; one app/DB per engine
+        self._size = 0
+        self._thread = None
+
+    def add(self, engine, row) -> bool:
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+                self._thread.start()
+            if self._size >= self.max_buffered:
+                self.dropped += 1
+                metrics.AUDIT_DROPPED.inc()
+                return False
+            self._pending.setdefault(engine, []).append(row)
+            self._size += 1
+            if self._size >= self.batch_size:
+                self._cond.notify()
+        return True
+
+    def _take(self):
+        with self._cond:
+            batches, self._pending, self._size = self._pending, {}, 0
+        return batches
+
+    def _run(self):
+        backoff = 0.0
+        while True:
+            if backoff:
+                # Requeued rows fill the batch right away; don't retry
+                # before the backoff is up
+                time.sleep(backoff)
+            else:
+                with self._cond:
+                    self._cond.wait_for(lambda: self._size >= self.batch_size, timeout=self.interval)
+            if self._write(self._take()):
+                backoff = 0.0
+            else:
+                backoff = min(self.max_backoff, max(self.interval, backoff * 2))
+
+    def _write(self, batches) -> bool:
+        """Insert the batches; False if any had to be requeued."""
+        ok = True
+        for engine, rows in batches.items():
+            for i in range(0, len(rows), self.batch_size):
+                chunk = rows[i:i + self.batch_size]
+                try:
+                    with engine.begin() as conn:
+                        conn.execute(insert(AuditEvent.__table__).values(chunk))
+                except SQLAlchemyError:
+                    log.warning("audit_flush_failed", exc_info=True, extra={"count": len(rows) - i})
+                    self._requeue(engine, rows[i:])
+                    ok = False
+                    break
+                self.written += len(chunk)
+                metrics.AUDIT_WRITTEN.inc(len(chunk))
+        return ok
+
+    def _requeue(self, engine, rows):
+        # Failed rows go back in front of newer ones, within the same bound
+        with self._cond:
+            keep = rows[:max(0, self.max_buffered - self._size)]
+            self._pending[engine] = keep + self._pending.get(engine, [])
+            self._size += len(keep)
+            lost = len(rows) - len(keep)
+        if lost:
+            self.dropped += lost
+            metrics.AUDIT_DROPPED.inc(lost)
+
+    def flush(self):
+        """Write everything buffered now, on the calling thread."""
+        self._write(self._take())
+
+    def clear(self):
+        self._take()
+
+    def stats(self) -> dict:
+        return {"buffered": self._size, "written": self.written, "dropped": self.dropped}
+
+
+audit_writer = AuditWriter()
+os.register_at_fork(after_in_child=audit_writer._reset)
+atexit.register(audit_writer.flush)
+
+
+class AuditStoreHandler(logging.Handler):
+    """Buffers auth.audit records for the audit_event table."""
+
+    def emit(self, record):
+        if not has_app_context() or not current_app.config["AUDIT_STORE"]:
+            return
+        try:
+            audit_writer.add(db.engine, event_row(record))
+        except Exception:
+            self.handleError(record)
+
+
+def install(app):
+    audit = logging.getLogger("auth.audit")
+    if not any(isinstance(h, AuditStoreHandler) for h in audit.handlers):
+        audit.addHandler(AuditStoreHandler())
+
+
+def _naive_utc(value: str) -> datetime:
+    dt = datetime.fromisoformat(value)
+    return dt.astimezone(timezone.utc).replace(tzinfo=None) if dt.tzinfo else dt
+
+
+def query_events(user_id=None, username=None, service_id=None, event=None,
+                 since=None, until=None, cursor=None, limit=None):
+    """Newest-first page of events; returns (rows, next_cursor).
+
+    `since`/`until` are ISO 8601 (naive means UTC), `until` exclusive.
+    Raises ValueError (or BadCursor) on bad input.
+    """
+    query = AuditEvent.query
+    if user_id is not None:
+        query = query.filter(AuditEvent.user_id == user_id)
+    if username:
+        query = query.filter(AuditEvent.username == username)
+    if service_id is not None:
+        query = query.filter(AuditEvent.service_id == service_id)
+    if event:
+        query = query.filter(AuditEvent.event == event)
+    if since:
+        query = query.filter(AuditEvent.created_at >= _naive_utc(since))
+    if until:
+        query = query.filter(AuditEvent.created_at < _naive_utc(until))
+    return keyset_page(query, [AuditEvent.created_at, AuditEvent.id], cursor, limit, desc=True)
+
+
+def event_dict(e: AuditEvent) -> dict:
+    return {"id": e.id, "created_at": e.created_at.isoformat(), "event": e.event,
+            "user_id": e.user_id, "username": e.username, "actor_id": e.actor_id,
+            "service_id": e.service_id, "reason": e.reason, "ip": e.ip,
+            "request_id": e.request_id, "detail": json.loads(e.detail) if e.detail else None}
@@ -0,0 +1,230 @@
+# app/bulk.py
+"""Bulk user import/export, shared by the API and the CLI.
+
+Import reads NDJSON or CSV incrementally and works in batches: one query
+finds existing usernames/emails for the whole batch, passwords are hashed
+concurrently through the shared hash pool, and the batch is inserted with a
+single executemany and committed. The rules are those of /api/register
+(username and password required, username and email unique). When the hash
+pool stays busy (interactive logins come first), a row is retried for up to
+BULK_HASH_RETRIES rounds; after that it and the rest of its batch are
+reported as "failed" and can be sent again.
+
+Export pages through the user table by primary key and yields NDJSON lines,
+so memory stays flat however many users there are.
+"""
+import csv, json, os, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from sqlalchemy import insert, or_, select
+from sqlalchemy.exc import IntegrityError
+
+from .hashing import HashPoolBusy, hash_password, hasher
+from .models import db, User
+
+BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "500"))
+# Hashes in flight per import; default half the hash pool so logins still get through
+HASH_CONCURRENCY = int(os.getenv("BULK_HASH_CONCURRENCY", "0"))
+HASH_RETRIES = int(os.getenv("BULK_HASH_RETRIES", "10"))
+EXPORT_COLUMNS = ("id", "username", "email", "is_admin", "created_at")
+
+
+def read_rows(stream, fmt="ndjson"):
+    """Yield (line_no, row) from a text stream; unparseable lines yield an
+    error string instead of a dict."""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for n, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = "invalid JSON"
+        yield n, row if isinstance(row, (dict, str)) else "expected a JSON object"
+
+
+def _hash_concurrency() -> int:
+    # Read per import: the pool is resized after this module is imported
+    return HASH_CONCURRENCY or max(1, hasher.workers // 2)
+
+
+def _hash_with_retry(password, gave_up):
+    """Hash, backing off while the pool is busy (bulk work yields to
+    interactive logins). Returns None once `gave_up` is set, by this or
+    another row of the batch, after HASH_RETRIES busy rounds."""
+    for _ in range(HASH_RETRIES + 1):
+        if gave_up.is_set():
+            return None
+        try:
+            return hash_password(password)
+        except HashPoolBusy as e:
+            time.sleep(e.retry_after)
+    gave_up.set()
+    return None
+
+
+class _Batch:
+    def __init__(self, trusted):
+        self.trusted = trusted
+        self.rows = []      # (line, values) still to insert
+        self.results = {}   # line -> result dict
+
+    def result(self, line, username, status, error=None):
+        self.results[line] = {"line": line, "username": username, "status": status,
+                              **({"error": error} if error else {})}
+
+
+def _text(v, strip=True):
+    if not isinstance(v, str):
+        return ""
+    return v.strip() if strip else v
+
+
+def _validate(batch, parsed):
+    seen_names, seen_emails = set(), set()
+    for line, row in parsed:
+        if isinstance(row, str):
+            batch.result(line, None, "invalid", row)
+            continue
+        username, email = _text(row.get("username")), _text(row.get("email")) or None
+        password, pwhash = _text(row.get("password"), strip=False), _text(row.get("password_hash"))
+        if pwhash and not batch.trusted:
+            batch.result(line, username, "invalid", "password_hash not accepted here")
+        elif not username or not (password or pwhash):
+            batch.result(line, username or None, "invalid", "Missing username or password")
+        elif username in seen_names or (email and email in seen_emails):
+            batch.result(line, username, "duplicate", "repeated in input")
+        else:
+            seen_names.add(username)
+            if email:
+                seen_emails.add(email)
+            is_admin = batch.trusted and str(row.get("is_admin", "")).lower() in ("1", "true", "yes")
+            batch.rows.append((line, {"username": username, "email": email, "password": password,
+                                      "password_hash": pwhash, "is_admin": is_admin}))
+
+
+def _drop_existing(batch):
+    """One query for the whole batch, same test as routes.register."""
+    names = [v["username"] for _, v in batch.rows]
+    emails = [v["email"] for _, v in batch.rows if v["email"]]
+    cond = User.username.in_(names)
+    if emails:
+        cond = or_(cond, User.email.in_(emails))
+    taken_names, taken_emails = set(), set()
+    for username, email in db.session.execute(select(User.username, User.email).where(cond)):
+        taken_names.add(username)
+        taken_emails.add(email)
+    keep = []
+    for line, v in batch.rows:
+        if v["username"] in taken_names or (v["email"] and v["email"] in taken_emails):
+            batch.result(line, v["username"], "duplicate",
+                         "User with that username or email already exists")
+        else:
+            keep.append((line, v))
+    batch.rows = keep
+
+
+def _hash_all(batch, pool):
+    todo = [v for _, v in batch.rows if not v["password_hash"]]
+    gave_up = threading.Event()
+    hashes = pool.map(lambda pw: _hash_with_retry(pw, gave_up), [v["password"] for v in todo])
+    for v, pwhash in zip(todo, hashes):
+        v["password_hash"] = pwhash
+    keep = []
+    for line, v in batch.rows:
+        if v["password_hash"]:
+            keep.append((line, v))
+        else:
+            batch.result(line, v["username"], "failed", "Password hashing busy, retry later")
+    batch.rows = keep
+
+
+def _values(v):
+    return {"username": v["username"], "email": v["email"],
+            "password": v["password_hash"], "is_admin": v["is_admin"]}
+
+
+def _insert(batch):
+    if not batch.rows:
+        return
+    try:
+        db.session.execute(insert(User), [_values(v) for _, v in batch.rows])
+        db.session.commit()
+    except IntegrityError:
+        # Lost a race with a concurrent register; redo row by row
+        db.session.rollback()
+        for line, v in batch.rows:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(insert(User), [_values(v)])
+            except IntegrityError:
+                batch.result(line, v["username"], "duplicate",
+                             "User with that username or email already exists")
+                continue
+            batch.result(line, v["username"], "created")
+        db.session.commit()
+        return
+    for line, v in batch.rows:
+        batch.result(line, v["username"], "created")
+
+
+def import_users(rows, batch_size=None, trusted=False):
+    """Import (line, row) pairs from read_rows(); yields one result per row.
+
+    `trusted` (CLI only) also accepts precomputed werkzeug `password_hash`
+    values and the `is_admin` flag.
+    """
+    rows = iter(rows)
+    batch_size = batch_size or BATCH_SIZE
+    with ThreadPoolExecutor(max_workers=_hash_concurrency(),
+                            thread_name_prefix="bulk-hash") as pool:
+        while True:
+            parsed = list(islice(rows, batch_size))
+            if not parsed:
+                return
+            batch = _Batch(trusted)
+            _validate(batch, parsed)
+            if batch.rows:
+                _drop_existing(batch)
+                _hash_all(batch, pool)
+                _insert(batch)
+            for line, _ in parsed:
+                yield batch.results[line]
+
+
+def summarize(results) -> dict:
+    counts = {"created": 0, "duplicate": 0, "invalid": 0, "failed": 0}
+    for r in results:
+        counts[r["status"]] += 1
+    return counts
+
+
+def export_users(chunk=1000, with_hashes=False):
+    """Yield users as NDJSON lines, `chunk` rows per query, in id order."""
+    cols = [getattr(User, c) for c in EXPORT_COLUMNS]
+    if with_hashes:
+        cols.append(User.password)
+    last_id = 0
+    while True:
+        page = db.session.execute(
+            select(*cols).where(User.id > last_id).order_by(User.id).limit(chunk)
+        ).all()
+        if not page:
+            return
+        for row in page:
+            item = dict(zip(EXPORT_COLUMNS, row))
+            item["is_admin"] = bool(item["is_admin"])
+            item["created_at"] = item["created_at"].isoformat() if item["created_at"] else None
+            if with_hashes:
+                item["password_hash"] = row[-1]
+            yield json.dumps(item, separators=(",", ":")) + "\n"
+        last_id = page[-1][0]
+        # Column rows don't enter the identity map, but end the read
+        # transaction so a long export doesn't pin an old snapshot
+        db.session.rollback()
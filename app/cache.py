@@ -0,0 +1,139 @@
+# app/cache.py
+import threading, time
+from collections import OrderedDict
+
+from sqlalchemy import select, update
+from sqlalchemy.dialects import mysql, sqlite
+from .models import db, CacheVersion
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU with a per-entry TTL and hit/miss counters.
+
+    Lives in worker memory only; cross-worker invalidation is done with
+    `VersionGate` below.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING or item[0] <= now:
+                if item is not _MISSING:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key, value, ttl: float | None = None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key):
+        with self._lock:
+            item = self._data.pop(key, None)
+        return item[1] if item else None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "maxsize": self.maxsize,
+                "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions}
+
+
+def current_version(name: str) -> int:
+    # Always hits the DB (no identity map), it's a single PK lookup.
+    v = db.session.execute(
+        select(CacheVersion.version).where(CacheVersion.name == name)
+    ).scalar()
+    return v or 0
+
+
+def bump_version(name: str):
+    """Increment a namespace counter inside the caller's transaction.
+
+    A single upsert, so two workers creating the same row at once don't
+    fail the caller's transaction with a duplicate key.
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect == "mysql":
+        stmt = mysql.insert(CacheVersion).values(name=name, version=1)
+        db.session.execute(stmt.on_duplicate_key_update(version=CacheVersion.version + 1))
+    elif dialect == "sqlite":
+        stmt = sqlite.insert(CacheVersion).values(name=name, version=1)
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=[CacheVersion.name], set_={"version": CacheVersion.version + 1}))
+    else:
+        res = db.session.execute(
+            update(CacheVersion)
+            .where(CacheVersion.name == name)
+            .values(version=CacheVersion.version + 1)
+        )
+        if not res.rowcount:
+            db.session.add(CacheVersion(name=name, version=1))
+
+
+class VersionGate:
+    """Polls a CacheVersion row at most every `interval` seconds.
+
+    `changed()` returns True once per observed version move, so callers can
+    clear their caches. Staleness across workers is bounded by `interval`.
+    """
+
+    def __init__(self, name: str, interval: float = 2.0):
+        self.name = name
+        self.interval = interval
+        self.polls = 0
+        self._seen: int | None = None
+        self._next_poll = 0.0
+        self._lock = threading.Lock()
+
+    def changed(self) -> bool:
+        if not self.due():
+            return False
+        return self.observe(current_version(self.name))
+
+    def due(self) -> bool:
+        """True (once per interval) when the caller should fetch the version."""
+        now = time.monotonic()
+        if now < self._next_poll:
+            return False
+        with self._lock:
+            if now < self._next_poll:
+                return False
+            self._next_poll = now + self.interval
+        return True
+
+    def observe(self, version: int) -> bool:
+        """Record a fetched version; True if it moved since the last one seen."""
+        self.polls += 1
+        prev, self._seen = self._seen, version
+        return prev is not None and prev != version
+
+    def reset(self):
+        self._seen = None
+        self._next_poll = 0.0
@@ -0,0 +1,334 @@
+# app/cli.py
+import json, logging, os
+from datetime import datetime
+
+import click
+from cryptography.hazmat.primitives import serialization
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import MetaData, inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateColumn, CreateTable
+
+from werkzeug.security import generate_password_hash
+
+from .models import db, RefreshToken, ServiceApiKey, User, api_key_prefix, hash_api_key
+from . import hashing, keys
+
+log = logging.getLogger("migrate")
+
+
+def migrate_legacy_api_keys(engine: Engine) -> int:
+    """Move a pre-hashing service_api_key table to prefix + digest storage.
+
+    The legacy plaintext `key` column is UNIQUE, which SQLite refuses to
+    drop, so there the table is rebuilt. Elsewhere the columns are added,
+    backfilled and `key` dropped in place; MySQL commits each ALTER on its
+    own, so every step checks the current schema first. Either way a run
+    interrupted halfway can simply be started again. Returns the number of
+    keys converted.
+    """
+    if engine.dialect.name == "sqlite":
+        return _rebuild_legacy_api_keys(engine)
+
+    table = ServiceApiKey.__tablename__
+    insp = inspect(engine)
+    if not insp.has_table(table):
+        return 0
+    cols = {c["name"] for c in insp.get_columns(table)}
+    if "key" not in cols:
+        return 0
+
+    q = engine.dialect.identifier_preparer.quote
+    with engine.begin() as conn:
+        if "prefix" not in cols:
+            conn.execute(text(f"ALTER TABLE {q(table)} ADD COLUMN prefix VARCHAR(16)"))
+        if "key_hash" not in cols:
+            conn.execute(text(f"ALTER TABLE {q(table)} ADD COLUMN key_hash CHAR(64)"))
+
+    converted = 0
+    with engine.begin() as conn:
+        rows = conn.execute(text(
+            f"SELECT id, {q('key')} FROM {q(table)} WHERE key_hash IS NULL"
+        )).all()
+        for row_id, key in rows:
+            conn.execute(
+                text(f"UPDATE {q(table)} SET prefix = :p, key_hash = :h WHERE id = :id"),
+                {"p": api_key_prefix(key), "h": hash_api_key(key), "id": row_id},
+            )
+            converted += 1
+
+    with engine.begin() as conn:
+        for idx in ServiceApiKey.__table__.indexes:
+            idx.create(conn, checkfirst=True)
+        for name in _unique_on_key(inspect(conn), table):
+            drop = "INDEX" if engine.dialect.name == "mysql" else "CONSTRAINT"
+            conn.execute(text(f"ALTER TABLE {q(table)} DROP {drop} {q(name)}"))
+        conn.execute(text(f"ALTER TABLE {q(table)} DROP COLUMN {q('key')}"))
+
+    log.info("api_keys_migrated", extra={"count": converted})
+    return converted
+
+
+def _unique_on_key(insp, table) -> set[str]:
+    """Names of the unique constraints/indexes covering just the legacy `key`."""
+    found = insp.get_unique_constraints(table) + [
+        ix for ix in insp.get_indexes(table) if ix.get("unique")]
+    return {c["name"] for c in found if c["name"] and c["column_names"] == ["key"]}
+
+
+def _rebuild_legacy_api_keys(engine: Engine) -> int:
+    """SQLite: copy the legacy rows into a new table built from the model,
+    then swap it in for the old one."""
+    table = ServiceApiKey.__tablename__
+    tmp = f"{table}_rebuild"
+    q = engine.dialect.identifier_preparer.quote
+    insp = inspect(engine)
+    has_old, has_tmp = insp.has_table(table), insp.has_table(tmp)
+    if has_tmp and not has_old:
+        # Stopped after the legacy table was dropped: the copy is complete
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {q(tmp)} RENAME TO {q(table)}"))
+            for idx in ServiceApiKey.__table__.indexes:
+                idx.create(conn, checkfirst=True)
+        log.info("api_keys_migrated", extra={"count": 0})
+        return 0
+    if not has_old or "key" not in {c["name"] for c in insp.get_columns(table)}:
+        return 0
+
+    new = ServiceApiKey.__table__.to_metadata(MetaData(), name=tmp)
+    with engine.begin() as conn:
+        if has_tmp:  # a copy that never finished
+            conn.execute(text(f"DROP TABLE {q(tmp)}"))
+        conn.execute(CreateTable(new))  # indexes come after the swap
+        rows = conn.execute(text(f"SELECT * FROM {q(table)}")).mappings().all()
+        copied = [{**{c: r[c] for c in new.c.keys() if c in r},
+                   "prefix": api_key_prefix(r["key"]), "key_hash": hash_api_key(r["key"])}
+                  for r in rows]
+        if copied:
+            conn.execute(new.insert(), copied)
+        conn.execute(text(f"DROP TABLE {q(table)}"))
+        conn.execute(text(f"ALTER TABLE {q(tmp)} RENAME TO {q(table)}"))
+        for idx in ServiceApiKey.__table__.indexes:
+            idx.create(conn, checkfirst=True)
+
+    log.info("api_keys_migrated", extra={"count": len(copied)})
+    return len(copied)
+
+
+def add_missing_columns(engine: Engine) -> list[str]:
+    """ALTER TABLE ADD COLUMN for model columns an existing table lacks.
+
+    create_all() never touches existing tables, so additive model changes go
+    through here. New NOT NULL columns must carry a server_default.
+    """
+    insp = inspect(engine)
+    q = engine.dialect.identifier_preparer.quote
+    added = []
+    with engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if not insp.has_table(table.name):
+                continue
+            existing = {c["name"] for c in insp.get_columns(table.name)}
+            for col in table.columns:
+                if col.name in existing:
+                    continue
+                ddl = CreateColumn(col).compile(dialect=engine.dialect)
+                conn.execute(text(f"ALTER TABLE {q(table.name)} ADD COLUMN {ddl}"))
+                added.append(f"{table.name}.{col.name}")
+    if added:
+        log.info("columns_added", extra={"columns": added})
+    return added
+
+
+def add_missing_indexes(engine: Engine) -> list[str]:
+    """CREATE INDEX for named model indexes an existing table lacks."""
+    insp = inspect(engine)
+    added = []
+    with engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if not insp.has_table(table.name):
+                continue
+            existing = {ix["name"] for ix in insp.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(conn)
+                    added.append(index.name)
+    if added:
+        log.info("indexes_added", extra={"indexes": added})
+    return added
+
+
+def upgrade_schema(engine: Engine):
+    """Bring the database up to the current models; idempotent."""
+    migrate_legacy_api_keys(engine)
+    db.metadata.create_all(engine)
+    add_missing_columns(engine)
+    add_missing_indexes(engine)
+
+
+def bootstrap_defaults(app):
+    """Create the default admin and a first service API key if missing."""
+    boot = logging.getLogger("bootstrap")
+    admin = app.config["DEFAULT_ADMIN"]
+    if not User.query.filter_by(username=admin).first():
+        db.session.add(User(username=admin,
+                            password=generate_password_hash(app.config["DEFAULT_ADMIN_PASSWORD"]),
+                            is_admin=True))
+        db.session.commit()
+        boot.info("created_admin", extra={"username": admin})
+
+    if not ServiceApiKey.query.first():
+        # Use the key from .env (init_env.sh) when given; a generated key
+        # is stored hashed only, so create a new one from the dashboard.
+        default_key = app.config["DEFAULT_SERVICE_API_KEY"]
+        if default_key:
+            row = ServiceApiKey.from_plaintext(default_key, description="Default service key")
+        else:
+            row, default_key = ServiceApiKey.generate(description="Default service key")
+        db.session.add(row)
+        db.session.commit()
+        boot.info("created_default_service_key", extra={"key_prefix": row.prefix})
+
+
+def bootstrap(app):
+    """Schema upgrade plus default rows; needs an app context."""
+    upgrade_schema(db.engine)
+    bootstrap_defaults(app)
+
+
+@click.command("bootstrap")
+@with_appcontext
+def bootstrap_command():
+    """Upgrade the schema and create the default admin and API key.
+
+    Run once per deploy before starting workers (see Dockerfile); with
+    AUTO_BOOTSTRAP off (the default) workers boot without touching the
+    database.
+    """
+    bootstrap(current_app)
+    click.echo("Bootstrap complete")
+
+
+@click.command("migrate-api-keys")
+@with_appcontext
+def migrate_api_keys_command():
+    """Hash legacy plaintext service API keys in place."""
+    n = migrate_legacy_api_keys(db.engine)
+    click.echo(f"Migrated {n} API key(s)")
+
+
+@click.command("generate-signing-key")
+@click.option("--alg", type=click.Choice(["EdDSA", "RS256"]), default="EdDSA")
+@with_appcontext
+def generate_signing_key_command(alg):
+    """Add a new JWT signing key to JWT_KEYS_DIR.
+
+    The newest kid becomes active on the next restart unless JWT_ACTIVE_KID
+    pins another one; older keys keep verifying until retired.
+    """
+    keys_dir = current_app.config["JWT_KEYS_DIR"]
+    if not keys_dir:
+        raise click.ClickException("JWT_KEYS_DIR is not set")
+    os.makedirs(keys_dir, exist_ok=True)
+    kid = keys.new_kid()
+    path = keys.write_private_key(keys_dir, kid, keys.generate_private_key(alg))
+    click.echo(f"kid={kid} written to {path}")
+
+
+@click.command("retire-signing-key")
+@click.argument("kid")
+@with_appcontext
+def retire_signing_key_command(kid):
+    """Replace a private key with its public half (verify-only).
+
+    Delete the .pub.pem once tokens signed with it have expired.
+    """
+    keys_dir = current_app.config["JWT_KEYS_DIR"]
+    if not keys_dir:
+        raise click.ClickException("JWT_KEYS_DIR is not set")
+    path = os.path.join(keys_dir, f"{kid}.pem")
+    with open(path, "rb") as fh:
+        priv = serialization.load_pem_private_key(fh.read(), password=None)
+    with open(os.path.join(keys_dir, f"{kid}.pub.pem"), "wb") as fh:
+        fh.write(priv.public_key().public_bytes(serialization.Encoding.PEM,
+                                                serialization.PublicFormat.SubjectPublicKeyInfo))
+    os.remove(path)
+    click.echo(f"kid={kid} is now verify-only")
+
+
+@click.command("calibrate-hash")
+@click.option("--algorithm", type=click.Choice(["scrypt", "pbkdf2"]), default="scrypt")
+@click.option("--target-ms", type=float, default=250.0, help="p99 budget for one hash")
+@click.option("--samples", type=int, default=20)
+def calibrate_hash_command(algorithm, target_ms, samples):
+    """Benchmark password hashing on this host and recommend PASSWORD_HASH_METHOD.
+
+    Run it on production-sized hardware; the budget is per hash, so leave
+    headroom for queueing in the hash pool under concurrent logins.
+    """
+    result = hashing.calibrate(algorithm, target_ms, samples)
+    for t in result["tried"]:
+        click.echo(f"  {t['method']:<28} p99={t['p99_ms']}ms")
+    click.echo(f"PASSWORD_HASH_METHOD={result['recommended']}  (p99={result['p99_ms']}ms, "
+               f"target={target_ms}ms, cpus={result['cpu_count']})")
+    if result["p99_ms"] > target_ms:
+        click.echo("warning: even the cheapest candidate exceeds the target on this host")
+
+
+@click.command("import-users")
+@click.argument("src", type=click.File("r", encoding="utf-8"))
+@click.option("--format", "fmt", type=click.Choice(["ndjson", "csv"]), default=None,
+              help="Defaults to csv for *.csv files, else ndjson")
+@click.option("--batch-size", type=int, default=None, help="Default BULK_BATCH_SIZE")
+@click.option("--results", type=click.File("w"), default="-", help="Per-row NDJSON results")
+@with_appcontext
+def import_users_command(src, fmt, batch_size, results):
+    """Bulk-create users from SRC ('-' for stdin).
+
+    Rows are {username, password[, email]}; rows may carry a werkzeug
+    password_hash instead of a password, and is_admin (as written by
+    export-users --with-hashes).
+    """
+    from . import bulk
+
+    fmt = fmt or ("csv" if src.name.endswith(".csv") else "ndjson")
+    counts = {"created": 0, "duplicate": 0, "invalid": 0, "failed": 0}
+    for r in bulk.import_users(bulk.read_rows(src, fmt), batch_size=batch_size, trusted=True):
+        counts[r["status"]] += 1
+        results.write(json.dumps(r) + "\n")
+    log.info("users_imported", extra={"count": counts["created"]})
+    click.echo(", ".join(f"{k}={v}" for k, v in counts.items()), err=True)
+
+
+@click.command("export-users")
+@click.option("--out", type=click.File("w"), default="-")
+@click.option("--with-hashes", is_flag=True, help="Include password hashes (for import-users)")
+@with_appcontext
+def export_users_command(out, with_hashes):
+    """Write all users as NDJSON, in id order."""
+    from . import bulk
+
+    for line in bulk.export_users(with_hashes=with_hashes):
+        out.write(line)
+
+
+@click.command("prune-refresh-tokens")
+@with_appcontext
+def prune_refresh_tokens_command():
+    """Delete expired refresh tokens (used/revoked rows stay until expiry
+    so reuse of a stolen token is still detected)."""
+    n = RefreshToken.query.filter(RefreshToken.expires_at < datetime.utcnow()).delete()
+    db.session.commit()
+    click.echo(f"Deleted {n} expired refresh token(s)")
+
+
+def register(app):
+    app.cli.add_command(bootstrap_command)
+    app.cli.add_command(migrate_api_keys_command)
+    app.cli.add_command(generate_signing_key_command)
+    app.cli.add_command(retire_signing_key_command)
+    app.cli.add_command(calibrate_hash_command)
+    app.cli.add_command(import_users_command)
+    app.cli.add_command(export_users_command)
+    app.cli.add_command(prune_refresh_tokens_command)
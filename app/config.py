@@ -9,16 +9,54 @@ def _norm(p: str | None) -> str:
 
 class Config:
     SECRET_KEY = os.getenv("SECRET_KEY", "super-secret")
-    SQLALCHEMY_DATABASE_URI = (
+    # DATABASE_URL overrides the MySQL settings (e.g. sqlite:///bench.db for
+    # local benchmarks)
+    SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL") or (
         f"mysql+pymysql://{os.getenv('MYSQL_USER')}:{os.getenv('MYSQL_PASSWORD')}"
         f"@{os.getenv('MYSQL_HOST')}/{os.getenv('MYSQL_DATABASE')}"
     )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     API_KEYS = [k.strip() for k in os.getenv("API_KEYS", "").split(",") if k.strip()]
 
+    # Run `flask bootstrap` (schema + defaults below) inside create_app.
+    # Off by default so workers never stampede the DB at boot; for a local
+    # `flask run`, run `flask bootstrap` once or set AUTO_BOOTSTRAP=true.
+    AUTO_BOOTSTRAP = os.getenv("AUTO_BOOTSTRAP", "false").lower() == "true"
+
     # bootstrap admin
     DEFAULT_ADMIN = os.getenv("DEFAULT_ADMIN", "admin")
     DEFAULT_ADMIN_PASSWORD = os.getenv("DEFAULT_ADMIN_PASSWORD", "adminpass")
+    DEFAULT_SERVICE_API_KEY = os.getenv("AUTH_SERVICE_API_KEY")
+
+    # Asymmetric JWT signing: directory of <kid>.pem (sign) / <kid>.pub.pem
+    # (verify only) keys. Unset = HS256 with SECRET_KEY.
+    JWT_KEYS_DIR = os.getenv("JWT_KEYS_DIR") or None
+    JWT_ACTIVE_KID = os.getenv("JWT_ACTIVE_KID") or None
+    JWT_ACCEPT_HS256 = os.getenv("JWT_ACCEPT_HS256", "true").lower() == "true"
+    JWKS_MAX_AGE = int(os.getenv("JWKS_MAX_AGE", "300"))
+
+    # Access token lifetime; also how long revocations are kept
+    ACCESS_TOKEN_TTL = int(os.getenv("ACCESS_TOKEN_TTL", "7200"))
+
+    # "minimal" (user_id, iat, jti, exp) or "full" (+ username, is_admin, tv)
+    TOKEN_CLAIMS_PROFILE = os.getenv("TOKEN_CLAIMS_PROFILE", "full")
+    # Answer /api/verify from full-profile claims, only checking token_version
+    # against a per-worker cache. Callers can still send {"strict": true}.
+    VERIFY_STATELESS = os.getenv("VERIFY_STATELESS", "false").lower() == "true"
+
+    # /api/token/refresh: sliding lifetime of a refresh token family
+    REFRESH_TOKEN_TTL_DAYS = int(os.getenv("REFRESH_TOKEN_TTL_DAYS", "30"))
+
+    # /api/verify/batch: max tokens accepted per request
+    VERIFY_BATCH_MAX = int(os.getenv("VERIFY_BATCH_MAX", "100"))
+    # /api/users/import: rows processed per request. Every row is hashed
+    # within the request, so keep this small; use `flask import-users` for
+    # large files (no limit)
+    BULK_IMPORT_MAX_ROWS = int(os.getenv("BULK_IMPORT_MAX_ROWS", "500"))
+    # /metrics needs "Authorization: Bearer <METRICS_TOKEN>"; unset = not served
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN") or None
+    # Copy auth.audit events into the audit_event table (app/audit.py)
+    AUDIT_STORE = os.getenv("AUDIT_STORE", "true").lower() == "true"
 
     URL_PREFIX = _norm(os.getenv("URL_PREFIX", ""))  # e.g. "/auth-service" or ""
     API_PREFIX = _norm(os.getenv("API_PREFIX", f"{URL_PREFIX}/api"))
@@ -32,4 +70,16 @@ class Config:
         "pool_recycle": 1800,
         "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
         "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
-    }
\ No newline at end of file
+    }
+
+    # Optional read replicas for the read-only paths (comma-separated URLs),
+    # each with its own pool; see app/replicas.py for what gets routed there.
+    # Sync (Flask) server only: with SERVER_MODE=async the natively served
+    # /verify, /userinfo and API key lookups read from the primary.
+    DATABASE_REPLICA_URLS = [u.strip() for u in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if u.strip()]
+    REPLICA_ENGINE_OPTIONS = {
+        "pool_pre_ping": True,
+        "pool_recycle": 1800,
+        "pool_size": int(os.getenv("DB_REPLICA_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("DB_REPLICA_MAX_OVERFLOW", "10")),
+    }
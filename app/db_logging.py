@@ -1,13 +1,235 @@
 # app/db_logging.py
-import logging, os, time
-from sqlalchemy import event
+import logging, os, re, threading, time, weakref
+from collections import Counter
+from contextvars import ContextVar
+from functools import lru_cache
+from sqlalchemy import create_engine, event, exc, text
 from sqlalchemy.engine import Engine
+from sqlalchemy.pool import NullPool
+
+from . import metrics
 
 SLOW_MS = float(os.getenv("SQL_SLOW_MS", "300"))
+# Warn when one fingerprint runs this many times in a request (0 = off)
+N_PLUS_ONE = int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD", "0"))
+TOPK_TRACK = int(os.getenv("SQL_TOPK_TRACK", "500"))
+TOPK_DECAY_SEC = float(os.getenv("SQL_TOPK_DECAY_SEC", "300"))
+POOL_WAIT_WARN_MS = float(os.getenv("DB_POOL_WAIT_WARN_MS", "100"))
+POOL_WARN_INTERVAL = float(os.getenv("DB_POOL_WARN_INTERVAL", "10"))
+READY_PING_TTL = float(os.getenv("READY_PING_TTL", "2"))
+READY_PING_TIMEOUT = int(os.getenv("READY_PING_TIMEOUT", "2"))
 slow = logging.getLogger("sql.slow")
 pool = logging.getLogger("sqlalchemy.pool")
+nplus1 = logging.getLogger("sql.n_plus_one")
+
+_profile: ContextVar["SqlProfile | None"] = ContextVar("sql_profile", default=None)
+
+_WS = re.compile(r"\s+")
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN\s*\((?:\s*(?:\?|%s|%\(\w+\)s|:\w+)\s*,?)+\)", re.I)
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(statement: str) -> str:
+    """Normalize a statement so calls differing only in literals, IN-list
+    length or whitespace share one key."""
+    fp = _WS.sub(" ", statement).strip()
+    fp = _LITERALS.sub("?", fp)
+    return _IN_LIST.sub("IN (...)", fp)
+
+
+class SqlProfile:
+    """Statements executed during one request."""
+    __slots__ = ("count", "total_ms", "fingerprints", "warned")
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.fingerprints = Counter()
+        self.warned = set()
+
+    def as_log(self, top: int = 5) -> dict:
+        return {"count": self.count, "total_ms": round(self.total_ms, 2),
+                "top": dict(self.fingerprints.most_common(top))}
+
+
+def start_request_profile():
+    _profile.set(SqlProfile())
+
+
+def finish_request_profile() -> SqlProfile | None:
+    prof = _profile.get()
+    _profile.set(None)
+    return prof
+
+
+class TopQueries:
+    """Rolling per-worker table of the most expensive fingerprints.
+
+    Bounded to `track` entries (the cheapest is evicted first) and halved
+    every `decay_sec` so old hot spots fade out.
+    """
+
+    def __init__(self, track=500, decay_sec=300.0):
+        self.track = track
+        self.decay_sec = decay_sec
+        self._rows = {}  # fingerprint -> [count, total_ms, max_ms]
+        self._lock = threading.Lock()
+        self._next_decay = time.monotonic() + decay_sec
+
+    def add(self, fp: str, ms: float):
+        with self._lock:
+            now = time.monotonic()
+            if now >= self._next_decay:
+                self._decay()
+                self._next_decay = now + self.decay_sec
+            row = self._rows.get(fp)
+            if row is None:
+                if len(self._rows) >= self.track:
+                    del self._rows[min(self._rows, key=lambda k: self._rows[k][1])]
+                row = self._rows[fp] = [0, 0.0, 0.0]
+            row[0] += 1
+            row[1] += ms
+            row[2] = max(row[2], ms)
+
+    def _decay(self):
+        for fp in list(self._rows):
+            row = self._rows[fp]
+            row[0] //= 2
+            row[1] /= 2
+            if row[0] == 0:
+                del self._rows[fp]
+
+    def top(self, k: int = 20) -> list[dict]:
+        with self._lock:
+            rows = sorted(self._rows.items(), key=lambda kv: kv[1][1], reverse=True)[:k]
+        return [{"fingerprint": fp, "count": c, "total_ms": round(t, 2),
+                 "avg_ms": round(t / c, 3) if c else 0.0, "max_ms": round(m, 2)}
+                for fp, (c, t, m) in rows]
+
+    def clear(self):
+        with self._lock:
+            self._rows.clear()
+
+
+top_queries = TopQueries(TOPK_TRACK, TOPK_DECAY_SEC)
+
+
+def _saturated(p) -> bool:
+    # max_overflow -1 means unbounded
+    max_overflow = getattr(p, "_max_overflow", -1)
+    return (hasattr(p, "checkedout") and max_overflow >= 0
+            and p.checkedout() >= p.size() + max_overflow)
 
-def install(engine: Engine):
+
+def pool_state(p) -> dict:
+    """Snapshot of a QueuePool; other pool classes only report their type."""
+    state = {"class": type(p).__name__}
+    if not hasattr(p, "checkedout"):
+        return state
+    size, max_overflow = p.size(), getattr(p, "_max_overflow", 0)
+    state.update(size=size, max_overflow=max_overflow, checked_out=p.checkedout(),
+                 checked_in=p.checkedin(), overflow=max(0, p.overflow()),
+                 timeout=getattr(p, "_timeout", None), saturated=_saturated(p))
+    return state
+
+
+class _Throttled:
+    """Lets a warning through at most once per `interval` seconds."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._next = 0.0
+
+    def ready(self) -> bool:
+        now = time.monotonic()
+        if now < self._next:
+            return False
+        self._next = now + self.interval
+        return True
+
+
+def _time_checkouts(p, warn):
+    """Wrap pool.connect on this pool instance to measure checkout wait.
+
+    There is no pool event before a checkout blocks, so the wait is timed
+    around the call itself; pool timeouts are counted here too.
+    """
+    connect = p.connect
+
+    def timed_connect():
+        t0 = time.perf_counter()
+        try:
+            return connect()
+        except exc.TimeoutError:
+            metrics.DB_POOL_TIMEOUTS.inc()
+            pool.error("pool_checkout_timeout", extra={"pool": pool_state(p)})
+            raise
+        finally:
+            wait_ms = (time.perf_counter() - t0) * 1000.0
+            metrics.DB_POOL_WAIT.observe(wait_ms / 1000.0)
+            if wait_ms >= POOL_WAIT_WARN_MS and warn.ready():
+                pool.warning("pool_checkout_slow", extra={"duration_ms": round(wait_ms, 2),
+                                                          "pool": pool_state(p)})
+
+    p.connect = timed_connect
+
+
+class ReadinessProbe:
+    """Pool state plus a `SELECT 1` whose result is cached for `ttl` seconds.
+
+    The ping opens its own connection (no pool, READY_PING_TIMEOUT seconds
+    to connect and read), so it never queues behind the requests it is
+    meant to protect. While one thread pings, others get the last result.
+    A saturated pool reports not-ready without pinging.
+    """
+
+    def __init__(self, engine, ttl=READY_PING_TTL, timeout=READY_PING_TIMEOUT):
+        self.engine = engine
+        self.ttl = ttl
+        self.timeout = timeout
+        self._ping_engine = None
+        self._result = (None, "not_checked_yet", None)  # (ok, error, ping_ms)
+        self._expires = 0.0
+        self._lock = threading.Lock()
+
+    def _engine(self):
+        if self._ping_engine is None:
+            args = {}
+            if self.engine.dialect.name == "mysql":
+                args = {"connect_timeout": self.timeout, "read_timeout": self.timeout}
+            elif self.engine.dialect.name == "sqlite":
+                args = {"timeout": self.timeout}
+            self._ping_engine = create_engine(self.engine.url, poolclass=NullPool, connect_args=args)
+        return self._ping_engine
+
+    def ping(self):
+        if time.monotonic() < self._expires or not self._lock.acquire(blocking=False):
+            return self._result
+        try:
+            t0 = time.perf_counter()
+            try:
+                with self._engine().connect() as conn:
+                    conn.execute(text("SELECT 1"))
+                ok, error = True, None
+            except Exception as e:  # any driver error means not ready
+                ok, error = False, f"{type(e).__name__}: {e}"[:200]
+            self._result = (ok, error, round((time.perf_counter() - t0) * 1000, 2))
+            self._expires = time.monotonic() + self.ttl
+        finally:
+            self._lock.release()
+        return self._result
+
+    def check(self) -> tuple[bool, dict]:
+        state = pool_state(self.engine.pool)
+        if state.get("saturated"):
+            return False, {"pool": state, "db": {"ok": None, "skipped": "pool_saturated"}}
+        ok, error, ping_ms = self.ping()
+        return bool(ok), {"pool": state, "db": {"ok": ok, "error": error, "ping_ms": ping_ms}}
+
+def install(engine: Engine, pool_metrics: bool = True):
+    """Statement timing/profiling, plus pool gauges and warnings when
+    `pool_metrics` (the gauges are unlabelled, so only for the primary)."""
     @event.listens_for(engine, "before_cursor_execute")
     def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
         conn.info.setdefault("query_start_time", []).append(time.perf_counter())
@@ -16,7 +238,18 @@ def install(engine: Engine):
     def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
         start = conn.info["query_start_time"].pop(-1)
         dur_ms = (time.perf_counter() - start) * 1000.0
+        fp = fingerprint(statement)
+        top_queries.add(fp, dur_ms)
+        prof = _profile.get()
+        if prof is not None:
+            prof.count += 1
+            prof.total_ms += dur_ms
+            prof.fingerprints[fp] += 1
+            if N_PLUS_ONE and prof.fingerprints[fp] == N_PLUS_ONE and fp not in prof.warned:
+                prof.warned.add(fp)
+                nplus1.warning("n_plus_one_suspected", extra={"statement": fp, "count": N_PLUS_ONE})
         if dur_ms >= SLOW_MS:
+            metrics.SLOW_QUERIES.inc()
             slow.warning(
                 "slow_query",
                 extra={"duration_ms": round(dur_ms, 2),
@@ -24,10 +257,40 @@ def install(engine: Engine):
                        "parameters": str(parameters)[:500]},
             )
 
+    # Connections pooled before a fork (bootstrap in a preloading gunicorn
+    # master) belong to the parent; the child starts with an empty pool
+    ref = weakref.ref(engine)
+    os.register_at_fork(after_in_child=lambda: ref() is not None and ref().dispose(close=False))
+
     @event.listens_for(engine, "invalidate")
     def invalidate(dbapi_conn, conn_record, exception):
         pool.warning("connection_invalidated", exc_info=exception)
 
+    if pool_metrics:
+        saturation = _Throttled(POOL_WARN_INTERVAL)
+        slow_checkout = _Throttled(POOL_WARN_INTERVAL)
+        _time_checkouts(engine.pool, slow_checkout)
+
+        @event.listens_for(engine, "engine_disposed")
+        def engine_disposed(eng):
+            # dispose() swaps in a fresh pool; the listeners carry over, the wrapper doesn't
+            _time_checkouts(engine.pool, slow_checkout)
+
+        @event.listens_for(engine, "checkout")
+        def checkout(dbapi_conn, conn_record, conn_proxy):
+            conn_record.info["checkout_at"] = time.perf_counter()
+            metrics.update_pool(engine.pool)
+            if _saturated(engine.pool) and saturation.ready():
+                pool.warning("pool_saturated", extra={"pool": pool_state(engine.pool)})
+
+        @event.listens_for(engine, "checkin")
+        def checkin(dbapi_conn, conn_record):
+            started = conn_record.info.pop("checkout_at", None)
+            if started is not None:
+                metrics.DB_CONN_HELD.observe(time.perf_counter() - started)
+            metrics.update_pool(engine.pool)
+
     @event.listens_for(engine, "engine_connect")
-    def engine_connect(conn, branch):
+    def engine_connect(conn):
         pool.info("engine_connect")
+
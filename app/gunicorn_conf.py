@@ -0,0 +1,166 @@
+# app/gunicorn_conf.py
+"""gunicorn settings, sized from the CPUs this container may actually use.
+
+    gunicorn -c python:app.gunicorn_conf "app:create_app()"
+    SERVER_MODE=async gunicorn -c python:app.gunicorn_conf "app.asgi:create_asgi_app()"
+
+Sync mode runs gthread workers: the verify path spends most of its time
+waiting on the DB, so threads add concurrency without extra processes.
+Async mode runs uvicorn workers for app/asgi.py.
+
+The app is preloaded in the master and workers are forked from it. The
+master's heap is frozen out of the cyclic GC just before forking
+(`gc.freeze()`), so collections in the workers don't write to those pages
+and they stay shared. Engines, the log listener, the hash pool and metrics
+each reset themselves in the child.
+
+Pool sizes are derived here so that every connection a worker can open to
+the primary, times the number of workers, stays under DB_CONNECTION_BUDGET
+(keep it below MySQL's max_connections, less whatever other clients need).
+Per worker that is the request pool (which the audit writer thread also
+borrows from), the async pool in async mode, and the readiness ping's own
+connection. Each read replica is a separate server and gets
+DB_REPLICA_CONNECTION_BUDGET (default: the same budget) for its pools.
+DB_POOL_SIZE, DB_MAX_OVERFLOW, ASYNC_DB_*, DB_REPLICA_* and HASH_POOL_SIZE
+set in the environment win, but the totals are still checked against the
+budgets at startup.
+
+Env: WEB_CONCURRENCY (workers), GUNICORN_THREADS, GUNICORN_MAX_REQUESTS,
+GUNICORN_MAX_REQUESTS_JITTER, GUNICORN_TIMEOUT, GUNICORN_BIND,
+DB_CONNECTION_BUDGET, DB_REPLICA_CONNECTION_BUDGET.
+"""
+import gc, os
+
+# Loading this file imports the app package first, so Config and the hash
+# pool have already read the environment; the sizes below are applied to
+# them directly
+from app.config import Config
+from app.hashing import hasher
+
+
+def available_cpus() -> int:
+    """CPUs usable by this process: affinity mask, capped by a cgroup v2 quota."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # not Linux
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as fh:
+            quota, period = fh.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+def pool_sizes(budget: int, workers: int, per_worker_peak: int) -> tuple[int, int]:
+    """(pool_size, max_overflow) per worker within the connection budget.
+
+    `per_worker_peak` is the most connections one worker can use at once.
+    Half of it is kept open and the rest is overflow, opened only under load.
+    """
+    share = max(1, budget // max(1, workers))
+    peak = max(1, min(per_worker_peak, share))
+    size = max(1, (peak + 1) // 2)
+    return size, peak - size
+
+
+def _env_int(name, default):
+    return int(os.getenv(name) or default)
+
+
+cpus = available_cpus()
+server_mode = os.getenv("SERVER_MODE", "sync")
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+workers = _env_int("WEB_CONCURRENCY", max(2, cpus))
+if server_mode == "async":
+    worker_class = "uvicorn.workers.UvicornWorker"
+    threads = 1
+else:
+    worker_class = "gthread"
+    threads = _env_int("GUNICORN_THREADS", 4)
+
+preload_app = True
+# Recycle workers now and then (slow leaks, fragmentation); jitter keeps them
+# from all restarting at once
+max_requests = _env_int("GUNICORN_MAX_REQUESTS", 10000)
+max_requests_jitter = _env_int("GUNICORN_MAX_REQUESTS_JITTER", max_requests // 10)
+timeout = _env_int("GUNICORN_TIMEOUT", 30)
+graceful_timeout = timeout
+keepalive = 5
+# Heartbeat files on tmpfs; a disk-backed /tmp can stall workers in Docker
+worker_tmp_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+
+connection_budget = _env_int("DB_CONNECTION_BUDGET", 100)
+replica_budget = _env_int("DB_REPLICA_CONNECTION_BUDGET", connection_budget)
+# Opened outside any pool, per worker: the /health/ready ping (NullPool)
+UNPOOLED = 1
+# Checked out of the request pool by the audit writer thread
+AUDIT_WRITER = 1
+pooled_budget = connection_budget - workers * UNPOOLED
+if server_mode == "async":
+    # Hot endpoints use the async pool; the Flask fallback needs a few
+    # connections of its own
+    sync_size, sync_overflow = pool_sizes(pooled_budget // 4, workers, 4 + AUDIT_WRITER)
+    async_size, async_overflow = pool_sizes(pooled_budget - workers * (sync_size + sync_overflow),
+                                            workers, 40)
+    # create_asgi_app() reads these when the app is loaded, after this file
+    os.environ.setdefault("ASYNC_DB_POOL_SIZE", str(async_size))
+    os.environ.setdefault("ASYNC_DB_MAX_OVERFLOW", str(async_overflow))
+    replica_peak = 4
+else:
+    # A request can hold its session connection while sync_denylist() uses
+    # a second one, so two per thread at most
+    sync_size, sync_overflow = pool_sizes(pooled_budget, workers, 2 * threads + AUDIT_WRITER)
+    # Routed reads take one session connection per thread
+    replica_peak = threads
+
+
+def _size_pool(options, size, overflow, env_prefix):
+    # Fill in whatever the operator didn't set
+    if not os.getenv(f"{env_prefix}_POOL_SIZE"):
+        options["pool_size"] = size
+    if not os.getenv(f"{env_prefix}_MAX_OVERFLOW"):
+        options["max_overflow"] = overflow
+    return options.get("pool_size", 0) + options.get("max_overflow", 0)
+
+
+per_worker = UNPOOLED + _size_pool(Config.SQLALCHEMY_ENGINE_OPTIONS, sync_size, sync_overflow, "DB")
+if server_mode == "async":
+    per_worker += int(os.environ["ASYNC_DB_POOL_SIZE"]) + int(os.environ["ASYNC_DB_MAX_OVERFLOW"])
+per_replica = 0
+if Config.DATABASE_REPLICA_URLS:
+    per_replica = _size_pool(Config.REPLICA_ENGINE_OPTIONS,
+                             *pool_sizes(replica_budget, workers, replica_peak), "DB_REPLICA")
+# One hash process per CPU across all workers, not per worker
+if not os.getenv("HASH_POOL_SIZE"):
+    hasher.resize(max(1, cpus // workers))
+
+
+def when_ready(server):
+    total = workers * per_worker
+    server.log.info("workers=%d threads=%d worker_class=%s cpus=%d db_connections<=%d budget=%d",
+                    workers, threads, worker_class, cpus, total, connection_budget)
+    if total > connection_budget:
+        server.log.warning("DB pool settings allow %d connections, over DB_CONNECTION_BUDGET=%d",
+                           total, connection_budget)
+    if per_replica:
+        replica_total = workers * per_replica
+        server.log.info("replica_connections<=%d each, budget=%d", replica_total, replica_budget)
+        if replica_total > replica_budget:
+            server.log.warning("Replica pool settings allow %d connections per replica, over "
+                               "DB_REPLICA_CONNECTION_BUDGET=%d", replica_total, replica_budget)
+    # The preloaded app is in memory now: keep the cyclic GC off these pages
+    gc.collect()
+    gc.freeze()
+
+
+def child_exit(server, worker):
+    from app import metrics
+    metrics.mark_process_dead(worker.pid)
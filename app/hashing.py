@@ -0,0 +1,253 @@
+# app/hashing.py
+import logging, multiprocessing, os, threading, time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from . import metrics
+
+log = logging.getLogger("hashing")
+
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class HashPoolBusy(Exception):
+    """Raised instead of queueing when the hashing executor is full."""
+
+    def __init__(self, retry_after: int = 1, message: str = "password hashing pool is saturated"):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class HashPoolUnavailable(HashPoolBusy):
+    """A hash timed out or the pool lost a worker; answered like HashPoolBusy (503)."""
+
+
+class HashExecutor:
+    """Size-bounded process pool for password hashing with admission control.
+
+    At most `workers + queue_max` hashes are in flight; anything beyond that
+    is rejected immediately with HashPoolBusy so request workers never park
+    behind a login storm. `workers=0` runs inline (same limits, no pool).
+    The pool is created lazily per process, so it is safe with preload_app.
+    """
+
+    def __init__(self, workers: int, queue_max: int, timeout: float = 10.0,
+                 start_method: str = "forkserver", retry_after: int = 1):
+        self.workers = workers
+        self.queue_max = queue_max
+        self.timeout = timeout
+        self.start_method = start_method
+        self.retry_after = retry_after
+        self._slots = threading.BoundedSemaphore(max(1, workers) + queue_max)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        # metrics
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.latency_sum_ms = 0.0
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def resize(self, workers: int):
+        """Change the pool size; only before first use (gunicorn config)."""
+        with self._lock:
+            if self._executor is not None:
+                raise RuntimeError("hash pool already started")
+            self.workers = workers
+            self._slots = threading.BoundedSemaphore(max(1, workers) + self.queue_max)
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                ctx = multiprocessing.get_context(self.start_method)
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx)
+                self._pid = os.getpid()
+            return self._executor
+
+    def _discard(self, pool: ProcessPoolExecutor):
+        """Drop a broken pool so the next hash starts a fresh one."""
+        with self._lock:
+            if self._executor is not pool:
+                return  # another thread got there first
+            self._executor = None
+        log.error("hash_pool_broken")
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _done(self, t0: float):
+        ms = (time.perf_counter() - t0) * 1000.0
+        metrics.HASH_IN_FLIGHT.dec()
+        metrics.HASH_LATENCY.observe(ms / 1000.0)
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+            self.latency_sum_ms += ms
+            for i, bound in enumerate(LATENCY_BUCKETS_MS):
+                if ms <= bound:
+                    self.latency_buckets[i] += 1
+                    break
+            else:
+                self.latency_buckets[-1] += 1
+        self._slots.release()
+
+    def run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            metrics.HASH_REJECTED.inc()
+            log.warning("hash_pool_busy", extra={"count": self.in_flight})
+            raise HashPoolBusy(self.retry_after)
+        with self._lock:
+            self.in_flight += 1
+        metrics.HASH_IN_FLIGHT.inc()
+        t0 = time.perf_counter()
+
+        if self.workers <= 0:
+            try:
+                return fn(*args)
+            finally:
+                self._done(t0)
+
+        try:
+            pool = self._pool()
+            fut = pool.submit(fn, *args)
+        except BrokenProcessPool:
+            self._done(t0)
+            self._discard(pool)
+            raise HashPoolUnavailable(self.retry_after, "password hashing pool is broken")
+        except Exception:
+            self._done(t0)
+            raise
+        # The slot is freed when the hash actually finishes, even if we gave
+        # up waiting, so the admission bound stays honest.
+        fut.add_done_callback(lambda _f: self._done(t0))
+        try:
+            return fut.result(timeout=self.timeout)
+        except FutureTimeout:
+            log.warning("hash_timeout", extra={"count": self.in_flight})
+            raise HashPoolUnavailable(self.retry_after, "password hashing timed out") from None
+        except BrokenProcessPool:
+            # A worker died (OOM kill, crash): every pending hash fails
+            self._discard(pool)
+            raise HashPoolUnavailable(self.retry_after, "password hashing pool is broken")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_max": self.queue_max,
+                "in_flight": self.in_flight,
+                "queue_depth": max(0, self.in_flight - max(1, self.workers)),
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "latency_ms_sum": round(self.latency_sum_ms, 2),
+                "latency_ms_buckets": dict(zip([*map(str, LATENCY_BUCKETS_MS), "+Inf"],
+                                               self.latency_buckets)),
+            }
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+hasher = HashExecutor(
+    workers=int(os.getenv("HASH_POOL_SIZE", str(max(1, (os.cpu_count() or 2) // 2)))),
+    queue_max=int(os.getenv("HASH_QUEUE_MAX", "16")),
+    timeout=float(os.getenv("HASH_TIMEOUT", "10")),
+    start_method=os.getenv("HASH_POOL_START_METHOD", "forkserver"),
+    retry_after=int(os.getenv("HASH_RETRY_AFTER", "1")),
+)
+
+
+# Werkzeug method string, e.g. "scrypt:32768:8:1" or "pbkdf2:sha256:600000".
+# Stored hashes made with other parameters are upgraded on the next login.
+HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+_policy_prefix = None
+
+
+def policy_prefix() -> str:
+    """HASH_METHOD as werkzeug writes it into stored hashes (defaults filled in)."""
+    global _policy_prefix
+    if _policy_prefix is None:
+        _policy_prefix = generate_password_hash("x", HASH_METHOD, salt_length=1).split("$", 1)[0]
+    return _policy_prefix
+
+
+def needs_rehash(pwhash: str) -> bool:
+    return pwhash.split("$", 1)[0] != policy_prefix()
+
+
+def hash_password(password: str) -> str:
+    return hasher.run(generate_password_hash, password, HASH_METHOD)
+
+
+def verify_password(pwhash: str, password: str) -> bool:
+    return hasher.run(check_password_hash, pwhash, password)
+
+
+def upgrade_hash(user, password: str) -> bool:
+    """After a successful login, rehash `user.password` if it predates the
+    current policy. Returns True if the caller should commit."""
+    if not needs_rehash(user.password):
+        return False
+    try:
+        user.password = hash_password(password)
+    except HashPoolBusy:
+        return False  # not worth a 503; the next login will retry
+    log.info("password_rehashed", extra={"user_id": user.id})
+    return True
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def _time_hash(method: str, samples: int) -> float:
+    """p99 wall time in ms of `samples` hashes with `method` on this host."""
+    times = []
+    for _ in range(samples):
+        t0 = time.perf_counter()
+        generate_password_hash("calibration-password", method)
+        times.append((time.perf_counter() - t0) * 1000.0)
+    return _percentile(times, 99)
+
+
+def calibrate(algorithm: str = "scrypt", target_ms: float = 250.0, samples: int = 20) -> dict:
+    """Find the most expensive parameters whose p99 hash time fits target_ms.
+
+    pbkdf2: scale iterations linearly from a probe, then step down until the
+    measured p99 fits. scrypt: largest power-of-two N (r=8, p=1) that fits.
+    """
+    tried = []
+    if algorithm == "pbkdf2":
+        probe = 100_000
+        per_iter = _time_hash(f"pbkdf2:sha256:{probe}", 3) / probe
+        iterations = max(10_000, int(target_ms / per_iter) // 10_000 * 10_000)
+        while True:
+            method = f"pbkdf2:sha256:{iterations}"
+            p99 = _time_hash(method, samples)
+            tried.append({"method": method, "p99_ms": round(p99, 2)})
+            if p99 <= target_ms or iterations <= 10_000:
+                break
+            iterations = max(10_000, int(iterations * 0.9) // 10_000 * 10_000)
+    elif algorithm == "scrypt":
+        method, n = None, 2 ** 14
+        while n <= 2 ** 20:
+            candidate = f"scrypt:{n}:8:1"
+            p99 = _time_hash(candidate, samples)
+            tried.append({"method": candidate, "p99_ms": round(p99, 2),
+                          "memory_mb": 128 * n * 8 // 2 ** 20})
+            if p99 > target_ms:
+                break
+            method, n = candidate, n * 2
+        method = method or tried[0]["method"]
+    else:
+        raise ValueError(f"unsupported algorithm {algorithm}")
+    fits = [t for t in tried if t["method"] == method]
+    return {"recommended": method, "p99_ms": fits[0]["p99_ms"],
+            "target_ms": target_ms, "cpu_count": os.cpu_count(), "tried": tried}
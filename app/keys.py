@@ -0,0 +1,132 @@
+# app/keys.py
+import hashlib, json, logging, os
+from datetime import datetime, timezone
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+from jwt.algorithms import OKPAlgorithm, RSAAlgorithm
+
+log = logging.getLogger("keys")
+
+
+def _alg_for(key) -> str:
+    if isinstance(key, (ed25519.Ed25519PrivateKey, ed25519.Ed25519PublicKey)):
+        return "EdDSA"
+    if isinstance(key, (rsa.RSAPrivateKey, rsa.RSAPublicKey)):
+        return "RS256"
+    raise ValueError(f"unsupported signing key type {type(key).__name__}")
+
+
+def _public_jwk(kid: str, alg: str, public_key) -> dict:
+    to_jwk = OKPAlgorithm.to_jwk if alg == "EdDSA" else RSAAlgorithm.to_jwk
+    jwk = json.loads(to_jwk(public_key))
+    jwk.update({"kid": kid, "alg": alg, "use": "sig"})
+    return jwk
+
+
+class KeyRing:
+    """JWT signing/verification keys, parsed once at startup.
+
+    Without a keys directory tokens are HS256 with SECRET_KEY (the original
+    behaviour). With JWT_KEYS_DIR set, every `<kid>.pem` private key and
+    `<kid>.pub.pem` public key (retired, verify-only) in it is loaded; tokens
+    are signed by JWT_ACTIVE_KID (default: last kid in sort order) and carry
+    a `kid` header, and public keys are published as a JWKS.
+    """
+
+    def __init__(self):
+        self.secret = None
+        self.active_kid = None
+        self.accept_hs256 = True
+        self._private = {}   # kid -> (alg, private key)
+        self._public = {}    # kid -> (alg, public key)
+        self.jwks_body = b'{"keys": []}'
+        self.jwks_etag = None
+
+    def init_app(self, app):
+        self.configure(secret=app.config["SECRET_KEY"],
+                       keys_dir=app.config.get("JWT_KEYS_DIR"),
+                       active_kid=app.config.get("JWT_ACTIVE_KID"),
+                       accept_hs256=app.config.get("JWT_ACCEPT_HS256", True))
+
+    def configure(self, secret, keys_dir=None, active_kid=None, accept_hs256=True):
+        self.secret = secret
+        self._private, self._public = {}, {}
+        if keys_dir:
+            for name in sorted(os.listdir(keys_dir)):
+                path = os.path.join(keys_dir, name)
+                with open(path, "rb") as fh:
+                    data = fh.read()
+                if name.endswith(".pub.pem"):
+                    pub = serialization.load_pem_public_key(data)
+                    self._public[name[:-8]] = (_alg_for(pub), pub)
+                elif name.endswith(".pem"):
+                    priv = serialization.load_pem_private_key(data, password=None)
+                    alg = _alg_for(priv)
+                    self._private[name[:-4]] = (alg, priv)
+                    self._public[name[:-4]] = (alg, priv.public_key())
+            if not self._private:
+                raise RuntimeError(f"JWT_KEYS_DIR {keys_dir} has no private keys")
+            active_kid = active_kid or sorted(self._private)[-1]
+            if active_kid not in self._private:
+                raise RuntimeError(f"JWT_ACTIVE_KID {active_kid} has no private key")
+        self.active_kid = active_kid if keys_dir else None
+        # Once asymmetric signing is on, HS256 acceptance is only for the
+        # rollover window and can be switched off.
+        self.accept_hs256 = accept_hs256 or not keys_dir
+
+        keys = [_public_jwk(kid, alg, pub) for kid, (alg, pub) in sorted(self._public.items())]
+        self.jwks_body = json.dumps({"keys": keys}, separators=(",", ":")).encode()
+        self.jwks_etag = hashlib.sha256(self.jwks_body).hexdigest()[:16]
+        if keys_dir:
+            log.info("signing_keys_loaded", extra={"kid": self.active_kid, "count": len(keys)})
+
+    def sign(self, payload: dict) -> str:
+        if self.active_kid is None:
+            token = jwt.encode(payload, self.secret, algorithm="HS256")
+        else:
+            alg, key = self._private[self.active_kid]
+            token = jwt.encode(payload, key, algorithm=alg, headers={"kid": self.active_kid})
+        if isinstance(token, bytes):  # PyJWT < 2
+            token = token.decode("utf-8")
+        return token
+
+    def decode(self, token: str) -> dict:
+        """Verify and decode; raises jwt.InvalidTokenError on any failure."""
+        kid = jwt.get_unverified_header(token).get("kid")
+        if kid is None:
+            if not self.accept_hs256:
+                raise jwt.InvalidTokenError("HS256 tokens are no longer accepted")
+            return jwt.decode(token, self.secret, algorithms=["HS256"])
+        if kid not in self._public:
+            raise jwt.InvalidTokenError(f"unknown kid {kid}")
+        alg, key = self._public[kid]
+        return jwt.decode(token, key, algorithms=[alg])
+
+
+keyring = KeyRing()
+
+
+def generate_private_key(alg: str = "EdDSA"):
+    if alg == "EdDSA":
+        return ed25519.Ed25519PrivateKey.generate()
+    if alg == "RS256":
+        return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    raise ValueError(f"unsupported algorithm {alg}")
+
+
+def new_kid() -> str:
+    # Sorts chronologically, so the newest key is the default active one.
+    return datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S") + "-" + os.urandom(2).hex()
+
+
+def write_private_key(keys_dir: str, kid: str, key) -> str:
+    path = os.path.join(keys_dir, f"{kid}.pem")
+    pem = key.private_bytes(serialization.Encoding.PEM,
+                            serialization.PrivateFormat.PKCS8,
+                            serialization.NoEncryption())
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "wb") as fh:
+        fh.write(pem)
+    return path
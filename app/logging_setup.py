@@ -1,11 +1,15 @@
 # app/logging_setup.py
-import json, logging, os, sys, time, uuid
+import atexit, gzip, json, logging, os, queue, random, shutil, sys, time, uuid
 from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
 from datetime import datetime, timezone
 
+from . import db_logging, metrics
+
 _request_id: ContextVar[str | None] = ContextVar("request_id", default=None)
 
-SENSITIVE_KEYS = {"password", "token", "access_token", "refresh_token", "x-api-key", "authorization"}
+SENSITIVE_KEYS = {"password", "token", "tokens", "access_token", "refresh_token", "x-api-key",
+                  "authorization", "confirm_password"}
 
 def _mask(val):
     if val is None: return None
@@ -25,17 +29,21 @@ def _scrub_dict(d):
 _request_id: ContextVar[str | None] = ContextVar("request_id", default=None)
 KNOWN_EXTRA = {
     "method","path","endpoint","status","ok","latency_ms","remote_addr","user_agent",
-    "headers","json","service","duration_ms","statement","parameters"
+    "headers","json","service","duration_ms","statement","parameters",
+    "key_prefix","count","columns","indexes","kid","user_id",
+    "username","reason","user_exists","scope","retry_after","sample_rate","sql","pool","pid",
+    "actor_id","key_id","is_admin"
 }
 
 class JsonFormatter(logging.Formatter):
     def format(self, record: logging.LogRecord) -> str:
         payload = {
-            "ts": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            # record time, not format time: formatting runs on the listener thread
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
             "level": record.levelname,
             "logger": record.name,
             "msg": record.getMessage(),
-            "request_id": _request_id.get(),
+            "request_id": getattr(record, "request_id", None) or _request_id.get(),
         }
 
         # Only copy **known** extras; coerce non-serializable values to str
@@ -51,80 +59,312 @@ class JsonFormatter(logging.Formatter):
 
         if record.exc_info:
             payload["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:  # pre-rendered by DroppingQueueHandler
+            payload["exc_info"] = record.exc_text
 
         # Final dump must never fail
         return json.dumps(payload, ensure_ascii=False, default=str)
 
+try:  # optional faster JSON backend
+    import orjson
+except ImportError:  # pragma: no cover - stdlib fallback
+    orjson = None
+
+_JSON_SCALARS = (str, int, float, bool, type(None))
+
+
+def _json_safe(val):
+    """Type-based coercion replacing the trial json.dumps probe."""
+    if isinstance(val, _JSON_SCALARS):
+        return val
+    if isinstance(val, dict):
+        return {str(k): _json_safe(v) for k, v in val.items()}
+    if isinstance(val, (list, tuple)):
+        return [_json_safe(v) for v in val]
+    return str(val)
+
+
+class FastJsonFormatter(JsonFormatter):
+    """Same fields as JsonFormatter, built for throughput (LOG_FORMAT=fast).
+
+    Serializes with orjson when it is installed (stdlib json otherwise),
+    checks extras by type instead of trial dumps, and reuses the formatted
+    timestamp for records within the same millisecond.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._ts_cache = (None, None)  # (epoch ms, iso string)
+
+    def _ts(self, created: float) -> str:
+        ms = int(created * 1000)
+        cached_ms, iso = self._ts_cache
+        if cached_ms != ms:
+            iso = datetime.fromtimestamp(ms / 1000, timezone.utc).isoformat(timespec="milliseconds")
+            self._ts_cache = (ms, iso)
+        return iso
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": self._ts(record.created),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "request_id": getattr(record, "request_id", None) or _request_id.get(),
+        }
+        rdict = record.__dict__
+        for key in KNOWN_EXTRA.intersection(rdict):
+            payload[key] = _json_safe(rdict[key])
+
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload["exc_info"] = record.exc_text
+
+        if orjson is not None:
+            try:
+                return orjson.dumps(payload).decode()
+            except TypeError:  # e.g. int beyond 64 bits
+                pass
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+def _formatter():
+    return FastJsonFormatter() if os.getenv("LOG_FORMAT", "json") == "fast" else JsonFormatter()
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that never blocks: when the bounded queue is full the
+    record is dropped and counted, and the next record that fits is preceded
+    by a `log_records_dropped` warning."""
+
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+        self._reported = 0
+
+    def prepare(self, record):
+        # Cheap request-thread work only: capture the request id and merge
+        # args. JSON formatting happens on the listener thread.
+        record = logging.makeLogRecord(record.__dict__)
+        record.request_id = _request_id.get()
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            if self.dropped != self._reported:
+                self.queue.put_nowait(logging.makeLogRecord({
+                    "name": "logging", "levelno": logging.WARNING, "levelname": "WARNING",
+                    "msg": "log_records_dropped", "count": self.dropped - self._reported}))
+                self._reported = self.dropped
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _gzip_rotator(source, dest):
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+
+def _file_sink(path):
+    """LOG_FILE handler: size-based (LOG_MAX_BYTES) or time-based
+    (LOG_ROTATE_WHEN, e.g. "midnight") rotation, optional gzip of rotated files."""
+    path = path.format(pid=os.getpid())  # "{pid}" gives each worker its own file
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    backups = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+    when = os.getenv("LOG_ROTATE_WHEN")
+    if when:
+        handler = TimedRotatingFileHandler(path, when=when, backupCount=backups,
+                                           utc=True, delay=True)
+    else:
+        handler = RotatingFileHandler(path, maxBytes=int(os.getenv("LOG_MAX_BYTES", str(50 * 2**20))),
+                                      backupCount=backups, delay=True)
+    if os.getenv("LOG_COMPRESS", "false").lower() == "true":
+        handler.namer = lambda name: name + ".gz"
+        handler.rotator = _gzip_rotator
+    return handler
+
+
+_pipeline = {"listener": None, "handler": None}
+
+
+def _start_pipeline():
+    """(Re)build sinks, queue and listener thread; also run after fork since
+    threads don't survive it."""
+    sinks = [logging.StreamHandler(sys.stdout)]
+    if os.getenv("LOG_FILE"):
+        sinks.append(_file_sink(os.environ["LOG_FILE"]))
+    for h in sinks:
+        h.setFormatter(_formatter())
+
+    q = queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000")))
+    handler = _pipeline["handler"]
+    if handler is None:
+        handler = DroppingQueueHandler(q)
+    else:
+        handler.queue = q
+    listener = QueueListener(q, *sinks, respect_handler_level=True)
+    listener.start()
+    _pipeline.update(listener=listener, handler=handler)
+    return handler
+
+
+def stop_logging():
+    """Flush queued records and stop the listener (atexit / worker exit)."""
+    listener = _pipeline["listener"]
+    if listener is not None and listener._thread is not None:
+        listener.stop()
+        for h in listener.handlers:
+            h.close()
+
+
+def _restart_after_fork():
+    if _pipeline["listener"] is not None:
+        _start_pipeline()
+
+
+os.register_at_fork(after_in_child=_restart_after_fork)
+atexit.register(stop_logging)
+
+
 def configure_logging():
     level = os.getenv("LOG_LEVEL", "INFO").upper()
     root = logging.getLogger()
     root.setLevel(level)
     for h in list(root.handlers):
         root.removeHandler(h)
-    handler = logging.StreamHandler(sys.stdout)
-    handler.setFormatter(JsonFormatter())
+    stop_logging()
+    if os.getenv("LOG_ASYNC", "true").lower() == "true":
+        handler = _start_pipeline()
+    else:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(_formatter())
     root.addHandler(handler)
 
     logging.getLogger("werkzeug").setLevel(os.getenv("WERKZEUG_LOG_LEVEL", "WARNING").upper())
     logging.getLogger("sqlalchemy.engine").setLevel(os.getenv("SQL_LOG_LEVEL", "WARNING").upper())
     logging.getLogger("sqlalchemy.pool").setLevel(os.getenv("SQL_POOL_LOG_LEVEL", "INFO").upper())
 
+def _parse_rates(spec: str) -> dict[str, float]:
+    """"auth.verify=0.01,auth.userinfo=0.1" -> {endpoint: rate}."""
+    rates = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        endpoint, rate = part.split("=", 1)
+        rates[endpoint.strip()] = float(rate)
+    return rates
+
+
+ACCESS_FIELDS = ("method", "path", "endpoint", "status", "ok", "latency_ms",
+                 "remote_addr", "user_agent", "headers", "json", "sql")
+
+
+class AccessLogPolicy:
+    """Which requests get an access log line, and with which fields.
+
+    Errors (status >= 400) and slow requests (>= ACCESS_LOG_SLOW_MS) are
+    always logged; everything else is sampled at the endpoint's rate from
+    ACCESS_LOG_SAMPLE_ENDPOINTS, else ACCESS_LOG_SAMPLE. ACCESS_LOG_FIELDS is
+    an allowlist of ACCESS_FIELDS.
+    """
+
+    def __init__(self, default_rate=1.0, endpoint_rates=None, slow_ms=500.0, fields=ACCESS_FIELDS):
+        self.default_rate = default_rate
+        self.endpoint_rates = endpoint_rates or {}
+        self.slow_ms = slow_ms
+        self.fields = tuple(f for f in ACCESS_FIELDS if f in set(fields))
+
+    @classmethod
+    def from_env(cls):
+        fields = os.getenv("ACCESS_LOG_FIELDS")
+        return cls(default_rate=float(os.getenv("ACCESS_LOG_SAMPLE", "1.0")),
+                   endpoint_rates=_parse_rates(os.getenv("ACCESS_LOG_SAMPLE_ENDPOINTS", "")),
+                   slow_ms=float(os.getenv("ACCESS_LOG_SLOW_MS", "500")),
+                   fields=fields.split(",") if fields else ACCESS_FIELDS)
+
+    def rate_for(self, endpoint, status, latency_ms) -> float:
+        """Sample rate that applies, or 0.0 to skip the record."""
+        if status >= 400 or latency_ms >= self.slow_ms:
+            return 1.0
+        rate = self.endpoint_rates.get(endpoint, self.default_rate)
+        return rate if rate >= 1.0 or random.random() < rate else 0.0
+
+
+def scrubbed_json():
+    """Request JSON body with sensitive keys masked, parsed once per request."""
+    from flask import request, g
+    if "_scrubbed_json" not in g:
+        body = request.get_json(silent=True) if request.is_json else None
+        # only plain dicts go to the log; lists etc. are dropped
+        g._scrubbed_json = _scrub_dict(body) if isinstance(body, dict) else None
+    return g._scrubbed_json
+
+
+def _scrubbed_headers(headers):
+    return {k: (_mask(v) if k.lower() in SENSITIVE_KEYS else str(v))
+            for k, v in headers.items() if k.lower() != "cookie"}
+
+
 def install_flask_hooks(app):
     from flask import request, g
 
     access = logging.getLogger("access")
+    policy = app.extensions["access_log_policy"] = AccessLogPolicy.from_env()
 
     @app.before_request
     def _before():
         rid = request.headers.get("X-Request-ID") or uuid.uuid4().hex
         _request_id.set(rid)
+        db_logging.start_request_profile()
         g._t0 = time.perf_counter()
 
     @app.after_request
     def _after(resp):
         t1 = time.perf_counter()
         latency_ms = round((t1 - getattr(g, "_t0", t1)) * 1000, 2)
+        sql = db_logging.finish_request_profile()
+        # surface the request id for callers
+        resp.headers["X-Request-ID"] = _request_id.get()
+        metrics.observe_request(request.endpoint, request.method, resp.status_code, latency_ms,
+                                sql.count if sql else None)
 
-        # caller ip: if you add a reverse proxy later, X-Forwarded-For will be honored here
-        caller = request.headers.get("X-Forwarded-For") or request.remote_addr
-
-        # scrub input
-        json_body = request.get_json(silent=True) if request.is_json else None
-        json_body = _scrub_dict(json_body) if isinstance(json_body, dict) else None
-
-        headers = {}
-        for k, v in request.headers.items():
-            lk = k.lower()
-            if lk == "cookie":
-                continue
-            # mask sensitive if you do that; keep as plain str
-            headers[k] = str(v)
+        rate = policy.rate_for(request.endpoint, resp.status_code, latency_ms)
+        if not rate:
+            return resp
 
-        # Ensure json body is a plain dict (or None)
-        body = request.get_json(silent=True) if request.is_json else None
-        if not isinstance(body, dict):
-            body = None  # avoid lists/complex types in access log
+        # Only build what the allowlist asks for
+        getters = {
+            "method": lambda: request.method,
+            "path": lambda: request.path,
+            "endpoint": lambda: request.endpoint,
+            "status": lambda: resp.status_code,
+            "ok": lambda: 200 <= resp.status_code < 400,
+            "latency_ms": lambda: latency_ms,
+            # caller ip: if you add a reverse proxy later, X-Forwarded-For will be honored here
+            "remote_addr": lambda: request.headers.get("X-Forwarded-For") or request.remote_addr,
+            "user_agent": lambda: request.user_agent.string,
+            "headers": lambda: _scrubbed_headers(request.headers),
+            "json": scrubbed_json,
+            # {"count", "total_ms", "top": {fingerprint: n}}
+            "sql": lambda: sql.as_log() if sql else None,
+        }
+        extra = {f: getters[f]() for f in policy.fields}
+        if rate < 1.0:
+            extra["sample_rate"] = rate
 
         try:
-            access.info("request", extra=dict(
-                method=request.method,
-                path=request.path,
-                endpoint=request.endpoint,
-                status=resp.status_code,
-                ok=(200 <= resp.status_code < 400),
-                latency_ms=latency_ms,
-                remote_addr=request.headers.get("X-Forwarded-For") or request.remote_addr,
-                user_agent=request.user_agent.string,
-                headers=headers,
-                json=body,
-            ))
+            access.info("request", extra=extra)
         except Exception:
             # fallback in case something in extra breaks JSON serialization
             logging.getLogger("access-fallback").warning(
                 "access_log_failed", exc_info=True
             )
-        # surface the request id for callers
-        resp.headers["X-Request-ID"] = _request_id.get()
         return resp
 
     @app.errorhandler(Exception)
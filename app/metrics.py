@@ -0,0 +1,139 @@
+# app/metrics.py
+"""Prometheus metrics, aggregated across gunicorn workers.
+
+Set PROMETHEUS_MULTIPROC_DIR (an empty, writable directory, wiped on deploy)
+before the app is imported and every worker writes its samples to mmap'd
+files there; /metrics then merges all of them, whichever worker serves the
+scrape. Without it the metrics are per-process (fine for tests / dev).
+
+/metrics is only served when METRICS_TOKEN is set, and the scraper must
+send it as "Authorization: Bearer <token>" (Prometheus: `authorization`
+in the scrape config).
+"""
+import hmac, logging, os, time
+
+from flask import current_app, request
+
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter,
+                               Gauge, Histogram, generate_latest, multiprocess)
+
+if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+LATENCY_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+REQUESTS = Counter("auth_http_requests_total", "HTTP requests by endpoint",
+                   ["endpoint", "method", "status"])
+LATENCY = Histogram("auth_http_request_duration_seconds", "Request latency by endpoint",
+                    ["endpoint"], buckets=LATENCY_BUCKETS)
+LOGINS = Counter("auth_login_total", "Login outcomes by auth.audit event and reason",
+                 ["event", "reason"])
+SQL_PER_REQUEST = Histogram("auth_sql_statements_per_request", "SQL statements run per request",
+                            ["endpoint"], buckets=(0, 1, 2, 3, 4, 6, 8, 12, 16, 32, 64))
+AUDIT_WRITTEN = Counter("auth_audit_events_written_total", "Audit events stored")
+AUDIT_DROPPED = Counter("auth_audit_events_dropped_total",
+                        "Audit events dropped because the write buffer was full")
+SLOW_QUERIES = Counter("auth_sql_slow_queries_total", "Queries slower than SQL_SLOW_MS")
+POOL_CHECKED_OUT = Gauge("auth_db_pool_checked_out", "Connections checked out",
+                         multiprocess_mode="livesum")
+POOL_SIZE = Gauge("auth_db_pool_size", "Configured pool_size", multiprocess_mode="livesum")
+POOL_OVERFLOW = Gauge("auth_db_pool_overflow", "Overflow connections in use",
+                      multiprocess_mode="livesum")
+DB_POOL_WAIT = Histogram("auth_db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection",
+                         buckets=(.0005, .001, .005, .01, .025, .05, .1, .25, .5, 1, 5, 30))
+DB_CONN_HELD = Histogram("auth_db_connection_held_seconds", "Checkout-to-checkin time",
+                         buckets=LATENCY_BUCKETS)
+DB_POOL_TIMEOUTS = Counter("auth_db_pool_timeouts_total", "Checkouts that hit pool_timeout")
+WORKER_FIRST_REQUEST = Gauge("auth_worker_first_request_seconds",
+                             "Startup (import, or fork under preload_app) to first response",
+                             multiprocess_mode="liveall")
+HASH_IN_FLIGHT = Gauge("auth_hash_in_flight", "Password hashes queued or running",
+                       multiprocess_mode="livesum")
+HASH_REJECTED = Counter("auth_hash_rejected_total", "Hashes rejected by admission control")
+HASH_LATENCY = Histogram("auth_hash_duration_seconds", "Password hash latency incl. queueing",
+                         buckets=LATENCY_BUCKETS)
+
+
+def observe_request(endpoint, method, status, latency_ms, sql_count=None):
+    # Unmatched URLs all share one label to keep cardinality bounded
+    endpoint = endpoint or "unmatched"
+    REQUESTS.labels(endpoint, method, str(status)).inc()
+    LATENCY.labels(endpoint).observe(latency_ms / 1000.0)
+    if sql_count is not None:
+        SQL_PER_REQUEST.labels(endpoint).observe(sql_count)
+
+
+class AuditMetricsHandler(logging.Handler):
+    """Counts auth.audit login records by message and reason."""
+
+    def emit(self, record):
+        if isinstance(record.msg, str) and record.msg.startswith("login_"):
+            LOGINS.labels(record.msg, getattr(record, "reason", None) or "unknown").inc()
+
+
+def update_pool(pool):
+    """Refresh pool gauges from a SQLAlchemy pool (QueuePool exposes these)."""
+    if hasattr(pool, "checkedout"):
+        POOL_CHECKED_OUT.set(pool.checkedout())
+        POOL_SIZE.set(pool.size())
+        POOL_OVERFLOW.set(max(0, pool.overflow()))
+
+
+def install(app):
+    audit = logging.getLogger("auth.audit")
+    if not any(isinstance(h, AuditMetricsHandler) for h in audit.handlers):
+        audit.addHandler(AuditMetricsHandler())
+
+    @app.after_request
+    def _first_response(resp):
+        first_response()
+        return resp
+
+    @app.route("/metrics")
+    def metrics():
+        token = current_app.config["METRICS_TOKEN"]
+        if not token:
+            return {"error": "Not found"}, 404
+        sent = request.headers.get("Authorization", "").encode()
+        if not hmac.compare_digest(sent, f"Bearer {token}".encode()):
+            return {"error": "Unauthorized"}, 401, {"WWW-Authenticate": "Bearer"}
+        if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        return generate_latest(registry), 200, {"Content-Type": CONTENT_TYPE_LATEST}
+
+
+_boot = {"t0": None, "pid": None}
+
+
+def start_boot_clock(t0=None):
+    # Keep the earliest start in this process (create_app may run twice)
+    if _boot["pid"] != os.getpid():
+        _boot.update(t0=t0 or time.perf_counter(), pid=os.getpid())
+
+
+def _forked():
+    # A preloaded app is imported once in the gunicorn master; each worker's
+    # clock starts at its fork
+    _boot.update(t0=time.perf_counter(), pid=os.getpid())
+
+
+os.register_at_fork(after_in_child=_forked)
+
+
+def first_response():
+    """Report time-to-first-response once per process (Flask and ASGI paths)."""
+    if _boot["pid"] == os.getpid() and _boot["t0"] is not None:
+        seconds = time.perf_counter() - _boot["t0"]
+        _boot["t0"] = None
+        WORKER_FIRST_REQUEST.set(seconds)
+        logging.getLogger("bootstrap").info("worker_first_request", extra={
+            "duration_ms": round(seconds * 1000, 2), "pid": os.getpid()})
+
+
+def mark_process_dead(pid):
+    """gunicorn child_exit hook: drop a dead worker's live gauges."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
@@ -1,8 +1,11 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime
+import hashlib, secrets
 
-db = SQLAlchemy()
+from .replicas import RoutingSession
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
@@ -11,12 +14,106 @@ class User(db.Model, UserMixin):
     password = db.Column(db.String(200), nullable=False)
     is_admin = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Bumped whenever issued token claims go stale (password reset, admin flag)
+    token_version = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+
+    # Keyset pagination of the admin user list (username/email searches use
+    # their unique indexes)
+    __table_args__ = (db.Index("ix_user_created_at_id", "created_at", "id"),)
+
+API_KEY_PREFIX_LEN = 12  # "ak_" + 9 hex chars, public and indexed
+
+def api_key_prefix(key: str) -> str:
+    return key[:API_KEY_PREFIX_LEN]
+
+def hash_api_key(key: str) -> str:
+    # Keys are 256-bit random tokens, a fast digest is enough here.
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
 
 class ServiceApiKey(db.Model):
-    """Long-lived API keys for external services (e.g. barebone-site)"""
+    """Long-lived API keys for external services (e.g. barebone-site).
+
+    Only the public prefix and a SHA-256 digest are stored; the plaintext key
+    is shown once at creation time.
+    """
     id = db.Column(db.Integer, primary_key=True)
-    key = db.Column(db.String(64), unique=True, nullable=False)
+    prefix = db.Column(db.String(16), index=True, nullable=False)
+    key_hash = db.Column(db.CHAR(64), unique=True, index=True, nullable=False)
     description = db.Column(db.String(255))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-# (JWTs are not stored — they are generated/verified dynamically)
+    @classmethod
+    def from_plaintext(cls, key: str, **kwargs) -> "ServiceApiKey":
+        return cls(prefix=api_key_prefix(key), key_hash=hash_api_key(key), **kwargs)
+
+    @classmethod
+    def generate(cls, **kwargs) -> tuple["ServiceApiKey", str]:
+        """Return (row, plaintext key)."""
+        key = "ak_" + secrets.token_hex(32)
+        return cls.from_plaintext(key, **kwargs), key
+
+class CacheVersion(db.Model):
+    """Per-namespace counters bumped on writes so every worker can drop its
+    in-process caches after polling a single row."""
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class RefreshToken(db.Model):
+    """Long-lived, single-use refresh token (only its SHA-256 is stored).
+
+    Each use marks the row used and issues a successor in the same family;
+    presenting a used token again revokes the whole family.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id", ondelete="CASCADE"),
+                        index=True, nullable=False)
+    family_id = db.Column(db.CHAR(32), index=True, nullable=False)
+    token_hash = db.Column(db.CHAR(64), unique=True, index=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, index=True, nullable=False)
+    used_at = db.Column(db.DateTime)
+    revoked_at = db.Column(db.DateTime)
+
+    @classmethod
+    def generate(cls, user_id: int, family_id: str, expires_at: datetime) -> tuple["RefreshToken", str]:
+        """Return (row, plaintext token)."""
+        token = "rt_" + secrets.token_urlsafe(32)
+        return cls(user_id=user_id, family_id=family_id, expires_at=expires_at,
+                   token_hash=hash_api_key(token)), token
+
+class RevokedToken(db.Model):
+    """Access token revocation: one jti, or all of a user's tokens issued
+    before `not_before`. Kept until `expires_at`, after which no token it
+    covers can still be valid."""
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.CHAR(32))
+    user_id = db.Column(db.Integer)
+    not_before = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    expires_at = db.Column(db.DateTime, index=True, nullable=False)
+
+class AuditEvent(db.Model):
+    """Security-relevant event (logins, token and admin actions), copied from
+    the auth.audit log by app/audit.py. No foreign keys: the trail outlives
+    deleted users and keys."""
+    id = db.Column(db.BigInteger().with_variant(db.Integer, "sqlite"), primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False)
+    event = db.Column(db.String(64), nullable=False)
+    user_id = db.Column(db.Integer)       # the user acted on / logging in
+    username = db.Column(db.String(80))
+    actor_id = db.Column(db.Integer)      # admin performing a UI action
+    service_id = db.Column(db.Integer)    # calling service's API key id
+    reason = db.Column(db.String(64))
+    ip = db.Column(db.String(45))
+    request_id = db.Column(db.String(32))
+    detail = db.Column(db.Text)           # JSON, remaining fields
+
+    # Newest-first keyset pages, alone or filtered by user/username/service
+    __table_args__ = (
+        db.Index("ix_audit_event_created_at_id", "created_at", "id"),
+        db.Index("ix_audit_event_user_id", "user_id", "created_at", "id"),
+        db.Index("ix_audit_event_username", "username", "created_at", "id"),
+        db.Index("ix_audit_event_service_id", "service_id", "created_at", "id"),
+    )
+
+# (Access JWTs are not stored — they are generated/verified dynamically)
@@ -0,0 +1,77 @@
+# app/pagination.py
+"""Keyset (cursor) pagination for the admin listings.
+
+A page is fetched with `WHERE (sort key) > (last row's key) ORDER BY key
+LIMIT n+1`, so every page costs the same index range scan no matter how deep
+the admin scrolls. The cursor handed to the client is the last row's key,
+base64url-encoded JSON; it is opaque to callers but not secret.
+"""
+import base64, json
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+class BadCursor(ValueError):
+    pass
+
+
+def _dump(v):
+    return {"dt": v.isoformat()} if isinstance(v, datetime) else v
+
+
+def _load(v):
+    return datetime.fromisoformat(v["dt"]) if isinstance(v, dict) else v
+
+
+def encode_cursor(values) -> str:
+    raw = json.dumps([_dump(v) for v in values], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, width: int) -> list:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = [_load(v) for v in json.loads(raw)]
+    except (ValueError, TypeError, KeyError) as e:
+        raise BadCursor("Invalid cursor") from e
+    if not isinstance(values, list) or len(values) != width:
+        raise BadCursor("Invalid cursor")
+    return values
+
+
+def prefix_pattern(q: str) -> str:
+    """LIKE pattern for a literal prefix (escape char is backslash)."""
+    escaped = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return escaped + "%"
+
+
+def _after(columns, values, desc=False):
+    # (a, b) > (x, y) spelled out; MySQL only range-scans the expanded form
+    col, val = columns[0], values[0]
+    past = col < val if desc else col > val
+    if len(columns) == 1:
+        return past
+    return or_(past, and_(col == val, _after(columns[1:], values[1:], desc)))
+
+
+def keyset_page(query, columns, cursor=None, limit=DEFAULT_LIMIT, desc=False):
+    """Return (rows, next_cursor) for `query` ordered by `columns` ascending
+    (descending with `desc`).
+
+    `columns` must form a unique key (end with the primary key) and should be
+    backed by an index in that order.
+    """
+    limit = max(1, min(int(limit or DEFAULT_LIMIT), MAX_LIMIT))
+    if cursor:
+        query = query.filter(_after(columns, decode_cursor(cursor, len(columns)), desc))
+    order = [c.desc() for c in columns] if desc else columns
+    rows = query.order_by(*order).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor([getattr(last, c.key) for c in columns])
@@ -0,0 +1,149 @@
+# app/replicas.py
+"""Read-replica routing for the read-only code paths.
+
+Replica engines are built from DATABASE_REPLICA_URLS with
+REPLICA_ENGINE_OPTIONS (their own pools). They are not Flask-SQLAlchemy
+binds, so create_all()/drop_all() and bootstrap never touch them.
+
+`RoutingSession.get_bind` sends a statement to a replica only when:
+
+- the caller is inside `replica_reads()` or a `@read_only` function;
+- it is a plain SELECT (no FOR UPDATE) and the session is not flushing;
+- the session has not written yet. Once a request flushes or executes
+  INSERT/UPDATE/DELETE, the rest of it reads from the primary
+  (read-your-writes);
+- a replica is healthy.
+
+Each worker sticks to one replica (chosen by pid), so the cache version rows
+it polls and the rows those versions guard come from the same copy. A replica
+that raises a DB error is skipped for REPLICA_RETRY_SEC, and the `@read_only`
+function that hit the error is re-run on the primary. Lookups that find
+nothing on a replica are re-checked on the primary (`confirm_on_primary`),
+so a user or API key created moments ago is not reported missing.
+"""
+import logging, os, threading, time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from flask import current_app
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.dml import UpdateBase
+
+log = logging.getLogger("auth.replicas")
+
+RETRY_SEC = float(os.getenv("REPLICA_RETRY_SEC", "30"))
+
+_reads = ContextVar("replica_reads", default=False)
+
+
+class ReplicaSet:
+    def __init__(self, engines, retry=RETRY_SEC):
+        self.engines = list(engines)
+        self.retry = retry
+        self._down = {}  # engine index -> monotonic time it may be retried
+        self._lock = threading.Lock()
+        for i, engine in enumerate(self.engines):
+            event.listen(engine, "handle_error", self._error_handler(i))
+
+    def _error_handler(self, i):
+        def handle_error(ctx):
+            # Tag the exception so @read_only knows a replica (not the
+            # primary) failed and the call can be retried
+            ctx.sqlalchemy_exception.replica_failed = True
+            self.mark_down(i, ctx.sqlalchemy_exception)
+        return handle_error
+
+    def mark_down(self, i, error=None):
+        with self._lock:
+            was_up = self._down.get(i, 0.0) <= time.monotonic()
+            self._down[i] = time.monotonic() + self.retry
+        if was_up:
+            log.warning("replica_down", extra={"replica": i, "retry_in": self.retry,
+                                               "error": str(error)[:200] if error else None})
+
+    def pick(self):
+        """This worker's replica, another healthy one, or None (use the primary)."""
+        n = len(self.engines)
+        if not n:
+            return None
+        now = time.monotonic()
+        first = os.getpid() % n
+        for k in range(n):
+            i = (first + k) % n
+            if self._down.get(i, 0.0) <= now:
+                return self.engines[i]
+        return None
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        down = sorted(i for i, until in self._down.items() if until > now)
+        return {"configured": len(self.engines), "down": down}
+
+
+def init_app(app) -> ReplicaSet:
+    opts = app.config["REPLICA_ENGINE_OPTIONS"]
+    replicas = ReplicaSet(create_engine(url, **opts) for url in app.config["DATABASE_REPLICA_URLS"])
+    app.extensions["replicas"] = replicas
+    return replicas
+
+
+def _plain_select(clause) -> bool:
+    return isinstance(clause, Select) and clause._for_update_arg is None
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            if self._flushing or isinstance(clause, UpdateBase):
+                self.info["wrote"] = True
+            elif _reads.get() and not self.info.get("wrote") and _plain_select(clause):
+                replicas = current_app.extensions.get("replicas")
+                engine = replicas.pick() if replicas else None
+                if engine is not None:
+                    return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """Route plain SELECTs in this block to a replica (`False` forces the primary)."""
+    token = _reads.set(enabled)
+    try:
+        yield
+    finally:
+        _reads.reset(token)
+
+
+def read_only(f):
+    """Run `f` with replica reads; if the replica fails, run it again on the
+    primary. Only for functions that don't write."""
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        with replica_reads():
+            try:
+                return f(*args, **kwargs)
+            except DBAPIError as e:
+                if not getattr(e, "replica_failed", False):
+                    raise
+                current_app.extensions["sqlalchemy"].session.rollback()
+        return f(*args, **kwargs)
+    return wrapper
+
+
+def reading_replicas() -> bool:
+    """True if plain SELECTs here may be served by a replica."""
+    return _reads.get() and bool(current_app.extensions["replicas"].engines)
+
+
+def confirm_on_primary(load):
+    """Return `load()`; a None result from a replica is re-checked on the
+    primary, as the row may not have replicated yet."""
+    found = load()
+    if found is None and reading_replicas():
+        with replica_reads(False):
+            found = load()
+    return found
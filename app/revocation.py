@@ -0,0 +1,162 @@
+# app/revocation.py
+"""Access token revocation: by jti, or per user with a "not before" time.
+
+Revocations are rows in `revoked_token`. Every worker mirrors the live ones
+in `denylist` (a set of 16-byte jtis and a user_id -> not_before dict), so
+the check on the verify path is two hash lookups and never touches the DB.
+The mirror is refreshed incrementally, at most every REVOCATION_POLL
+seconds, by fetching only rows created since the previous poll. Rows and
+mirror entries expire when the newest token they could affect has expired.
+"""
+import logging, os, threading, time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import delete, select
+from sqlalchemy.exc import SQLAlchemyError
+
+from .models import db, RevokedToken
+
+log = logging.getLogger("auth.revocation")
+
+POLL_SEC = float(os.getenv("REVOCATION_POLL", "2"))
+# Re-read rows this much older than the last poll, covering transactions
+# that committed late and small clock skew between writers
+OVERLAP_SEC = float(os.getenv("REVOCATION_SYNC_OVERLAP", "10"))
+PRUNE_SEC = float(os.getenv("REVOCATION_PRUNE_INTERVAL", "600"))
+
+
+def _epoch(naive_utc: datetime) -> float:
+    # Timestamps in the DB are naive UTC, like JWT iat
+    return (naive_utc - datetime(1970, 1, 1)).total_seconds()
+
+
+def _jti_key(jti):
+    # uuid4().hex jtis are stored as 16 raw bytes instead of a 32-char str
+    try:
+        return bytes.fromhex(jti) if len(jti) == 32 else jti
+    except ValueError:
+        return jti
+
+
+class Denylist:
+    def __init__(self, poll=POLL_SEC, overlap=OVERLAP_SEC, prune=PRUNE_SEC):
+        self.poll = poll
+        self.overlap = timedelta(seconds=overlap)
+        self.prune_every = prune
+        self._jtis = {}        # jti key -> expires (datetime)
+        self._users = {}       # user_id -> (not_before epoch seconds, expires)
+        self._since = None     # created_at lower bound for the next fetch
+        self._next_poll = 0.0
+        self._next_prune = 0.0
+        self._lock = threading.Lock()
+
+    def is_revoked(self, payload) -> bool:
+        if self._users:
+            nbf = self._users.get(payload.get("user_id"))
+            # Tokens without iat predate revocation support; treat as old
+            if nbf is not None and payload.get("iat", 0) < nbf[0]:
+                return True
+        jti = payload.get("jti")
+        return bool(jti) and _jti_key(jti) in self._jtis
+
+    def due(self) -> bool:
+        now = time.monotonic()
+        if now < self._next_poll:
+            return False
+        with self._lock:
+            if now < self._next_poll:
+                return False
+            self._next_poll = now + self.poll
+        return True
+
+    def fetch_query(self):
+        """Statement for rows to apply next; returns (stmt, fetch started at)."""
+        started = datetime.utcnow()
+        cond = [RevokedToken.expires_at > started]
+        if self._since is not None:
+            cond.append(RevokedToken.created_at >= self._since - self.overlap)
+        stmt = select(RevokedToken.jti, RevokedToken.user_id, RevokedToken.not_before,
+                      RevokedToken.expires_at).where(*cond)
+        return stmt, started
+
+    def apply(self, rows, started=None):
+        for jti, user_id, not_before, expires in rows:
+            self.add(jti=jti, user_id=user_id, not_before=not_before, expires=expires)
+        if started is not None:
+            self._since = started
+
+    def add(self, jti=None, user_id=None, not_before=None, expires=None):
+        with self._lock:
+            if jti:
+                self._jtis[_jti_key(jti)] = expires
+            elif user_id is not None:
+                nbf = int(_epoch(not_before))
+                prev = self._users.get(user_id)
+                if prev is None or prev[0] < nbf:
+                    self._users[user_id] = (nbf, expires)
+
+    def prune(self, now=None):
+        now = now or datetime.utcnow()
+        with self._lock:
+            for k in [k for k, exp in self._jtis.items() if exp <= now]:
+                del self._jtis[k]
+            for k in [k for k, (_, exp) in self._users.items() if exp <= now]:
+                del self._users[k]
+
+    def prune_due(self) -> bool:
+        now = time.monotonic()
+        if now < self._next_prune:
+            return False
+        self._next_prune = now + self.prune_every
+        return True
+
+    def stats(self) -> dict:
+        return {"jtis": len(self._jtis), "users": len(self._users)}
+
+    def clear(self):
+        with self._lock:
+            self._jtis.clear()
+            self._users.clear()
+        self._since = None
+        self._next_poll = 0.0
+
+
+denylist = Denylist()
+
+
+def sync_denylist(engine=None):
+    """Pull new revocations if the poll interval has passed (own connection,
+    so the caller's session/transaction is untouched)."""
+    if not denylist.due():
+        return
+    engine = engine or db.engine
+    stmt, started = denylist.fetch_query()
+    try:
+        with engine.begin() as conn:
+            denylist.apply(conn.execute(stmt).all(), started)
+            if denylist.prune_due():
+                denylist.prune(started)
+                conn.execute(delete(RevokedToken).where(RevokedToken.expires_at <= started))
+    except SQLAlchemyError:
+        # Keep serving from the current mirror; the next poll retries
+        log.warning("revocation_sync_failed", exc_info=True)
+
+
+def revoke_jti(jti, exp):
+    """Revoke one access token until its `exp` (caller commits)."""
+    expires = datetime.utcfromtimestamp(exp) if not isinstance(exp, datetime) else exp
+    db.session.add(RevokedToken(jti=jti, expires_at=expires))
+    denylist.add(jti=jti, expires=expires)
+
+
+def revoke_user_tokens(user_id):
+    """Revoke every access token issued to `user_id` so far (caller commits).
+
+    JWT iat has one-second resolution, so tokens issued within the same
+    second as the revocation are not covered.
+    """
+    now = datetime.utcnow().replace(microsecond=0)
+    expires = now + timedelta(seconds=current_app.config["ACCESS_TOKEN_TTL"])
+    db.session.add(RevokedToken(user_id=user_id, not_before=now, expires_at=expires))
+    denylist.add(user_id=user_id, not_before=now, expires=expires)
@@ -1,9 +1,15 @@
-from flask import Blueprint, request, jsonify, g
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Blueprint, request, g, current_app
 from sqlalchemy import or_
-from .models import db, User, ServiceApiKey
-from .utils import generate_token, decode_token, require_api_key
-import logging
+from .models import db, User
+from .hashing import hash_password, verify_password, upgrade_hash
+from .throttle import login_throttle
+from .utils import (generate_token, decode_token, require_api_key, current_token_version,
+                    issue_refresh_token, rotate_refresh_token, revoke_refresh_token,
+                    RefreshRejected)
+from .revocation import revoke_jti
+from .replicas import confirm_on_primary, read_only, reading_replicas, replica_reads
+from itertools import islice
+import io, logging
 
 audit = logging.getLogger("auth.audit")
 
@@ -35,15 +41,41 @@ def register():
 
     user = User(username=username,
                 email=email,
-                password=generate_password_hash(password))
+                password=hash_password(password))
     db.session.add(user)
 
-    log.info("login_attempt", extra={"username": username, "exists": bool(user)})    
+    audit.info("user_registered", extra={"username": username})
 
     db.session.commit()
     return {"message": "User registered"}, 201
 
 
+# ------------------------
+# Bulk import
+# ------------------------
+@bp.route("/users/import", methods=["POST"])
+@require_api_key
+def import_users():
+    """NDJSON (default) or CSV (?format=csv or Content-Type text/csv) body,
+    one {username, password[, email]} per row; same rules as /register."""
+    from . import bulk  # import-only dependency, kept off worker boot
+
+    fmt = "csv" if request.args.get("format") == "csv" or request.mimetype == "text/csv" else "ndjson"
+    # The body is parsed as it is read; results are returned once it's consumed
+    stream = io.TextIOWrapper(request.stream, encoding="utf-8", errors="replace", newline="")
+    rows = bulk.read_rows(stream, fmt)
+    limit = current_app.config["BULK_IMPORT_MAX_ROWS"]
+    results = list(bulk.import_users(islice(rows, limit)))
+    truncated = next(rows, None) is not None
+    summary = bulk.summarize(results)
+    audit.info("users_imported", extra={"count": summary["created"],
+                                        "service": getattr(g, "calling_service", None)})
+    body = {"summary": summary, "truncated": truncated, "results": results}
+    if truncated:
+        body["hint"] = f"Only the first {limit} rows were processed; use the import-users CLI for large files"
+    return body, 200
+
+
 # ------------------------
 # User Login
 # ------------------------
@@ -61,52 +93,185 @@ def login():
         })
         return {"error": "Missing username or password"}, 400
 
+    # Throttle before any user lookup or hash work.
+    svc = getattr(g, "calling_service", None)
+    who = {"user": username, "ip": request.remote_addr, "service": svc and svc["id"]}
+    lock = login_throttle.check(**who)
+    if lock:
+        audit.warning("login_failed", extra={
+            "username": username,
+            "reason": "throttled",
+            "scope": lock.scope,
+            "retry_after": lock.retry_after,
+            "service": svc
+        })
+        return {"error": "Too many failed attempts"}, 429, {"Retry-After": str(lock.retry_after)}
+
     user = User.query.filter_by(username=username).first()
     if not user:
         # Don’t reveal which part failed to the client; but log exact reason internally.
+        login_throttle.record_failure(**who)
         audit.info("login_failed", extra={
             "username": username,
-            "reason": "user_not_found"
+            "reason": "user_not_found",
+            "service": svc
         })
         return {"error": "Invalid credentials"}, 401
 
-    if not check_password_hash(user.password, password):
+    if not verify_password(user.password, password):
+        login_throttle.record_failure(**who)
         audit.info("login_failed", extra={
             "username": username,
             "reason": "bad_password",
-            "user_exists": True
+            "user_exists": True,
+            "service": svc
         })
         return {"error": "Invalid credentials"}, 401
 
-    token = generate_token(user.id)
+    login_throttle.record_success(user=username)
+    upgrade_hash(user, password)
+    refresh_token = issue_refresh_token(user)
+    db.session.commit()
+
+    token = generate_token(user)
+    audit.info("login_success", extra={"username": username, "user_id": user.id,
+                                       "reason": "ok", "service": svc})
+
+    return {"token": token, "refresh_token": refresh_token}, 200
+
+
+# ------------------------
+# Token Refresh
+# ------------------------
+@bp.route("/token/refresh", methods=["POST"])
+@require_api_key
+def refresh():
+    """Trade a refresh token for a new access token and a new refresh token."""
+    data = request.get_json(silent=True) or {}
     svc = getattr(g, "calling_service", None)
-    audit.info("login_failed", extra={"username": username, "reason": "bad_password", "service": svc})
+    try:
+        user, refresh_token = rotate_refresh_token(data.get("refresh_token"))
+    except RefreshRejected as e:
+        level = logging.WARNING if e.reason == "reused" else logging.INFO
+        audit.log(level, "token_refresh_failed", extra={
+            "user_id": e.user_id, "reason": e.reason, "service": svc})
+        return {"error": "Invalid refresh token"}, 401
+    audit.info("token_refreshed", extra={"user_id": user.id, "service": svc})
+    return {"token": generate_token(user), "refresh_token": refresh_token}, 200
 
-    return {"token": token}, 200
+
+# ------------------------
+# Token Revocation (logout)
+# ------------------------
+@bp.route("/token/revoke", methods=["POST"])
+@require_api_key
+def revoke():
+    """Revoke an access token by jti and/or a refresh token's family.
+    Idempotent: unknown, expired or already revoked tokens are not errors."""
+    data = request.get_json(silent=True) or {}
+    payload = decode_token(data.get("token"))
+    revoked = {"token": False, "refresh_token": revoke_refresh_token(data.get("refresh_token"))}
+    if payload and payload.get("jti"):
+        revoke_jti(payload["jti"], payload["exp"])
+        revoked["token"] = True
+    db.session.commit()
+    audit.info("token_revoked", extra={"user_id": payload and payload["user_id"],
+                                       "service": getattr(g, "calling_service", None)})
+    return {"revoked": revoked}, 200
 
 
 # ------------------------
 # Token Verification
 # ------------------------
 @bp.route("/verify", methods=["POST"])
+@read_only
 @require_api_key
 def verify():
-    token = request.json.get("token")
-    payload = decode_token(token)
+    data = request.json
+    payload = decode_token(data.get("token"))
     if not payload:
         return {"error": "Invalid or expired token"}, 401
 
-    user = db.session.get(User, payload["user_id"])
+    # Stateless path: trust the signed claims as long as the user's
+    # token_version (cached per worker) still matches; anything else falls
+    # through to the authoritative DB check.
+    if (current_app.config["VERIFY_STATELESS"] and not data.get("strict")
+            and "tv" in payload and "username" in payload
+            and current_token_version(payload["user_id"]) == payload["tv"]):
+        return {"user_id": payload["user_id"], "username": payload["username"]}, 200
+
+    user = confirm_on_primary(lambda: db.session.get(User, payload["user_id"]))
     if not user:
         return {"error": "User not found"}, 404
+    if _is_stale(payload, user):
+        return {"error": "Token revoked"}, 401
+
+    return _verify_body(user), 200
+
+
+def _verify_body(user):
+    return {"user_id": user.id, "username": user.username}
+
+
+def _is_stale(payload, user):
+    # Minimal-profile tokens carry no version and are not checked.
+    return "tv" in payload and payload["tv"] != user.token_version
+
+
+# ------------------------
+# Batch Token Verification
+# ------------------------
+@bp.route("/verify/batch", methods=["POST"])
+@read_only
+@require_api_key
+def verify_batch():
+    """Verify many tokens in one call: one decode per distinct token and a
+    single IN query for all users. Results keep request order and carry the
+    status `verify` would have returned."""
+    tokens = (request.get_json(silent=True) or {}).get("tokens")
+    if not isinstance(tokens, list):
+        return {"error": "Missing tokens list"}, 400
+    limit = current_app.config["VERIFY_BATCH_MAX"]
+    if len(tokens) > limit:
+        return {"error": f"Too many tokens (max {limit})"}, 413
+
+    decoded = {}
+    for t in tokens:
+        if isinstance(t, str) and t not in decoded:
+            decoded[t] = decode_token(t)
+
+    user_ids = {p["user_id"] for p in decoded.values() if p}
+    users = {}
+    if user_ids:
+        users = {u.id: u for u in User.query.filter(User.id.in_(user_ids))}
+        missing = user_ids - users.keys()
+        if missing and reading_replicas():
+            with replica_reads(False):  # may be too new to have replicated
+                users.update((u.id, u) for u in User.query.filter(User.id.in_(missing)))
+
+    results = []
+    for t in tokens:
+        payload = decoded.get(t) if isinstance(t, str) else None
+        if not payload:
+            results.append({"status": 401, "error": "Invalid or expired token"})
+            continue
+        user = users.get(payload["user_id"])
+        if not user:
+            results.append({"status": 404, "error": "User not found"})
+            continue
+        if _is_stale(payload, user):
+            results.append({"status": 401, "error": "Token revoked"})
+            continue
+        results.append({"status": 200, **_verify_body(user)})
 
-    return {"user_id": user.id, "username": user.username}, 200
+    return {"results": results}, 200
 
 
 # ------------------------
 # User Info
 # ------------------------
 @bp.route("/userinfo", methods=["POST"])
+@read_only
 @require_api_key
 def userinfo():
     token = request.json.get("token")
@@ -114,9 +279,11 @@ def userinfo():
     if not payload:
         return {"error": "Invalid or expired token"}, 401
 
-    user = db.session.get(User, payload["user_id"])
+    user = confirm_on_primary(lambda: db.session.get(User, payload["user_id"]))
     if not user:
         return {"error": "User not found"}, 404
+    if _is_stale(payload, user):
+        return {"error": "Token revoked"}, 401
 
     return {
         "id": user.id,
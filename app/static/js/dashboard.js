@@ -1,38 +1,6 @@
 // static/js/dashboard.js
 import { fetchJson, showToast } from "./helpers.js";
 
-function copyApiKey(keyId) {
-  const text = document.getElementById(`key-${keyId}`).innerText;
-
-  if (navigator.clipboard && navigator.clipboard.writeText) {
-    // Modern API (works on https:// or http://localhost)
-    navigator.clipboard.writeText(text).then(() => {
-      showToast("API key copied to clipboard!", "success");
-    }).catch(() => {
-      showToast("Failed to copy API key", "danger");
-    });
-  } else {
-    // Fallback for plain http or older browsers
-    const textarea = document.createElement("textarea");
-    textarea.value = text;
-    textarea.style.position = "fixed";
-    textarea.style.opacity = "0";
-    document.body.appendChild(textarea);
-    textarea.focus();
-    textarea.select();
-
-    try {
-      document.execCommand("copy");
-      showToast("API key copied to clipboard!", "success");
-    } catch (err) {
-      console.error("Fallback copy failed", err);
-      showToast("Failed to copy API key", "danger");
-    }
-
-    document.body.removeChild(textarea);
-  }
-}
-
 async function deleteApiKey(keyId) {
   if (!confirm("Delete this API key?")) return;
   const url = URLS.deleteApiKey.replace("__ID__", keyId);
@@ -44,12 +12,47 @@ async function deleteApiKey(keyId) {
   showToast("API key deleted", "success");
 }
 
+// Mirrors the row markup in dashboard.html
+function renderKeyRow(key) {
+  const tr = document.createElement("tr");
+  tr.id = `key-row-${key.id}`;
+
+  const prefix = document.createElement("code");
+  prefix.id = `key-${key.id}`;
+  prefix.textContent = `${key.prefix}…`;
+
+  const del = document.createElement("button");
+  del.type = "button";
+  del.className = "btn btn-sm btn-danger";
+  del.dataset.action = "delete-key";
+  del.dataset.keyId = key.id;
+  del.textContent = "Delete";
+
+  for (const content of [key.id, prefix, key.description || "—", key.created_at, del]) {
+    const td = document.createElement("td");
+    td.append(content);
+    tr.append(td);
+  }
+  return tr;
+}
+
+async function loadMoreKeys(btn) {
+  const params = new URLSearchParams({ cursor: btn.dataset.nextCursor });
+  const data = await fetchJson(`${URLS.keysData}?${params}`);
+  if (!data) return;
+
+  const tbody = document.querySelector("#keysTable tbody");
+  data.keys.forEach(key => tbody.append(renderKeyRow(key)));
+  btn.dataset.nextCursor = data.next_cursor || "";
+  btn.hidden = !data.next_cursor;
+}
+
 document.addEventListener("DOMContentLoaded", () => {
-  document.querySelectorAll("[data-action='copy-key']").forEach(btn => {
-    btn.addEventListener("click", () => copyApiKey(btn.dataset.keyId));
+  // Delegated so rows added by "Load more" work too
+  document.querySelector("#keysTable tbody").addEventListener("click", (e) => {
+    const btn = e.target.closest("[data-action='delete-key']");
+    if (btn) deleteApiKey(btn.dataset.keyId);
   });
 
-  document.querySelectorAll("[data-action='delete-key']").forEach(btn => {
-    btn.addEventListener("click", () => deleteApiKey(btn.dataset.keyId));
-  });
+  document.getElementById("loadMoreKeys")?.addEventListener("click", (e) => loadMoreKeys(e.currentTarget));
 });
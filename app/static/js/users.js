@@ -53,18 +53,93 @@ function copyResetLink() {
   });
 }
 
+function cell(text, id) {
+  const td = document.createElement("td");
+  td.textContent = text;
+  if (id) td.id = id;
+  return td;
+}
+
+function actionButton(action, id, label, cls, user) {
+  const btn = document.createElement("button");
+  btn.id = id;
+  btn.className = `btn btn-sm ${cls}`;
+  btn.dataset.action = action;
+  btn.dataset.userId = user.id;
+  btn.dataset.username = user.username;
+  btn.textContent = label;
+  return btn;
+}
+
+// Mirrors the row markup in users.html
+function renderUserRow(user) {
+  const tr = document.createElement("tr");
+  tr.id = `user-row-${user.id}`;
+  tr.append(
+    cell(user.id),
+    cell(user.username),
+    cell(user.email || "—"),
+    cell(user.is_admin ? "✅" : "❌", `user-admin-${user.id}`),
+    cell(user.created_at),
+  );
+  const actions = document.createElement("td");
+  if (user.is_self) {
+    const you = document.createElement("span");
+    you.className = "text-muted";
+    you.textContent = "You";
+    actions.append(you);
+  } else {
+    actions.append(
+      actionButton("toggle-admin", `toggle-btn-${user.id}`, user.is_admin ? "Demote" : "Promote",
+                   user.is_admin ? "btn-warning" : "btn-primary", user), " ",
+      actionButton("reset", `reset-btn-${user.id}`, "Reset Password", "btn-info", user), " ",
+      actionButton("delete", `delete-btn-${user.id}`, "Delete", "btn-danger", user),
+    );
+  }
+  tr.append(actions);
+  return tr;
+}
+
+// Fetch a page from /users/data; replace the rows for a new search, append otherwise
+async function loadUsers({ q, cursor = "", replace = false }) {
+  const params = new URLSearchParams({ q });
+  if (cursor) params.set("cursor", cursor);
+  const data = await fetchJson(`${URLS.usersData}?${params}`);
+  if (!data) return;
+
+  const tbody = document.querySelector("#usersTable tbody");
+  if (replace) tbody.replaceChildren();
+  data.users.forEach(user => tbody.append(renderUserRow(user)));
+
+  const more = document.getElementById("loadMoreUsers");
+  more.dataset.nextCursor = data.next_cursor || "";
+  more.hidden = !data.next_cursor;
+}
+
 // Event listeners
 document.addEventListener("DOMContentLoaded", () => {
-  document.querySelectorAll("[data-action='toggle-admin']").forEach(btn => {
-    btn.addEventListener("click", () => toggleAdmin(btn.dataset.userId));
+  // Delegated so rows added by "Load more" work too
+  document.querySelector("#usersTable tbody").addEventListener("click", (e) => {
+    const btn = e.target.closest("button[data-action]");
+    if (!btn) return;
+    if (btn.dataset.action === "toggle-admin") toggleAdmin(btn.dataset.userId);
+    if (btn.dataset.action === "delete") deleteUser(btn.dataset.userId, btn.dataset.username);
+    if (btn.dataset.action === "reset") requestReset(btn.dataset.userId, btn.dataset.username);
   });
 
-  document.querySelectorAll("[data-action='delete']").forEach(btn => {
-    btn.addEventListener("click", () => deleteUser(btn.dataset.userId, btn.dataset.username));
+  const search = document.getElementById("userSearchInput");
+  let debounce;
+  search?.addEventListener("input", () => {
+    clearTimeout(debounce);
+    debounce = setTimeout(() => loadUsers({ q: search.value.trim(), replace: true }), 250);
+  });
+  document.getElementById("userSearch")?.addEventListener("submit", (e) => {
+    e.preventDefault();
+    loadUsers({ q: search.value.trim(), replace: true });
   });
 
-  document.querySelectorAll("[data-action='reset']").forEach(btn => {
-    btn.addEventListener("click", () => requestReset(btn.dataset.userId, btn.dataset.username));
+  document.getElementById("loadMoreUsers")?.addEventListener("click", (e) => {
+    loadUsers({ q: search ? search.value.trim() : "", cursor: e.currentTarget.dataset.nextCursor });
   });
 
   document.getElementById("copyResetBtn")?.addEventListener("click", copyResetLink);
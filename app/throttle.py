@@ -0,0 +1,194 @@
+# app/throttle.py
+import logging, math, os, sqlite3, threading, time
+from collections import namedtuple
+
+log = logging.getLogger("auth.throttle")
+
+Lockout = namedtuple("Lockout", "scope key count limit retry_after")
+
+
+def _parse_rule(spec: str) -> tuple[int, int]:
+    """"5/300" -> (limit=5, window=300s)."""
+    limit, window = spec.split("/", 1)
+    return int(limit), int(window)
+
+
+def _rotate(win, prev, curr, now_win):
+    """Roll a (window index, previous count, current count) triple forward."""
+    if win == now_win:
+        return prev, curr
+    if win == now_win - 1:
+        return curr, 0
+    return 0, 0
+
+
+def _estimate(prev, curr, now, window):
+    # Sliding-window counter: previous window weighted by how much of it
+    # still overlaps the last `window` seconds.
+    elapsed = (now % window) / window
+    return prev * (1.0 - elapsed) + curr
+
+
+class MemoryBackend:
+    """Per-process counters; fine for a single worker and for tests."""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, window, now):
+        now_win = int(now // window)
+        with self._lock:
+            win, prev, curr, _ = self._data.get(key, (now_win, 0, 0, 0))
+        return _rotate(win, prev, curr, now_win)
+
+    def hit(self, key, window, now):
+        now_win = int(now // window)
+        with self._lock:
+            win, prev, curr, _ = self._data.get(key, (now_win, 0, 0, 0))
+            prev, curr = _rotate(win, prev, curr, now_win)
+            # Expiry from the key's own window, like SqliteBackend
+            self._data[key] = (now_win, prev, curr + 1, (now_win + 2) * window)
+
+    def reset(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def prune(self, now):
+        with self._lock:
+            stale = [k for k, (*_, expires) in self._data.items() if expires < now]
+            for k in stale:
+                del self._data[k]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class SqliteBackend:
+    """Counters in a local SQLite file (WAL) shared by all workers on a host."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute("CREATE TABLE IF NOT EXISTS hits ("
+                         "key TEXT PRIMARY KEY, win INTEGER, prev INTEGER, curr INTEGER, "
+                         "expires REAL)")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key, window, now):
+        now_win = int(now // window)
+        row = self._conn().execute("SELECT win, prev, curr FROM hits WHERE key = ?", (key,)).fetchone()
+        if not row:
+            return 0, 0
+        return _rotate(*row, now_win)
+
+    def hit(self, key, window, now):
+        now_win = int(now // window)
+        self._conn().execute(
+            "INSERT INTO hits (key, win, prev, curr, expires) VALUES (?, ?, 0, 1, ?) "
+            "ON CONFLICT(key) DO UPDATE SET "
+            "prev = CASE WHEN win = excluded.win THEN prev "
+            "            WHEN win = excluded.win - 1 THEN curr ELSE 0 END, "
+            "curr = CASE WHEN win = excluded.win THEN curr + 1 ELSE 1 END, "
+            "win = excluded.win, expires = excluded.expires",
+            (key, now_win, (now_win + 2) * window),
+        )
+
+    def reset(self, key):
+        self._conn().execute("DELETE FROM hits WHERE key = ?", (key,))
+
+    def prune(self, now):
+        self._conn().execute("DELETE FROM hits WHERE expires < ?", (now,))
+
+    def clear(self):
+        self._conn().execute("DELETE FROM hits")
+
+
+class LoginThrottle:
+    """Sliding-window failure limits per username, source IP and service.
+
+    `check()` runs before any user lookup or password hashing; only failed
+    attempts are counted, and a successful login clears the username counter.
+
+    If the backend fails (SQLite lock timeout, disk error) the error is
+    logged and logins go on unthrottled (`fail_open`), or are all refused
+    with a Lockout of scope "unavailable" (`fail_open=False`).
+    """
+
+    PRUNE_EVERY = 1000
+    ERRORS = (sqlite3.Error,)
+
+    def __init__(self, backend, rules: dict[str, tuple[int, int]], fail_open: bool = True):
+        self.backend = backend
+        self.rules = rules
+        self.fail_open = fail_open
+        self._ops = 0
+
+    def _keys(self, user=None, ip=None, service=None):
+        for scope, value in (("user", user), ("ip", ip), ("service", service)):
+            if value is not None and scope in self.rules:
+                yield scope, f"{scope}:{value}"
+
+    def _failed(self, op, exc):
+        log.warning("throttle_unavailable", extra={
+            "reason": f"{op}: {exc}"[:200], "scope": "open" if self.fail_open else "closed"})
+
+    def check(self, now=None, **who) -> Lockout | None:
+        now = time.time() if now is None else now
+        try:
+            for scope, key in self._keys(**who):
+                limit, window = self.rules[scope]
+                count = _estimate(*self.backend.get(key, window, now), now, window)
+                if count >= limit:
+                    retry = max(1, math.ceil(window - (now % window)))
+                    return Lockout(scope, key, int(count), limit, retry)
+        except self.ERRORS as e:
+            self._failed("check", e)
+            if not self.fail_open:
+                return Lockout("unavailable", None, 0, 0, 1)
+        return None
+
+    def record_failure(self, now=None, **who):
+        now = time.time() if now is None else now
+        try:
+            for scope, key in self._keys(**who):
+                self.backend.hit(key, self.rules[scope][1], now)
+            self._ops += 1
+            if self._ops % self.PRUNE_EVERY == 0:
+                self.backend.prune(now)
+        except self.ERRORS as e:
+            self._failed("record_failure", e)
+
+    def record_success(self, user=None):
+        if user is None:
+            return
+        try:
+            self.backend.reset(f"user:{user}")
+        except self.ERRORS as e:
+            self._failed("record_success", e)
+
+
+def _from_env() -> LoginThrottle:
+    path = os.getenv("LOGIN_THROTTLE_DB")
+    backend = SqliteBackend(path) if path else MemoryBackend()
+    rules = {}
+    # No per-service limit by default: anyone could fill it with junk
+    # passwords and lock every user of that service out
+    for scope, default in (("user", "5/300"), ("ip", "50/300"), ("service", "")):
+        spec = os.getenv(f"LOGIN_THROTTLE_{scope.upper()}", default)
+        if spec:  # empty string disables that scope
+            rules[scope] = _parse_rule(spec)
+    fail_open = os.getenv("LOGIN_THROTTLE_ON_ERROR", "open").lower() != "closed"
+    return LoginThrottle(backend, rules, fail_open=fail_open)
+
+
+login_throttle = _from_env()
@@ -1,10 +1,19 @@
-from flask import Blueprint, render_template, redirect, url_for, request, flash, jsonify
+from flask import (Blueprint, render_template, redirect, url_for, request, flash, jsonify,
+                   Response, stream_with_context)
 from flask_login import login_user, logout_user, login_required, current_user
-from werkzeug.security import check_password_hash, generate_password_hash
 from .models import User, ServiceApiKey, db
-import secrets
-from .utils import generate_reset_token, verify_reset_token
+from .hashing import hash_password, verify_password, upgrade_hash
+from .utils import (generate_reset_token, verify_reset_token, invalidate_api_keys,
+                    bump_token_version, forget_user, revoke_refresh_tokens)
+from .throttle import login_throttle
+from .db_logging import top_queries
+from .pagination import keyset_page, prefix_pattern, BadCursor
+from .revocation import revoke_user_tokens
+from .audit import event_dict, query_events
 from urllib.parse import urljoin
+import logging
+
+audit = logging.getLogger("auth.audit")
 
 ui_bp = Blueprint("ui", __name__)
 
@@ -21,10 +30,26 @@ def login():
     if request.method == "POST":
         username = request.form["username"]
         password = request.form["password"]
+        who = {"user": username, "ip": request.remote_addr}
+        lock = login_throttle.check(**who)
+        if lock:
+            audit.warning("login_failed", extra={"username": username, "reason": "throttled",
+                                                 "scope": lock.scope, "retry_after": lock.retry_after})
+            flash("Too many failed attempts, try again later")
+            return render_template("login.html"), 429, {"Retry-After": str(lock.retry_after)}
         user = User.query.filter_by(username=username).first()
-        if user and check_password_hash(user.password, password):
+        if user and verify_password(user.password, password):
+            login_throttle.record_success(user=username)
+            if upgrade_hash(user, password):
+                db.session.commit()
             login_user(user)
+            audit.info("login_success", extra={"username": username, "user_id": user.id,
+                                               "reason": "ok", "service": "ui"})
             return redirect(url_for("ui.dashboard"))
+        login_throttle.record_failure(**who)
+        audit.info("login_failed", extra={"username": username,
+                                          "reason": "bad_password" if user else "user_not_found",
+                                          "service": "ui"})
         flash("Invalid credentials")
     return render_template("login.html")
 
@@ -41,8 +66,37 @@ def logout():
 def dashboard():
     if not current_user.is_admin:
         return "Forbidden", 403
-    keys = ServiceApiKey.query.all()
-    return render_template("dashboard.html", keys=keys)
+    try:
+        keys, next_cursor = _key_page()
+    except BadCursor:
+        flash("Invalid page link, showing the first page")
+        return redirect(url_for("ui.dashboard", q=request.args.get("q") or None))
+    return render_template("dashboard.html", keys=keys, next_cursor=next_cursor)
+
+
+def _key_page():
+    query = ServiceApiKey.query
+    q = request.args.get("q", "").strip()
+    if q:
+        query = query.filter(ServiceApiKey.prefix.like(prefix_pattern(q), escape="\\"))
+    return keyset_page(query, [ServiceApiKey.id], request.args.get("cursor"),
+                       request.args.get("limit", type=int))
+
+
+@ui_bp.route("/apikeys/data")
+@login_required
+def apikeys_data():
+    if not current_user.is_admin:
+        return jsonify({"error": "Forbidden"}), 403
+    try:
+        keys, next_cursor = _key_page()
+    except BadCursor as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({
+        "keys": [{"id": k.id, "prefix": k.prefix, "description": k.description,
+                  "created_at": k.created_at.strftime("%Y-%m-%d %H:%M")} for k in keys],
+        "next_cursor": next_cursor,
+    })
 
 
 @ui_bp.route("/apikeys/add", methods=["POST"])
@@ -51,9 +105,12 @@ def add_apikey():
     if not current_user.is_admin:
         return "Forbidden", 403
     description = request.form.get("description")
-    key = secrets.token_hex(32)
-    db.session.add(ServiceApiKey(key=key, description=description))
+    row, key = ServiceApiKey.generate(description=description)
+    db.session.add(row)
+    invalidate_api_keys()
     db.session.commit()
+    audit.info("api_key_created", extra={"actor_id": current_user.id, "key_id": row.id,
+                                         "key_prefix": row.prefix})
     flash(f"Created new API key: {key}")
     return redirect(url_for("ui.dashboard"))
 
@@ -66,17 +123,98 @@ def delete_apikey(key_id):
     k = db.session.get(ServiceApiKey, key_id)
     if k:
         db.session.delete(k)
+        invalidate_api_keys()
         db.session.commit()
+        audit.info("api_key_deleted", extra={"actor_id": current_user.id, "key_id": key_id,
+                                             "key_prefix": k.prefix})
         return jsonify({"success": True, "id": key_id})
     return jsonify({"error": "API key not found"}), 404
 
+@ui_bp.route("/admin/sql-top")
+@login_required
+def sql_top():
+    if not current_user.is_admin:
+        return jsonify({"error": "Forbidden"}), 403
+    # Per worker; each gunicorn worker keeps its own table
+    limit = min(request.args.get("limit", 20, type=int), 200)
+    return jsonify({"queries": top_queries.top(limit)})
+
+
+@ui_bp.route("/admin/audit")
+@login_required
+def audit_events():
+    """Audit events, newest first: ?user_id= ?username= ?service_id= ?event=
+    ?since= ?until= (ISO 8601, UTC) ?cursor= ?limit="""
+    if not current_user.is_admin:
+        return jsonify({"error": "Forbidden"}), 403
+    args = request.args
+    try:
+        events, next_cursor = query_events(
+            user_id=args.get("user_id", type=int), username=args.get("username"),
+            service_id=args.get("service_id", type=int), event=args.get("event"),
+            since=args.get("since"), until=args.get("until"),
+            cursor=args.get("cursor"), limit=args.get("limit", type=int))
+    except ValueError as e:  # BadCursor included
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"events": [event_dict(e) for e in events], "next_cursor": next_cursor})
+
+
 @ui_bp.route("/users")
 @login_required
 def list_users():
     if not current_user.is_admin:
         return "Forbidden", 403
-    users = User.query.all()
-    return render_template("users.html", users=users)
+    try:
+        users, next_cursor = _user_page()
+    except BadCursor:
+        flash("Invalid page link, showing the first page")
+        return redirect(url_for("ui.list_users", q=request.args.get("q") or None))
+    return render_template("users.html", users=users, next_cursor=next_cursor,
+                           q=request.args.get("q", ""))
+
+
+def _user_page():
+    """One page of users: by (created_at, id), or by the searched column
+    when ?q= is a username prefix (or an email prefix if it contains "@")."""
+    q = request.args.get("q", "").strip()
+    query = User.query
+    if not q:
+        order = [User.created_at, User.id]
+    else:
+        col = User.email if "@" in q else User.username
+        query = query.filter(col.like(prefix_pattern(q), escape="\\"))
+        order = [col, User.id]
+    return keyset_page(query, order, request.args.get("cursor"),
+                       request.args.get("limit", type=int))
+
+
+@ui_bp.route("/users/data")
+@login_required
+def users_data():
+    if not current_user.is_admin:
+        return jsonify({"error": "Forbidden"}), 403
+    try:
+        users, next_cursor = _user_page()
+    except BadCursor as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({
+        "users": [{"id": u.id, "username": u.username, "email": u.email,
+                   "is_admin": bool(u.is_admin), "is_self": u.id == current_user.id,
+                   "created_at": u.created_at.strftime("%Y-%m-%d %H:%M")} for u in users],
+        "next_cursor": next_cursor,
+    })
+
+
+@ui_bp.route("/users/export")
+@login_required
+def export_users_ndjson():
+    if not current_user.is_admin:
+        return "Forbidden", 403
+    from .bulk import export_users
+
+    audit.info("users_exported", extra={"actor_id": current_user.id})
+    return Response(stream_with_context(export_users()), mimetype="application/x-ndjson",
+                    headers={"Content-Disposition": "attachment; filename=users.ndjson"})
 
 
 @ui_bp.route("/users/toggle/<int:user_id>", methods=["POST"])
@@ -88,7 +226,10 @@ def toggle_admin(user_id):
     if not user:
         return jsonify({"error": "User not found"}), 404
     user.is_admin = not user.is_admin
+    bump_token_version(user)  # is_admin claim in issued tokens is now stale
     db.session.commit()
+    audit.info("admin_toggled", extra={"actor_id": current_user.id, "user_id": user.id,
+                                       "username": user.username, "is_admin": user.is_admin})
     return jsonify({"success": True, "username": user.username, "is_admin": user.is_admin})
 
 
@@ -102,8 +243,13 @@ def delete_user(user_id):
         return jsonify({"error": "User not found"}), 404
     if user.id == current_user.id:
         return jsonify({"error": "You cannot delete yourself"}), 400
+    revoke_refresh_tokens(user.id)
+    revoke_user_tokens(user.id)
     db.session.delete(user)
+    forget_user(user.id)
     db.session.commit()
+    audit.info("user_deleted", extra={"actor_id": current_user.id, "user_id": user_id,
+                                      "username": user.username})
     return jsonify({"success": True})
 
 
@@ -130,10 +276,12 @@ def add_user():
 
         user = User(username=username,
                     email=email,
-                    password=generate_password_hash(password),
+                    password=hash_password(password),
                     is_admin=is_admin)
         db.session.add(user)
         db.session.commit()
+        audit.info("user_created", extra={"actor_id": current_user.id, "user_id": user.id,
+                                          "username": username, "is_admin": is_admin})
         flash(f"User {username} created (admin={is_admin})")
         return redirect(url_for("ui.list_users"))
 
@@ -154,6 +302,8 @@ def reset_password(user_id):
     base = request.url_root   # keeps trailing slash
     path = url_for("ui.reset_with_token", token=token)
     reset_url = urljoin(base, path)
+    audit.info("password_reset_link_created", extra={"actor_id": current_user.id, "user_id": user.id,
+                                                     "username": user.username})
 
     return jsonify({"reset_url": reset_url})
 
@@ -180,8 +330,12 @@ def reset_with_token(token):
             flash("User not found")
             return redirect(url_for("ui.login"))
 
-        user.password = generate_password_hash(password)
+        user.password = hash_password(password)
+        bump_token_version(user)
+        revoke_refresh_tokens(user.id)
+        revoke_user_tokens(user.id)
         db.session.commit()
+        audit.info("password_reset", extra={"user_id": user.id, "username": user.username})
         flash("Password updated, please log in")
         return redirect(url_for("ui.login"))
 
@@ -1,24 +1,86 @@
-import jwt
+import hmac
 import os
 import logging
-from sqlalchemy import select
+import uuid
+from sqlalchemy import select, update
 from datetime import datetime, timedelta
 from functools import wraps
-from flask import request, jsonify, g
+from flask import request, jsonify, g, current_app
+from flask_login import UserMixin
 from itsdangerous import URLSafeTimedSerializer
-from .models import ServiceApiKey, db
+from .models import ServiceApiKey, User, RefreshToken, db, api_key_prefix, hash_api_key
+from .cache import TTLCache, VersionGate, bump_version
+from .keys import keyring
+from .revocation import denylist, sync_denylist
+from .replicas import confirm_on_primary, read_only
 
 SECRET_KEY = os.getenv("SECRET_KEY", "super-secret")
 
 access_log = logging.getLogger("auth.access")
 
+# In-process API key cache (keyed by digest, never the key): valid keys for APIKEY_CACHE_TTL seconds, unknown
+# keys for the (shorter) APIKEY_NEG_TTL. Other workers notice add/delete via
+# the "api_keys" version row, polled every APIKEY_VERSION_POLL seconds.
+api_key_cache = TTLCache(maxsize=int(os.getenv("APIKEY_CACHE_SIZE", "1024")),
+                         ttl=float(os.getenv("APIKEY_CACHE_TTL", "300")))
+api_key_negative_cache = TTLCache(maxsize=int(os.getenv("APIKEY_NEG_CACHE_SIZE", "4096")),
+                                  ttl=float(os.getenv("APIKEY_NEG_TTL", "5")))
+api_key_version = VersionGate("api_keys", interval=float(os.getenv("APIKEY_VERSION_POLL", "2")))
+
+
+def clear_api_key_cache():
+    api_key_cache.clear()
+    api_key_negative_cache.clear()
+
+
+def invalidate_api_keys():
+    """Call before committing a ServiceApiKey change."""
+    bump_version("api_keys")
+    clear_api_key_cache()
+
+
+def api_key_cache_stats() -> dict:
+    return {"positive": api_key_cache.stats(),
+            "negative": api_key_negative_cache.stats(),
+            "version_polls": api_key_version.polls}
+
+
+def _find_api_key(key, digest):
+    # Indexed point lookup on the public prefix, then a constant-time compare
+    # of the digest (the prefix alone is not secret).
+    row = None
+    for candidate in ServiceApiKey.query.filter_by(prefix=api_key_prefix(key)):
+        if hmac.compare_digest(candidate.key_hash, digest):
+            row = candidate
+    return row
+
+
+@read_only
+def lookup_api_key(key: str) -> dict | None:
+    """Return {"id", "desc"} for a valid key, served from cache when possible."""
+    if api_key_version.changed():
+        clear_api_key_cache()
+    digest = hash_api_key(key)
+    svc = api_key_cache.get(digest)
+    if svc is not None:
+        return svc
+    if api_key_negative_cache.get(digest) is not None:
+        return None
+    row = confirm_on_primary(lambda: _find_api_key(key, digest))
+    if not row:
+        api_key_negative_cache.set(digest, True)
+        return None
+    svc = {"id": row.id, "desc": row.description}
+    api_key_cache.set(digest, svc)
+    return svc
+
 def service_name_for_key(key: str) -> str | None:
     # Avoid leaking full keys in logs
-    svc = ServiceApiKey.query.filter_by(key=key).first()
+    svc = lookup_api_key(key)
     if not svc:
         return None
     # Use id or a short description in logs
-    return f"id={svc.id}" + (f",desc={svc.description}" if svc.description else "")
+    return f"id={svc['id']}" + (f",desc={svc['desc']}" if svc["desc"] else "")
 
 def require_api_key(f):
     from functools import wraps
@@ -28,27 +90,190 @@ def require_api_key(f):
         if not key:
             logging.getLogger("auth.access").warning("missing_api_key")
             return jsonify({"error": "Missing API key"}), 401
-        svc = ServiceApiKey.query.filter_by(key=key).first()
+        svc = lookup_api_key(key)
         if not svc:
             logging.getLogger("auth.access").warning("invalid_api_key", extra={"key_suffix": key[-4:]})
             return jsonify({"error": "Invalid API key"}), 403
-        g.calling_service = {"id": svc.id, "desc": svc.description}
+        g.calling_service = svc
+        sync_denylist()
         return f(*args, **kwargs)
     return decorated
 
-def generate_token(user_id):
-    payload = {"user_id": user_id, "exp": datetime.utcnow() + timedelta(hours=2)}
-    token = jwt.encode(payload, SECRET_KEY, algorithm="HS256")
-    if isinstance(token, bytes):  # PyJWT < 2
-        token = token.decode("utf-8")
+# Current token_version per user_id (None = user gone), used by stateless
+# verify to notice stale claims. Cleared when the "users" version row moves.
+token_version_cache = TTLCache(maxsize=int(os.getenv("TOKEN_VERSION_CACHE_SIZE", "10000")),
+                               ttl=float(os.getenv("TOKEN_VERSION_CACHE_TTL", "60")))
+users_version = VersionGate("users", interval=float(os.getenv("USERS_VERSION_POLL", "2")))
+USER_GONE = object()
+
+# Flask-Login session users (UI requests). Other workers see admin-flag and
+# password changes within USERS_VERSION_POLL seconds; the TTL bounds
+# staleness for changes made outside forget_user().
+session_user_cache = TTLCache(maxsize=int(os.getenv("SESSION_USER_CACHE_SIZE", "1024")),
+                              ttl=float(os.getenv("SESSION_USER_CACHE_TTL", "30")))
+
+
+def clear_user_caches():
+    token_version_cache.clear()
+    session_user_cache.clear()
+
+
+def sync_user_caches():
+    # One gate feeds both caches, so a change must clear both at once
+    if users_version.changed():
+        clear_user_caches()
+
+
+class SessionUser(UserMixin):
+    """Detached snapshot of the User columns the UI reads."""
+
+    def __init__(self, user):
+        self.id = user.id
+        self.username = user.username
+        self.email = user.email
+        self.is_admin = bool(user.is_admin)
+
+
+@read_only
+def load_session_user(user_id) -> SessionUser | None:
+    sync_user_caches()
+    snap = session_user_cache.get(user_id)
+    if snap is None:
+        user = confirm_on_primary(lambda: db.session.get(User, user_id))
+        snap = SessionUser(user) if user else USER_GONE
+        session_user_cache.set(user_id, snap)
+    return None if snap is USER_GONE else snap
+
+
+def current_token_version(user_id) -> int | None:
+    """token_version for user_id, or None if the user no longer exists."""
+    sync_user_caches()
+    v = token_version_cache.get(user_id)
+    if v is None:
+        v = confirm_on_primary(lambda: db.session.execute(
+            select(User.token_version).where(User.id == user_id)
+        ).scalar())
+        v = USER_GONE if v is None else v
+        token_version_cache.set(user_id, v)
+    return None if v is USER_GONE else v
+
+
+def bump_token_version(user):
+    """Invalidate claims in tokens already issued to `user` (call before commit)."""
+    user.token_version = (user.token_version or 0) + 1
+    forget_user(user.id)
+
+
+def forget_user(user_id):
+    """Tell every worker to drop cached state about `user_id` (call before commit)."""
+    bump_version("users")
+    token_version_cache.pop(user_id)
+    session_user_cache.pop(user_id)
+
+
+def generate_token(user):
+    now = datetime.utcnow()
+    # iat/jti in every profile: revocation works by jti and by per-user iat cutoff
+    payload = {"user_id": user.id, "iat": now, "jti": uuid.uuid4().hex,
+               "exp": now + timedelta(seconds=current_app.config["ACCESS_TOKEN_TTL"])}
+    if current_app.config["TOKEN_CLAIMS_PROFILE"] == "full":
+        # Self-contained claims so /verify can answer without the User table
+        payload.update({
+            "username": user.username,
+            "is_admin": bool(user.is_admin),
+            "tv": user.token_version or 0,
+        })
+    return keyring.sign(payload)
+
+
+class RefreshRejected(Exception):
+    """Refresh token unusable; `reason` is for the audit log only."""
+
+    def __init__(self, reason, user_id=None):
+        super().__init__(reason)
+        self.reason = reason
+        self.user_id = user_id
+
+
+def issue_refresh_token(user, family_id=None) -> str:
+    """Add a refresh token row for `user` (caller commits); returns the plaintext."""
+    expires = datetime.utcnow() + timedelta(days=current_app.config["REFRESH_TOKEN_TTL_DAYS"])
+    row, token = RefreshToken.generate(user.id, family_id or uuid.uuid4().hex, expires)
+    db.session.add(row)
     return token
 
 
+def rotate_refresh_token(token):
+    """Spend `token` and return (user, successor token), committed.
+
+    No password hashing: one lookup by digest, one conditional UPDATE and one
+    INSERT. A token that was already spent revokes its whole family, since
+    either the client or an attacker holds a stolen copy.
+    """
+    if not isinstance(token, str) or not token:
+        raise RefreshRejected("missing")
+    row = db.session.execute(
+        select(RefreshToken).where(RefreshToken.token_hash == hash_api_key(token))
+    ).scalar()
+    if row is None:
+        raise RefreshRejected("unknown")
+    now = datetime.utcnow()
+    if row.revoked_at is not None:
+        raise RefreshRejected("revoked", row.user_id)
+    if row.expires_at <= now:
+        raise RefreshRejected("expired", row.user_id)
+    # Only one concurrent caller can flip used_at; the loser is a reuse
+    spent = db.session.execute(
+        update(RefreshToken)
+        .where(RefreshToken.id == row.id, RefreshToken.used_at.is_(None))
+        .values(used_at=now)
+    ).rowcount
+    if not spent:
+        revoke_refresh_tokens(family_id=row.family_id)
+        db.session.commit()
+        raise RefreshRejected("reused", row.user_id)
+    user = db.session.get(User, row.user_id)
+    if user is None:
+        db.session.rollback()
+        raise RefreshRejected("user_not_found", row.user_id)
+    successor = issue_refresh_token(user, row.family_id)
+    db.session.commit()
+    return user, successor
+
+
+def revoke_refresh_token(token) -> bool:
+    """Revoke the family of a presented refresh token (caller commits)."""
+    if not isinstance(token, str) or not token:
+        return False
+    family = db.session.execute(
+        select(RefreshToken.family_id).where(RefreshToken.token_hash == hash_api_key(token))
+    ).scalar()
+    if family is None:
+        return False
+    revoke_refresh_tokens(family_id=family)
+    return True
+
+
+def revoke_refresh_tokens(user_id=None, family_id=None):
+    """Revoke every live refresh token of a user or a family (caller commits)."""
+    cond = RefreshToken.user_id == user_id if family_id is None else RefreshToken.family_id == family_id
+    db.session.execute(
+        update(RefreshToken)
+        .where(cond, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=datetime.utcnow())
+    )
+
+
 def decode_token(token):
+    """Claims of a valid, unrevoked token, else None. The revocation check
+    is in memory; require_api_key keeps the denylist in sync."""
     try:
-        return jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+        payload = keyring.decode(token)
     except Exception:
         return None
+    if denylist.is_revoked(payload):
+        return None
+    return payload
 
 def generate_reset_token(email, expires_sec=3600):
     s = URLSafeTimedSerializer(SECRET_KEY)
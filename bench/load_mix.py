@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+"""Mixed-workload load test for the auth API, results kept per commit.
+
+    python bench/load_mix.py --mix verify=95,login=5 --concurrency 32 --duration 20
+    python bench/load_mix.py --mix login=30,register=10,userinfo=30,refresh=30
+    DATABASE_URL=mysql+pymysql://u:p@127.0.0.1/authdb python bench/load_mix.py
+
+Boots `app:create_app()` under gunicorn (--workers) against a throwaway
+SQLite file unless DATABASE_URL is set, seeds --users users, then runs
+--concurrency client threads for --duration seconds. Each thread picks
+operations at random in the --mix proportions (seeded, so runs repeat).
+Operations: login, verify, userinfo, register, refresh.
+
+Reports req/s and p50/p95/p99 overall and per operation, plus SQL statements
+per request per endpoint, read from the server's /metrics
+(auth_sql_statements_per_request). Results are merged into --out under the
+current commit and scenario, and the most recent other commit with the same
+scenario is printed alongside. SQLite serializes writers, so write-heavy
+mixes should be run against MySQL.
+"""
+import argparse, http.client, json, os, random, re, sys, tempfile, threading, time
+from datetime import datetime, timezone
+
+from common import (ROOT, RESULTS, free_port, git_revision, latency_summary,
+                    start_gunicorn, wait_healthy, write_json)
+
+sys.path.insert(0, ROOT)
+
+PASSWORD = "bench-password"
+ENDPOINTS = {"login": "auth.login", "verify": "auth.verify", "userinfo": "auth.userinfo",
+             "register": "auth.register", "refresh": "auth.refresh"}
+
+
+def parse_mix(spec):
+    mix = {}
+    for part in spec.split(","):
+        op, _, weight = part.partition("=")
+        if op.strip() not in ENDPOINTS:
+            raise SystemExit(f"unknown operation {op!r} (choose from {', '.join(ENDPOINTS)})")
+        mix[op.strip()] = float(weight or 1)
+    return mix
+
+
+def seed(env, users, sessions):
+    """Bootstrap the schema and seed users, tokens and refresh tokens."""
+    os.environ.update(env)
+    from werkzeug.security import generate_password_hash
+    from app import create_app
+    from app import bulk, cli
+    from app.hashing import HASH_METHOD
+    from app.models import db, ServiceApiKey, User
+    from app.utils import generate_token, issue_refresh_token
+
+    app = create_app()
+    with app.app_context():
+        cli.bootstrap(app)
+        row, key = ServiceApiKey.generate(description="bench")
+        db.session.add(row)
+        db.session.commit()
+        pwhash = generate_password_hash(PASSWORD, HASH_METHOD)  # hash once, reuse
+        rows = ((n, {"username": f"bench{n}", "password_hash": pwhash}) for n in range(users))
+        for _ in bulk.import_users(rows, trusted=True):
+            pass
+        seeded = User.query.filter(User.username.like("bench%")).order_by(User.id).all()
+        tokens = [generate_token(u) for u in seeded]
+        refresh = [issue_refresh_token(seeded[i % len(seeded)]) for i in range(sessions)]
+        db.session.commit()
+        return key, [u.username for u in seeded], tokens, refresh
+
+
+class Client:
+    """One load-generating thread's connection and session state."""
+
+    def __init__(self, port, api_key, usernames, tokens, refresh_token, rng, tid):
+        self.port = port
+        self.headers = {"Content-Type": "application/json", "x-api-key": api_key}
+        self.usernames = usernames
+        self.tokens = tokens
+        self.refresh_token = refresh_token
+        self.rng = rng
+        self.tid = tid
+        self.registered = 0
+        self.conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+
+    def body(self, op):
+        if op == "login":
+            return {"username": self.rng.choice(self.usernames), "password": PASSWORD}
+        if op in ("verify", "userinfo"):
+            return {"token": self.rng.choice(self.tokens)}
+        if op == "register":
+            self.registered += 1
+            return {"username": f"new-{os.getpid()}-{self.tid}-{self.registered}",
+                    "password": PASSWORD}
+        return {"refresh_token": self.refresh_token}
+
+    def call(self, op):
+        """Returns (ok, latency ms); None latency on transport errors."""
+        path = "/api/token/refresh" if op == "refresh" else f"/api/{op}"
+        payload = json.dumps(self.body(op))
+        t0 = time.perf_counter()
+        try:
+            self.conn.request("POST", path, body=payload, headers=self.headers)
+            resp = self.conn.getresponse()
+            data = resp.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            self.conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=30)
+            return False, None
+        ms = (time.perf_counter() - t0) * 1000.0
+        ok = resp.status in (200, 201)
+        if ok and op == "refresh":
+            self.refresh_token = json.loads(data)["refresh_token"]
+        return ok, ms
+
+
+def drive(port, api_key, usernames, tokens, refresh, mix, concurrency, duration, seed_value):
+    ops, weights = list(mix), list(mix.values())
+    per_op = {op: [] for op in ops}
+    errors = {op: 0 for op in ops}
+    lock = threading.Lock()
+    stop = time.perf_counter() + duration
+
+    def worker(tid):
+        rng = random.Random(seed_value * 1000 + tid)
+        client = Client(port, api_key, usernames, tokens, refresh[tid], rng, tid)
+        mine = {op: [] for op in ops}
+        bad = {op: 0 for op in ops}
+        while time.perf_counter() < stop:
+            op = rng.choices(ops, weights)[0]
+            ok, ms = client.call(op)
+            if ms is not None:
+                mine[op].append(ms)
+            if not ok:
+                bad[op] += 1
+        with lock:
+            for op in ops:
+                per_op[op].extend(mine[op])
+                errors[op] += bad[op]
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    result = {"errors": sum(errors.values()),
+              **latency_summary([ms for lst in per_op.values() for ms in lst], elapsed),
+              "ops": {}}
+    for op in ops:
+        result["ops"][op] = {"errors": errors[op], **latency_summary(per_op[op], elapsed)}
+    return result
+
+
+_SAMPLE = re.compile(r'^auth_sql_statements_per_request_(sum|count)\{endpoint="([^"]+)"\} (\S+)$', re.M)
+
+
+def sql_counters(port, token):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    conn.request("GET", "/metrics", headers={"Authorization": f"Bearer {token}"})
+    text = conn.getresponse().read().decode()
+    out = {}
+    for kind, endpoint, value in _SAMPLE.findall(text):
+        out.setdefault(endpoint, {"sum": 0.0, "count": 0.0})[kind] += float(value)
+    return out
+
+
+def queries_per_request(before, after, mix):
+    result = {}
+    for op in mix:
+        a, b = after.get(ENDPOINTS[op]), before.get(ENDPOINTS[op], {"sum": 0.0, "count": 0.0})
+        if a and a["count"] > b["count"]:
+            result[op] = round((a["sum"] - b["sum"]) / (a["count"] - b["count"]), 2)
+    return result
+
+
+def previous_run(history, commit, scenario):
+    runs = [(r[scenario]["recorded_at"], sha, r[scenario])
+            for sha, r in history.items() if sha != commit and scenario in r]
+    return max(runs)[1:] if runs else None
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--mix", default="verify=95,login=5")
+    ap.add_argument("--workers", type=int, default=2)
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--duration", type=float, default=15.0)
+    ap.add_argument("--warmup", type=float, default=2.0)
+    ap.add_argument("--users", type=int, default=200)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--out", default=os.path.join(RESULTS, "load_mix.json"))
+    args = ap.parse_args()
+    mix = parse_mix(args.mix)
+
+    tmp = tempfile.mkdtemp(prefix="auth-bench-")
+    env = {
+        "DATABASE_URL": os.getenv("DATABASE_URL", f"sqlite:///{tmp}/bench.db"),
+        "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+        "SQL_POOL_LOG_LEVEL": os.getenv("SQL_POOL_LOG_LEVEL", "WARNING"),
+        "SECRET_KEY": os.getenv("SECRET_KEY", "bench-secret-for-local-runs-only-0000"),
+        "API_PREFIX": "/api",
+        "AUTO_BOOTSTRAP": "false",
+        "METRICS_TOKEN": "bench-metrics-token",
+        # every benchmark login comes from one address and one service key
+        "LOGIN_THROTTLE_IP": os.getenv("LOGIN_THROTTLE_IP", ""),
+        "LOGIN_THROTTLE_SERVICE": os.getenv("LOGIN_THROTTLE_SERVICE", ""),
+    }
+    sessions = args.concurrency * 2  # warm-up and measured run each spend one chain
+    api_key, usernames, tokens, refresh = seed(env, args.users, sessions)
+
+    port = free_port()
+    proc = start_gunicorn(port, args.workers, ["app:create_app()"],
+                          {**env, "PROMETHEUS_MULTIPROC_DIR": os.path.join(tmp, "prom")})
+    try:
+        wait_healthy(port)
+        drive(port, api_key, usernames, tokens, refresh[args.concurrency:], mix,
+              args.concurrency, args.warmup, args.seed + 1)
+        before = sql_counters(port, env["METRICS_TOKEN"])
+        result = drive(port, api_key, usernames, tokens, refresh[:args.concurrency], mix,
+                       args.concurrency, args.duration, args.seed)
+        result["queries_per_request"] = queries_per_request(before, sql_counters(port, env["METRICS_TOKEN"]), mix)
+    finally:
+        proc.terminate()
+        proc.wait(10)
+
+    commit, dirty = git_revision()
+    database = env["DATABASE_URL"].split("://", 1)[0]
+    scenario = f"{args.mix}|c{args.concurrency}|w{args.workers}|{database}"
+    result.update(recorded_at=datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                  dirty=dirty, duration_s=args.duration, users=args.users,
+                  cpu_count=os.cpu_count())
+
+    print(f"{scenario} @ {commit[:10]}{' (dirty)' if dirty else ''}")
+    print(f"  all        {result['req_per_s']:>9} req/s  p50={result['p50_ms']}ms "
+          f"p95={result['p95_ms']}ms p99={result['p99_ms']}ms errors={result['errors']}")
+    for op, r in result["ops"].items():
+        q = result["queries_per_request"].get(op, "?")
+        print(f"  {op:<10} {r['req_per_s']:>9} req/s  p50={r['p50_ms']}ms "
+              f"p95={r['p95_ms']}ms p99={r['p99_ms']}ms errors={r['errors']} sql/req={q}")
+
+    history = {}
+    if os.path.exists(args.out):
+        with open(args.out) as fh:
+            history = json.load(fh)
+    prev = previous_run(history, commit, scenario)
+    if prev:
+        sha, old = prev
+        print(f"  previous   {old['req_per_s']:>9} req/s  p99={old['p99_ms']}ms @ {sha[:10]}")
+    history.setdefault(commit, {})[scenario] = result
+    write_json(args.out, history)
+
+
+if __name__ == "__main__":
+    main()
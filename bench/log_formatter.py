@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""Records/sec of JsonFormatter vs FastJsonFormatter on typical payloads.
+
+    python bench/log_formatter.py --records 200000
+
+Formats an access record (the shape install_flask_hooks emits) and an audit
+record (routes.login) with each formatter; FastJsonFormatter is measured with
+orjson when installed and again with the stdlib fallback. Prints a table and
+writes JSON (--out).
+"""
+import argparse, json, logging, os, sys, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app import logging_setup  # noqa: E402
+from app.logging_setup import FastJsonFormatter, JsonFormatter  # noqa: E402
+
+ACCESS = {
+    "name": "access", "levelno": logging.INFO, "levelname": "INFO", "msg": "request",
+    "request_id": "5f0c9e3a4b2d4c7e9a1b2c3d4e5f6a7b",
+    "method": "POST", "path": "/api/verify", "endpoint": "auth.verify", "status": 200,
+    "ok": True, "latency_ms": 3.42, "remote_addr": "10.0.3.17",
+    "user_agent": "python-requests/2.32.3",
+    "headers": {"Host": "auth-service:5000", "User-Agent": "python-requests/2.32.3",
+                "Content-Type": "application/json", "X-Api-Key": "ak****9f"},
+    "json": {"token": "ey****Qk"},
+}
+AUDIT = {
+    "name": "auth.audit", "levelno": logging.INFO, "levelname": "INFO", "msg": "login_failed",
+    "request_id": "0a1b2c3d4e5f60718293a4b5c6d7e8f9",
+    "username": "alice", "reason": "bad_password", "user_exists": True,
+    "service": {"id": 3, "desc": "barebone-site"},
+}
+
+
+def measure(formatter, records, n):
+    start = time.perf_counter()
+    for i in range(n):
+        rec = records[i & 1]
+        rec.created = start + i * 1e-5  # ~100 records per millisecond
+        formatter.format(rec)
+    return n / (time.perf_counter() - start)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--records", type=int, default=200_000)
+    ap.add_argument("--out", default=os.path.join(ROOT, "bench", "results", "log_formatter.json"))
+    args = ap.parse_args()
+
+    records = [logging.makeLogRecord(dict(ACCESS)), logging.makeLogRecord(dict(AUDIT))]
+    results = {"records": args.records, "orjson": logging_setup.orjson is not None}
+    results["JsonFormatter"] = measure(JsonFormatter(), records, args.records)
+    results["FastJsonFormatter"] = measure(FastJsonFormatter(), records, args.records)
+    if logging_setup.orjson is not None:
+        saved, logging_setup.orjson = logging_setup.orjson, None
+        try:
+            results["FastJsonFormatter[stdlib]"] = measure(FastJsonFormatter(), records, args.records)
+        finally:
+            logging_setup.orjson = saved
+
+    base = results["JsonFormatter"]
+    for name in ("JsonFormatter", "FastJsonFormatter", "FastJsonFormatter[stdlib]"):
+        if name in results:
+            print(f"{name:<28} {results[name]:>12,.0f} records/s  x{results[name] / base:.2f}")
+            results[name] = round(results[name], 1)
+
+    os.makedirs(os.path.dirname(args.out), exist_ok=True)
+    with open(args.out, "w") as fh:
+        json.dump(results, fh, indent=2)
+    print(f"wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+"""Concurrent /verify throughput: sync gunicorn workers vs the async path.
+
+Boots the service twice on this machine with the same worker count and the
+same database, once as `app:create_app()` (sync workers) and once as
+`app.asgi:create_asgi_app()` (uvicorn workers), then hammers POST /api/verify
+from --concurrency client threads for --duration seconds each.
+
+    python bench/verify_async_vs_sync.py --workers 2 --concurrency 64
+    DATABASE_URL=mysql+pymysql://u:p@127.0.0.1/authdb python bench/verify_async_vs_sync.py
+
+Without DATABASE_URL a throwaway SQLite file is used. Results are printed and
+written as JSON (--out). The client runs in this process, so on small hosts
+give the servers the spare cores (the client is usually not the bottleneck
+for the sync path, which is what we compare against).
+"""
+import argparse, http.client, json, os, sys, tempfile, threading, time
+
+from common import ROOT, free_port, latency_summary, start_gunicorn, wait_healthy, write_json
+
+sys.path.insert(0, ROOT)
+
+MODES = {
+    "sync": ["app:create_app()"],
+    "async": ["-k", "uvicorn.workers.UvicornWorker", "app.asgi:create_asgi_app()"],
+}
+
+
+def seed(env):
+    """Create schema, a service key and a token; returns (api_key, token)."""
+    os.environ.update(env)
+    from app import cli, create_app
+    from app.models import db, ServiceApiKey, User
+    from app.utils import generate_token
+
+    app = create_app()
+    with app.app_context():
+        cli.bootstrap(app)
+        row, key = ServiceApiKey.generate(description="bench")
+        db.session.add(row)
+        db.session.commit()
+        admin = User.query.filter_by(username=app.config["DEFAULT_ADMIN"]).first()
+        return key, generate_token(admin)
+
+
+def drive(port, path, headers, body, concurrency, duration):
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    stop = time.perf_counter() + duration
+
+    def worker():
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+        mine, bad = [], 0
+        while time.perf_counter() < stop:
+            t0 = time.perf_counter()
+            try:
+                conn.request("POST", path, body=body, headers=headers)
+                resp = conn.getresponse()
+                resp.read()
+                if resp.status != 200:
+                    bad += 1
+            except (OSError, http.client.HTTPException):
+                bad += 1
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+                continue
+            mine.append((time.perf_counter() - t0) * 1000.0)
+        with lock:
+            latencies.extend(mine)
+            errors[0] += bad
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    return {"errors": errors[0], **latency_summary(latencies, elapsed)}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--workers", type=int, default=2)
+    ap.add_argument("--concurrency", type=int, default=32)
+    ap.add_argument("--duration", type=float, default=10.0)
+    ap.add_argument("--modes", default="sync,async")
+    ap.add_argument("--out", default=os.path.join(ROOT, "bench", "results", "verify_async_vs_sync.json"))
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="auth-bench-")
+    env = {
+        "DATABASE_URL": os.getenv("DATABASE_URL", f"sqlite:///{tmp}/bench.db"),
+        "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+        "SECRET_KEY": os.getenv("SECRET_KEY", "bench-secret-for-local-runs-only-0000"),
+        "API_PREFIX": "/api",
+    }
+    api_key, token = seed(env)
+    body = json.dumps({"token": token})
+    headers = {"Content-Type": "application/json", "x-api-key": api_key}
+
+    results = {"workers": args.workers, "concurrency": args.concurrency,
+               "duration_s": args.duration, "cpu_count": os.cpu_count(),
+               "database": env["DATABASE_URL"].split("://", 1)[0], "modes": {}}
+    for mode in args.modes.split(","):
+        port = free_port()
+        proc = start_gunicorn(port, args.workers, MODES[mode], env)
+        try:
+            wait_healthy(port)
+            drive(port, "/api/verify", headers, body, args.concurrency, 1.0)  # warm-up
+            results["modes"][mode] = drive(port, "/api/verify", headers, body,
+                                           args.concurrency, args.duration)
+        finally:
+            proc.terminate()
+            proc.wait(10)
+        print(mode, json.dumps(results["modes"][mode]))
+
+    write_json(args.out, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -16,6 +16,7 @@ DEFAULT_API_KEY=$(python3 -c 'import secrets; print(secrets.token_hex(64))')
 MYSQL_PASSWORD=$(python3 -c 'import secrets; print(secrets.token_urlsafe(16))')
 MYSQL_ROOT_PASSWORD=$(python3 -c 'import secrets; print(secrets.token_urlsafe(16))')
 DEFAULT_ADMIN_PASSWORD=$(python3 -c 'import secrets; print(secrets.token_urlsafe(16))')
+METRICS_TOKEN=$(python3 -c 'import secrets; print(secrets.token_urlsafe(32))')
 
 cat > $ENV_FILE <<EOL
 # =============================
@@ -44,6 +45,9 @@ DEFAULT_ADMIN_PASSWORD=${DEFAULT_ADMIN_PASSWORD}
 
 # Default service API key (first allowed service)
 AUTH_SERVICE_API_KEY=${DEFAULT_API_KEY}
+
+# Prometheus scrape token for /metrics (Authorization: Bearer ...)
+METRICS_TOKEN=${METRICS_TOKEN}
 EOL
 
 echo "✅ $ENV_FILE created with secure random values."
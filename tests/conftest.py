@@ -1,6 +1,10 @@
 import pytest
 from app import create_app, db
 from app.models import User, ServiceApiKey
+from app.audit import audit_writer
+from app.revocation import denylist
+from app.throttle import login_throttle
+from app.utils import clear_api_key_cache, api_key_version, clear_user_caches, users_version
 from werkzeug.security import generate_password_hash
 
 TEST_ADMIN_USER = "admin"
@@ -32,11 +36,23 @@ def app_context(app):
              password=generate_password_hash(TEST_ADMIN_PASS),
              is_admin=True)
         db.session.add(admin)
-        db.session.add(ServiceApiKey(key=TEST_API_KEY, description="test key"))
+        db.session.add(ServiceApiKey.from_plaintext(TEST_API_KEY, description="test key"))
         db.session.commit()
 
+        # per-worker caches outlive the per-test DB reset
+        clear_api_key_cache()
+        api_key_version.reset()
+        clear_user_caches()
+        users_version.reset()
+        login_throttle.backend.clear()
+        denylist.clear()
+        audit_writer.clear()
+
         yield
 
+        # don't let the writer thread flush into the next test's tables
+        audit_writer.clear()
+
 
 @pytest.fixture
 def client(app, app_context):
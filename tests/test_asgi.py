@@ -0,0 +1,100 @@
+import asyncio
+import json
+
+import pytest
+
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app import asgi as asgi_module
+from app.asgi import create_asgi_app
+
+TEST_API_KEY = "testkey123"
+
+
+def call(asgi, path, body=None, method="POST", headers=None, sent=None):
+    """Drive one ASGI request and return (status, json body); the raw
+    messages are appended to `sent` if given."""
+    raw = json.dumps(body or {}).encode()
+    hdrs = [(b"content-type", b"application/json"), (b"content-length", str(len(raw)).encode())]
+    hdrs += [(k.encode(), v.encode()) for k, v in (headers or {}).items()]
+    scope = {"type": "http", "method": method, "path": path, "raw_path": path.encode(),
+             "root_path": "", "query_string": b"", "headers": hdrs, "scheme": "http",
+             "server": ("test", 80), "client": ("127.0.0.1", 1234), "http_version": "1.1",
+             "asgi": {"version": "3.0"}}
+    sent = [] if sent is None else sent
+
+    async def receive():
+        return {"type": "http.request", "body": raw, "more_body": False}
+
+    async def send(msg):
+        sent.append(msg)
+
+    async def run():
+        await asgi(scope, receive, send)
+        await asgi.engine.dispose()
+
+    asyncio.run(run())
+    status = sent[0]["status"]
+    body = b"".join(m.get("body", b"") for m in sent[1:])
+    return status, json.loads(body) if body else None
+
+
+@pytest.fixture
+def asgi(app):
+    return create_asgi_app(app)
+
+
+def test_async_verify_and_userinfo(client, asgi, app):
+    from app import metrics
+    prefix = app.config["API_PREFIX"]
+    served = metrics.REQUESTS.labels("auth.userinfo", "POST", "200")._value.get()
+    token = client.post(f"{prefix}/login", headers={"x-api-key": TEST_API_KEY},
+                        json={"username": "admin", "password": "adminpass"}).get_json()["token"]
+
+    status, data = call(asgi, f"{prefix}/verify", {"token": token}, headers={"x-api-key": TEST_API_KEY})
+    assert status == 200 and data["username"] == "admin"
+
+    status, data = call(asgi, f"{prefix}/userinfo", {"token": token}, headers={"x-api-key": TEST_API_KEY})
+    assert status == 200 and "created_at" in data
+    # same endpoint label as the Flask view
+    assert metrics.REQUESTS.labels("auth.userinfo", "POST", "200")._value.get() == served + 1
+
+    status, _ = call(asgi, f"{prefix}/verify", {"token": "bogus"}, headers={"x-api-key": TEST_API_KEY})
+    assert status == 401
+    status, _ = call(asgi, f"{prefix}/verify", {"token": token}, headers={"x-api-key": "nope"})
+    assert status == 403
+
+
+def test_async_falls_back_to_flask(asgi):
+    status, data = call(asgi, "/health", method="GET")
+    assert status == 200 and data == {"status": "ok"}
+
+
+def test_db_errors_answer_503_and_are_logged(asgi, app, monkeypatch, tmp_path):
+    asgi.engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/missing/x.db")
+    logged = []
+    monkeypatch.setattr(asgi_module.access, "info", lambda msg, extra: logged.append(extra))
+    sent = []
+    status, data = call(asgi, f"{app.config['API_PREFIX']}/verify", {"token": "x"},
+                        headers={"x-api-key": "unseen-key", "x-request-id": "rid-1"}, sent=sent)
+    assert status == 503 and "error" in data
+    assert (b"x-request-id", b"rid-1") in sent[0]["headers"]
+    assert logged[0]["status"] == 503 and logged[0]["endpoint"] == "auth.verify"
+
+
+def test_access_log_policy_applies_to_async_path(client, asgi, app, monkeypatch):
+    from app.logging_setup import AccessLogPolicy
+    prefix = app.config["API_PREFIX"]
+    token = client.post(f"{prefix}/login", headers={"x-api-key": TEST_API_KEY},
+                        json={"username": "admin", "password": "adminpass"}).get_json()["token"]
+    logged = []
+    monkeypatch.setattr(asgi_module.access, "info", lambda msg, extra: logged.append(extra))
+    asgi.log_policy = AccessLogPolicy(endpoint_rates={"auth.verify": 0.0},
+                                      fields=("endpoint", "status", "headers"))
+
+    status, _ = call(asgi, f"{prefix}/verify", {"token": token}, headers={"x-api-key": TEST_API_KEY})
+    assert status == 200 and logged == []  # sampled out
+    call(asgi, f"{prefix}/verify", {"token": "x"}, headers={"x-api-key": TEST_API_KEY})
+    [entry] = logged  # errors are always logged, with the allowlisted fields only
+    assert set(entry) == {"endpoint", "status", "headers"} and entry["status"] == 401
+    assert entry["headers"]["x-api-key"] != TEST_API_KEY  # masked
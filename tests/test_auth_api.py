@@ -104,3 +104,109 @@ def test_userinfo(client):
     data = res.get_json()
     assert data["username"] == "admin"
     assert "created_at" in data
+
+
+def test_verify_batch(client):
+    token = api_login(client)
+
+    res = client.post("/auth/verify/batch",
+                      headers={"x-api-key": TEST_API_KEY},
+                      json={"tokens": [token, "bogus", token]})
+    assert res.status_code == 200
+    results = res.get_json()["results"]
+    assert [r["status"] for r in results] == [200, 401, 200]
+    assert results[0]["username"] == "admin"
+    assert results[0]["user_id"] == results[2]["user_id"]
+
+
+def test_verify_batch_limit(client, app):
+    limit = app.config["VERIFY_BATCH_MAX"]
+    res = client.post("/auth/verify/batch",
+                      headers={"x-api-key": TEST_API_KEY},
+                      json={"tokens": ["x"] * (limit + 1)})
+    assert res.status_code == 413
+
+
+def test_verify_stateless_skips_user_lookup(client, app, monkeypatch):
+    from app.models import User, db
+
+    monkeypatch.setitem(app.config, "VERIFY_STATELESS", True)
+    token = api_login(client)
+    # warm the per-worker token_version cache
+    client.post("/auth/verify", headers={"x-api-key": TEST_API_KEY}, json={"token": token})
+
+    gets = []
+    real_get = db.session.get
+    monkeypatch.setattr(db.session, "get",
+                        lambda *a, **kw: gets.append(a) or real_get(*a, **kw))
+    res = client.post("/auth/verify", headers={"x-api-key": TEST_API_KEY},
+                      json={"token": token})
+    assert res.status_code == 200
+    assert res.get_json()["username"] == "admin"
+    assert not [a for a in gets if a and a[0] is User]
+
+
+def test_token_version_bump_invalidates_token(client, app, monkeypatch):
+    from app.models import User, db
+    from app.utils import bump_token_version
+
+    monkeypatch.setitem(app.config, "VERIFY_STATELESS", True)
+    token = api_login(client)
+    bump_token_version(User.query.filter_by(username="admin").first())
+    db.session.commit()
+
+    for strict in (False, True):
+        res = client.post("/auth/verify", headers={"x-api-key": TEST_API_KEY},
+                          json={"token": token, "strict": strict})
+        assert res.status_code == 401
+
+
+def _login_pair(client):
+    res = client.post("/auth/login", headers={"x-api-key": TEST_API_KEY},
+                      json={"username": "admin", "password": "adminpass"})
+    body = res.get_json()
+    return body["token"], body["refresh_token"]
+
+
+def _refresh(client, refresh_token):
+    return client.post("/auth/token/refresh", headers={"x-api-key": TEST_API_KEY},
+                       json={"refresh_token": refresh_token})
+
+
+def test_refresh_rotates_without_password_check(client, monkeypatch):
+    from app import routes
+    _, rt = _login_pair(client)
+
+    def no_hashing(*a):
+        raise AssertionError("refresh must not verify a password")
+    monkeypatch.setattr(routes, "verify_password", no_hashing)
+
+    res = _refresh(client, rt)
+    assert res.status_code == 200
+    body = res.get_json()
+    assert body["refresh_token"] != rt
+    verify = client.post("/auth/verify", headers={"x-api-key": TEST_API_KEY},
+                         json={"token": body["token"]})
+    assert verify.status_code == 200
+    assert _refresh(client, body["refresh_token"]).status_code == 200
+
+
+def test_refresh_reuse_revokes_family(client):
+    _, rt = _login_pair(client)
+    successor = _refresh(client, rt).get_json()["refresh_token"]
+    assert _refresh(client, rt).status_code == 401          # replayed
+    assert _refresh(client, successor).status_code == 401   # family revoked
+    assert _refresh(client, "rt_nope").status_code == 401
+
+    # other sessions of the same user are untouched
+    _, other = _login_pair(client)
+    assert _refresh(client, other).status_code == 200
+
+
+def test_password_reset_revokes_refresh_tokens(client):
+    _, rt = _login_pair(client)
+    client.post("/login", data={"username": "admin", "password": "adminpass"})
+    reset_url = client.post("/users/reset/1").get_json()["reset_url"]
+    client.post(f"/reset/{reset_url.split('/')[-1]}",
+                data={"password": "newpass", "confirm_password": "newpass"})
+    assert _refresh(client, rt).status_code == 401
@@ -0,0 +1,34 @@
+import logging
+
+from app import create_app
+from app.config import Config
+from app.models import db, User, ServiceApiKey
+
+
+def test_create_app_without_bootstrap_does_no_db_io(monkeypatch, tmp_path):
+    # Any connection to this URL would fail: the directory does not exist
+    monkeypatch.setattr(Config, "SQLALCHEMY_DATABASE_URI", f"sqlite:///{tmp_path}/missing/x.db")
+    monkeypatch.setattr(Config, "AUTO_BOOTSTRAP", False)
+    app = create_app()
+    assert app.test_client().get("/health").status_code == 200
+
+
+def test_bootstrap_command_creates_defaults(app):
+    db.drop_all()
+    result = app.test_cli_runner().invoke(args=["bootstrap"])
+    assert result.exit_code == 0, result.output
+    assert User.query.filter_by(username="admin", is_admin=True).count() == 1
+    assert ServiceApiKey.query.count() == 1
+    # idempotent
+    assert app.test_cli_runner().invoke(args=["bootstrap"]).exit_code == 0
+    assert User.query.count() == 1
+
+
+def test_first_response_is_reported_once(client, caplog):
+    from app import metrics
+    metrics._boot.update(t0=0.0)
+    caplog.set_level(logging.INFO, logger="bootstrap")
+    client.get("/health")
+    client.get("/health")
+    recs = [r for r in caplog.records if r.msg == "worker_first_request"]
+    assert len(recs) == 1 and recs[0].duration_ms > 0
@@ -0,0 +1,94 @@
+import json
+
+TEST_API_KEY = "testkey123"
+
+
+def _import(client, body, **kw):
+    return client.post("/auth/users/import", data=body,
+                       headers={"x-api-key": TEST_API_KEY, **kw.pop("headers", {})}, **kw)
+
+
+def test_import_ndjson_reports_each_row(client):
+    body = "\n".join([
+        json.dumps({"username": "ann", "password": "pw1", "email": "ann@example.com"}),
+        json.dumps({"username": "admin", "password": "x"}),             # exists
+        json.dumps({"username": "ann", "password": "again"}),            # repeated
+        "not json",
+        json.dumps({"username": "bo"}),                                 # no password
+        json.dumps({"username": "cy", "password_hash": "pbkdf2:sha256:1$a$b"}),  # not trusted
+        json.dumps({"username": "dee", "password": "pw2"}),
+    ])
+    res = _import(client, body, content_type="application/x-ndjson")
+    assert res.status_code == 200
+    data = res.get_json()
+    assert [r["status"] for r in data["results"]] == [
+        "created", "duplicate", "duplicate", "invalid", "invalid", "invalid", "created"]
+    assert data["summary"] == {"created": 2, "duplicate": 2, "invalid": 3, "failed": 0}
+
+    login = client.post("/auth/login", headers={"x-api-key": TEST_API_KEY},
+                        json={"username": "dee", "password": "pw2"})
+    assert login.status_code == 200
+
+
+def test_import_csv_in_small_batches(client, monkeypatch):
+    from app import bulk
+    monkeypatch.setattr(bulk, "BATCH_SIZE", 2)
+    body = "username,email,password\n" + "".join(f"u{i},u{i}@example.com,pw{i}\n" for i in range(5))
+    res = _import(client, body, content_type="text/csv")
+    assert res.get_json()["summary"]["created"] == 5
+
+
+def test_import_gives_up_when_hash_pool_stays_busy(client, monkeypatch):
+    from app import bulk
+    from app.hashing import HashPoolBusy
+
+    calls = []
+
+    def busy(password):
+        calls.append(password)
+        raise HashPoolBusy(retry_after=0)
+
+    monkeypatch.setattr(bulk, "hash_password", busy)
+    monkeypatch.setattr(bulk, "HASH_RETRIES", 2)
+    monkeypatch.setattr(bulk, "HASH_CONCURRENCY", 1)
+    body = "\n".join(json.dumps({"username": f"b{i}", "password": "p"}) for i in range(3))
+    data = _import(client, body).get_json()
+    assert data["summary"]["failed"] == 3
+    assert len(calls) == 3  # the first row used up the retries, the rest didn't wait
+
+
+def test_hash_concurrency_follows_the_resized_pool(monkeypatch):
+    from app import bulk
+    monkeypatch.setattr(bulk, "HASH_CONCURRENCY", 0)
+    monkeypatch.setattr(bulk.hasher, "workers", 8)
+    assert bulk._hash_concurrency() == 4
+
+
+def test_import_row_limit(client, app, monkeypatch):
+    monkeypatch.setitem(app.config, "BULK_IMPORT_MAX_ROWS", 2)
+    body = "\n".join(json.dumps({"username": f"n{i}", "password": "p"}) for i in range(3))
+    data = _import(client, body).get_json()
+    assert data["truncated"] is True and len(data["results"]) == 2
+    assert "import-users" in data["hint"]
+
+
+def test_export_and_cli_round_trip(client, app, tmp_path):
+    client.post("/login", data={"username": "admin", "password": "adminpass"})
+    _import(client, json.dumps({"username": "eve", "password": "pw", "email": "eve@example.com"}))
+    res = client.get("/users/export")
+    rows = [json.loads(line) for line in res.get_data(as_text=True).splitlines()]
+    assert [r["username"] for r in rows] == ["admin", "eve"]
+    assert "password" not in rows[0] and "password_hash" not in rows[0]
+
+    runner = app.test_cli_runner()
+    dump = tmp_path / "users.ndjson"
+    assert runner.invoke(args=["export-users", "--with-hashes", "--out", str(dump)]).exit_code == 0
+
+    from app.models import db, User
+    db.session.query(User).filter_by(username="eve").delete()
+    db.session.commit()
+    result = runner.invoke(args=["import-users", str(dump)])
+    assert "created=1, duplicate=1" in result.output
+    login = client.post("/auth/login", headers={"x-api-key": TEST_API_KEY},
+                        json={"username": "eve", "password": "pw"})
+    assert login.status_code == 200
@@ -0,0 +1,99 @@
+import os
+import threading
+import time
+
+import pytest
+
+from app import hashing
+from app.hashing import HashExecutor, HashPoolBusy, HashPoolUnavailable
+
+TEST_API_KEY = "testkey123"
+
+
+def test_pool_hashes_and_verifies():
+    ex = HashExecutor(workers=1, queue_max=1, start_method="spawn")
+    try:
+        from werkzeug.security import check_password_hash, generate_password_hash
+        h = ex.run(generate_password_hash, "pw")
+        assert ex.run(check_password_hash, h, "pw") is True
+        stats = ex.stats()
+        assert stats["completed"] == 2
+        assert stats["in_flight"] == 0
+    finally:
+        ex.shutdown()
+
+
+def test_rejects_when_full():
+    ex = HashExecutor(workers=0, queue_max=0)
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+
+    t = threading.Thread(target=ex.run, args=(slow,))
+    t.start()
+    started.wait(5)
+    with pytest.raises(HashPoolBusy):
+        ex.run(time.sleep, 0)
+    release.set()
+    t.join()
+    assert ex.stats()["rejected"] == 1
+    ex.run(time.sleep, 0)  # slot freed again
+
+
+def test_dead_worker_fails_fast_and_pool_is_rebuilt():
+    from werkzeug.security import generate_password_hash
+    ex = HashExecutor(workers=1, queue_max=1, start_method="spawn")
+    try:
+        with pytest.raises(HashPoolUnavailable):
+            ex.run(os._exit, 1)
+        assert ex.run(generate_password_hash, "pw").startswith("scrypt:")
+        assert ex.stats()["in_flight"] == 0
+    finally:
+        ex.shutdown()
+
+
+def test_slow_hash_times_out_as_busy():
+    ex = HashExecutor(workers=1, queue_max=0, timeout=0.05, start_method="spawn")
+    try:
+        with pytest.raises(HashPoolBusy):
+            ex.run(time.sleep, 1)
+        # still running in the pool, so its slot is still taken
+        assert ex.stats()["in_flight"] == 1
+    finally:
+        ex.shutdown()
+
+
+def test_login_returns_503_when_pool_busy(client, monkeypatch):
+    def busy(*a, **kw):
+        raise HashPoolBusy(retry_after=3)
+
+    monkeypatch.setattr(hashing.hasher, "run", busy)
+    res = client.post("/auth/login", headers={"x-api-key": TEST_API_KEY},
+                      json={"username": "admin", "password": "adminpass"})
+    assert res.status_code == 503
+    assert res.headers["Retry-After"] == "3"
+
+
+def test_login_upgrades_outdated_hash(client):
+    from werkzeug.security import generate_password_hash
+    from app.models import User, db
+
+    admin = User.query.filter_by(username="admin").first()
+    admin.password = generate_password_hash("adminpass", "pbkdf2:sha256:1000")
+    db.session.commit()
+    assert hashing.needs_rehash(admin.password)
+
+    res = client.post("/auth/login", headers={"x-api-key": TEST_API_KEY},
+                      json={"username": "admin", "password": "adminpass"})
+    assert res.status_code == 200
+    db.session.expire_all()
+    admin = User.query.filter_by(username="admin").first()
+    assert not hashing.needs_rehash(admin.password)
+
+
+def test_calibrate_recommends_method():
+    result = hashing.calibrate("pbkdf2", target_ms=5, samples=3)
+    assert result["recommended"].startswith("pbkdf2:sha256:")
+    assert result["tried"]
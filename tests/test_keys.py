@@ -0,0 +1,55 @@
+import jwt
+import pytest
+
+from app.keys import KeyRing, generate_private_key, write_private_key, keyring
+
+TEST_API_KEY = "testkey123"
+
+
+@pytest.fixture
+def keys_dir(tmp_path):
+    write_private_key(str(tmp_path), "2024-old", generate_private_key("RS256"))
+    write_private_key(str(tmp_path), "2025-new", generate_private_key("EdDSA"))
+    return tmp_path
+
+
+def test_sign_with_newest_key_and_verify_older(keys_dir):
+    ring = KeyRing()
+    ring.configure("secret", keys_dir=str(keys_dir))
+    token = ring.sign({"user_id": 1})
+    assert jwt.get_unverified_header(token) == {"alg": "EdDSA", "kid": "2025-new", "typ": "JWT"}
+    assert ring.decode(token)["user_id"] == 1
+
+    old = KeyRing()
+    old.configure("secret", keys_dir=str(keys_dir), active_kid="2024-old")
+    assert ring.decode(old.sign({"user_id": 2}))["user_id"] == 2
+
+
+def test_hs256_tokens_rejected_when_disabled(keys_dir):
+    hs = KeyRing()
+    hs.configure("secret")
+    ring = KeyRing()
+    ring.configure("secret", keys_dir=str(keys_dir), accept_hs256=False)
+    with pytest.raises(jwt.InvalidTokenError):
+        ring.decode(hs.sign({"user_id": 1}))
+
+
+def test_jwks_endpoint_and_api_tokens(client, app, keys_dir):
+    keyring.configure(app.config["SECRET_KEY"], keys_dir=str(keys_dir))
+    try:
+        res = client.get("/.well-known/jwks.json")
+        assert res.status_code == 200
+        assert "max-age" in res.headers["Cache-Control"]
+        kids = {k["kid"]: k for k in res.get_json()["keys"]}
+        assert kids["2025-new"]["kty"] == "OKP"
+        assert kids["2024-old"]["kty"] == "RSA"
+
+        again = client.get("/.well-known/jwks.json", headers={"If-None-Match": res.headers["ETag"]})
+        assert again.status_code == 304
+
+        token = client.post("/auth/login", headers={"x-api-key": TEST_API_KEY},
+                            json={"username": "admin", "password": "adminpass"}).get_json()["token"]
+        jwk = jwt.PyJWK(kids["2025-new"])
+        assert jwt.decode(token, jwk.key, algorithms=["EdDSA"])["username"] == "admin"
+    finally:
+        keyring.init_app(app)
@@ -0,0 +1,119 @@
+import gzip
+import json
+import logging
+import queue
+
+from app.logging_setup import DroppingQueueHandler, JsonFormatter, _file_sink, _request_id
+
+
+def _record(msg="hello", **extra):
+    return logging.makeLogRecord({"name": "t", "levelno": logging.INFO,
+                                  "levelname": "INFO", "msg": msg, **extra})
+
+
+def test_queue_handler_drops_instead_of_blocking():
+    q = queue.Queue(maxsize=2)
+    h = DroppingQueueHandler(q)
+    for i in range(5):
+        h.emit(_record(f"m{i}"))
+    assert h.dropped == 3
+
+    q.get_nowait(), q.get_nowait()
+    h.emit(_record("after"))
+    notice, rec = q.get_nowait(), q.get_nowait()
+    assert notice.msg == "log_records_dropped" and notice.count == 3
+    assert rec.msg == "after"
+
+
+def test_request_id_and_exception_survive_the_queue():
+    q = queue.Queue()
+    h = DroppingQueueHandler(q)
+    token = _request_id.set("rid-1")
+    try:
+        try:
+            1 / 0
+        except ZeroDivisionError:
+            import sys
+            h.emit(_record("boom %s", args=("x",), exc_info=sys.exc_info()))
+    finally:
+        _request_id.reset(token)
+
+    out = json.loads(JsonFormatter().format(q.get_nowait()))
+    assert out["msg"] == "boom x"
+    assert out["request_id"] == "rid-1"
+    assert "ZeroDivisionError" in out["exc_info"]
+
+
+def test_file_sink_rotates_and_compresses(tmp_path, monkeypatch):
+    monkeypatch.setenv("LOG_MAX_BYTES", "200")
+    monkeypatch.setenv("LOG_COMPRESS", "true")
+    h = _file_sink(str(tmp_path / "logs" / "app.json"))
+    h.setFormatter(JsonFormatter())
+    for i in range(20):
+        h.emit(_record(f"line {i}"))
+    h.close()
+    rotated = sorted(p.name for p in (tmp_path / "logs").iterdir())
+    assert "app.json.1.gz" in rotated
+    with gzip.open(tmp_path / "logs" / "app.json.1.gz") as fh:
+        assert json.loads(fh.readline())["msg"].startswith("line")
+
+
+def test_access_policy_sampling():
+    from app.logging_setup import AccessLogPolicy
+
+    policy = AccessLogPolicy(default_rate=1.0, endpoint_rates={"auth.verify": 0.0}, slow_ms=100)
+    assert policy.rate_for("auth.login", 200, 5) == 1.0
+    assert policy.rate_for("auth.verify", 200, 5) == 0.0
+    assert policy.rate_for("auth.verify", 401, 5) == 1.0    # errors always
+    assert policy.rate_for("auth.verify", 200, 150) == 1.0  # slow always
+
+
+def test_access_log_scrubs_body_and_headers(client, caplog):
+    caplog.set_level(logging.INFO, logger="access")
+    client.post("/auth/login", headers={"x-api-key": "testkey123"},
+                json={"username": "admin", "password": "adminpass"})
+    rec = [r for r in caplog.records if r.name == "access"][-1]
+    assert rec.json["password"] != "adminpass"
+    assert rec.json["username"] == "admin"
+    assert rec.headers["X-Api-Key"] != "testkey123"
+
+
+def test_fast_formatter_matches_standard_output():
+    from app.logging_setup import FastJsonFormatter
+
+    rec = _record("request", status=200, latency_ms=1.5, headers={"A": "b"},
+                  service={"id": 1, "desc": None}, json={"n": object()}, created=1700000000.1234)
+    slow = json.loads(JsonFormatter().format(rec))
+    fast = json.loads(FastJsonFormatter().format(rec))
+    assert fast.keys() == slow.keys()
+    assert fast["ts"] == slow["ts"]
+    assert fast["status"] == 200 and fast["headers"] == {"A": "b"}
+    assert isinstance(fast["json"]["n"], str)
+
+
+
+def test_sql_fingerprint_normalizes_literals_and_in_lists():
+    from app.db_logging import fingerprint
+
+    a = fingerprint("SELECT * FROM users\n WHERE id = 7 AND name = 'bob'")
+    b = fingerprint("SELECT * FROM users WHERE id = 12 AND name = 'o''neil'")
+    assert a == b == "SELECT * FROM users WHERE id = ? AND name = ?"
+    assert fingerprint("SELECT id FROM users WHERE id IN (?, ?, ?)") == \
+        fingerprint("SELECT id FROM users WHERE id IN (?)")
+
+
+def test_access_log_carries_sql_profile(client, caplog):
+    caplog.set_level(logging.INFO, logger="access")
+    client.post("/auth/login", headers={"x-api-key": "testkey123"},
+                json={"username": "admin", "password": "adminpass"})
+    rec = [r for r in caplog.records if r.name == "access"][-1]
+    assert rec.sql["count"] >= 2  # api key + user lookup
+    assert rec.sql["total_ms"] >= 0
+    assert sum(rec.sql["top"].values()) <= rec.sql["count"]
+
+
+def test_sql_top_is_admin_only(client):
+    assert client.get("/admin/sql-top").status_code in (302, 401)
+    client.post("/login", data={"username": "admin", "password": "adminpass"})
+    rows = client.get("/admin/sql-top").get_json()["queries"]
+    assert rows and {"fingerprint", "count", "total_ms", "max_ms"} <= rows[0].keys()
@@ -0,0 +1,74 @@
+import logging
+
+import pytest
+
+METRICS_TOKEN = "scrape-me"
+AUTH = {"Authorization": f"Bearer {METRICS_TOKEN}"}
+
+
+@pytest.fixture(autouse=True)
+def metrics_token(app):
+    app.config["METRICS_TOKEN"] = METRICS_TOKEN
+
+
+def test_metrics_endpoint_counts_requests_and_logins(client):
+    client.post("/auth/login", headers={"x-api-key": "testkey123"},
+                json={"username": "admin", "password": "wrong"})
+    res = client.get("/metrics", headers=AUTH)
+    assert res.status_code == 200
+    text = res.get_data(as_text=True)
+    assert 'auth_http_requests_total{endpoint="auth.login",method="POST",status="401"}' in text
+    assert 'auth_http_request_duration_seconds_bucket{endpoint="auth.login"' in text
+    assert 'auth_login_total{event="login_failed",reason="bad_password"}' in text
+
+
+def test_metrics_needs_token(client, app):
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer nope"}).status_code == 401
+    app.config["METRICS_TOKEN"] = None
+    assert client.get("/metrics", headers=AUTH).status_code == 404
+
+
+def test_non_string_audit_messages_are_ignored(app, capsys):
+    logging.getLogger("auth.audit").warning({"event": "odd"})
+    assert "Traceback" not in capsys.readouterr().err
+
+
+def test_ready_reports_pool_and_ping(client):
+    res = client.get("/health/ready")
+    assert res.status_code == 200
+    body = res.get_json()
+    assert body["status"] == "ready" and body["db"]["ok"] is True
+    assert "checked_out" in body["pool"]
+    assert "auth_db_pool_checkout_wait_seconds_count" in client.get("/metrics", headers=AUTH).get_data(as_text=True)
+
+
+def test_ready_fails_fast_when_pool_exhausted(tmp_path):
+    from sqlalchemy import create_engine
+    from app import db_logging
+
+    engine = create_engine(f"sqlite:///{tmp_path}/p.db", pool_size=1, max_overflow=0, pool_timeout=0.1)
+    db_logging.install(engine)
+    probe = db_logging.ReadinessProbe(engine, ttl=0)
+    assert probe.check()[0] is True
+    with engine.connect():
+        ok, detail = probe.check()
+        assert ok is False and detail["pool"]["saturated"]
+        assert detail["db"]["skipped"] == "pool_saturated"
+    engine.dispose()
+    assert probe.check()[0] is True
+
+
+def test_ready_ping_does_not_wait_on_the_pool(tmp_path):
+    from sqlalchemy import create_engine
+    from app import db_logging
+
+    engine = create_engine(f"sqlite:///{tmp_path}/p.db", pool_size=1, max_overflow=1)
+
+    def blocked():
+        raise AssertionError("ping checked out a pooled connection")
+
+    engine.pool.connect = blocked
+    probe = db_logging.ReadinessProbe(engine, ttl=0)
+    ok, detail = probe.check()
+    assert ok is True and detail["db"]["ping_ms"] is not None
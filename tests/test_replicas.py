@@ -0,0 +1,77 @@
+import shutil
+
+import pytest
+from sqlalchemy import text, update
+
+from app import create_app
+from app.config import Config
+from app.models import db, ServiceApiKey, User
+from app.replicas import replica_reads
+from app.utils import generate_token
+
+TEST_API_KEY = "testkey123"
+HEADERS = {"x-api-key": TEST_API_KEY}
+
+
+@pytest.fixture
+def routed_app(monkeypatch, tmp_path):
+    """App with two SQLite files standing in for a primary and its replica."""
+    monkeypatch.setattr(Config, "SQLALCHEMY_DATABASE_URI", f"sqlite:///{tmp_path}/primary.db")
+    monkeypatch.setattr(Config, "DATABASE_REPLICA_URLS", [f"sqlite:///{tmp_path}/replica.db"])
+    monkeypatch.setattr(Config, "AUTO_BOOTSTRAP", False)
+    app = create_app()
+    app.config.update(TESTING=True)
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(id=1, username="alice", password="x"))
+        db.session.add(ServiceApiKey.from_plaintext(TEST_API_KEY, description="test key"))
+        db.session.commit()
+        db.engine.dispose()
+    # "Replicate" the starting state
+    shutil.copy(tmp_path / "primary.db", tmp_path / "replica.db")
+    return app
+
+
+def _token(app, user_id):
+    with app.app_context():
+        return generate_token(db.session.get(User, user_id))
+
+
+def _primary(app, sql):
+    with app.app_context(), db.engine.begin() as conn:
+        conn.execute(text(sql))
+
+
+def test_verify_reads_from_replica(routed_app):
+    token = _token(routed_app, 1)
+    # Not replicated yet: the replica still has the old name
+    _primary(routed_app, "UPDATE user SET username = 'alice2' WHERE id = 1")
+    res = routed_app.test_client().post("/auth/verify", headers=HEADERS, json={"token": token})
+    assert res.get_json()["username"] == "alice"
+
+
+def test_rows_missing_on_replica_are_confirmed_on_primary(routed_app):
+    _primary(routed_app, "INSERT INTO user (id, username, password, token_version) VALUES (2, 'bob', 'x', 0)")
+    res = routed_app.test_client().post("/auth/verify", headers=HEADERS,
+                                        json={"token": _token(routed_app, 2)})
+    assert res.status_code == 200 and res.get_json()["username"] == "bob"
+
+
+def test_reads_after_a_write_stay_on_primary(routed_app):
+    with routed_app.app_context(), replica_reads():
+        assert db.session.get(User, 1).username == "alice"
+        db.session.execute(update(User).where(User.id == 1).values(username="alice2"))
+        db.session.commit()
+        db.session.expire_all()
+        assert db.session.get(User, 1).username == "alice2"
+
+
+def test_unhealthy_replica_falls_back_to_primary(routed_app):
+    token = _token(routed_app, 1)
+    replica = routed_app.extensions["replicas"].engines[0]
+    with replica.begin() as conn:
+        conn.execute(text("DROP TABLE user"))
+    client = routed_app.test_client()
+    res = client.post("/auth/verify", headers=HEADERS, json={"token": token})
+    assert res.status_code == 200 and res.get_json()["username"] == "alice"
+    assert client.get("/health/ready").get_json()["replicas"] == {"configured": 1, "down": [0]}
@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+
+from app.models import db, RevokedToken, User
+from app.revocation import Denylist, denylist, sync_denylist
+
+TEST_API_KEY = "testkey123"
+HEADERS = {"x-api-key": TEST_API_KEY}
+
+
+def _login(client):
+    return client.post("/auth/login", headers=HEADERS,
+                       json={"username": "admin", "password": "adminpass"}).get_json()
+
+
+def _verify(client, token):
+    return client.post("/auth/verify", headers=HEADERS, json={"token": token}).status_code
+
+
+def test_revoke_endpoint_kills_one_token(client):
+    first, second = _login(client), _login(client)
+    res = client.post("/auth/token/revoke", headers=HEADERS,
+                      json={"token": first["token"], "refresh_token": first["refresh_token"]})
+    assert res.get_json()["revoked"] == {"token": True, "refresh_token": True}
+    assert _verify(client, first["token"]) == 401
+    assert _verify(client, second["token"]) == 200
+    refresh = client.post("/auth/token/refresh", headers=HEADERS,
+                          json={"refresh_token": first["refresh_token"]})
+    assert refresh.status_code == 401
+
+
+def test_other_workers_pick_up_revocations_incrementally(client, app):
+    token = _login(client)["token"]
+    user_id = User.query.filter_by(username="admin").first().id
+    assert _verify(client, token) == 200
+
+    # Written by "another worker": only the DB knows about it
+    now = datetime.utcnow().replace(microsecond=0) + timedelta(seconds=1)
+    db.session.add(RevokedToken(user_id=user_id, not_before=now, expires_at=now + timedelta(hours=2)))
+    db.session.commit()
+    denylist._next_poll = 0.0
+    assert _verify(client, token) == 401
+
+
+def test_denylist_prunes_expired_entries(app):
+    dl = Denylist(poll=0, prune=0)
+    past = datetime.utcnow() - timedelta(seconds=1)
+    dl.add(jti="a" * 32, expires=past)
+    dl.add(user_id=7, not_before=past, expires=past)
+    assert dl.is_revoked({"user_id": 1, "jti": "a" * 32})
+    dl.prune()
+    assert dl.stats() == {"jtis": 0, "users": 0}
+
+    # and expired rows leave the table on the next sync
+    db.session.add(RevokedToken(jti="b" * 32, expires_at=past))
+    db.session.commit()
+    denylist.clear()
+    denylist._next_prune = 0.0
+    sync_denylist()
+    assert RevokedToken.query.count() == 0
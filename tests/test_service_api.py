@@ -1,4 +1,8 @@
+import json
+import re
+
 import pytest
+from sqlalchemy import create_engine, inspect, text
 
 def login_admin(client):
     return client.post("/login", data={
@@ -20,3 +24,132 @@ def test_delete_service_api_key(client):
     # ServiceApiKey id=2 (since conftest seeds id=1)
     res = client.post("/apikeys/delete/2", follow_redirects=True)
     assert res.status_code == 200
+
+
+def test_api_key_lookup_is_cached(client):
+    from app.utils import api_key_cache
+
+    hits = api_key_cache.hits
+    for _ in range(3):
+        res = client.post("/auth/verify", headers={"x-api-key": "testkey123"},
+                          json={"token": "bogus"})
+        assert res.status_code == 401
+    assert api_key_cache.hits >= hits + 2
+
+
+def test_deleted_api_key_is_rejected(client):
+    login_admin(client)
+    res = client.post("/apikeys/add", data={"description": "short lived"}, follow_redirects=True)
+    key = re.search(rb"Created new API key: (ak_[0-9a-f]+)", res.data).group(1).decode()
+
+    res = client.post("/auth/verify", headers={"x-api-key": key}, json={"token": "bogus"})
+    assert res.status_code == 401  # key accepted, token rejected
+
+    client.post("/apikeys/delete/2")
+    res = client.post("/auth/verify", headers={"x-api-key": key}, json={"token": "bogus"})
+    assert res.status_code == 403
+
+
+def test_unknown_api_key_is_negatively_cached(client):
+    from app.utils import api_key_negative_cache
+
+    for _ in range(2):
+        res = client.post("/auth/verify", headers={"x-api-key": "nope"}, json={"token": "x"})
+        assert res.status_code == 403
+    assert api_key_negative_cache.hits >= 1
+
+
+def test_bump_version_creates_then_increments(app):
+    from app.cache import bump_version, current_version
+    from app.models import db
+
+    before = current_version("fresh")
+    for _ in range(2):
+        bump_version("fresh")
+        db.session.commit()
+    assert (before, current_version("fresh")) == (0, 2)
+
+
+def test_api_key_is_stored_hashed(client):
+    from app.models import ServiceApiKey
+
+    login_admin(client)
+    res = client.post("/apikeys/add", data={"description": "hashed"}, follow_redirects=True)
+    key = re.search(rb"Created new API key: (ak_[0-9a-f]+)", res.data).group(1).decode()
+    row = ServiceApiKey.query.filter_by(description="hashed").first()
+    assert row.prefix == key[:12]
+    assert key not in row.key_hash
+    assert len(row.key_hash) == 64
+
+
+# service_api_key as the baseline schema created it
+LEGACY_DDL = """CREATE TABLE service_api_key (
+	id INTEGER NOT NULL,
+	"key" VARCHAR(64) NOT NULL,
+	description VARCHAR(255),
+	created_at DATETIME,
+	PRIMARY KEY (id),
+	UNIQUE ("key")
+)"""
+
+
+def _legacy_db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/legacy.db")
+    with engine.begin() as conn:
+        conn.execute(text(LEGACY_DDL))
+        conn.execute(text("INSERT INTO service_api_key (id, key, description) "
+                          "VALUES (1, 'legacy-plaintext-key', 'site')"))
+    return engine
+
+
+def test_migrate_legacy_plaintext_keys(tmp_path):
+    from app.cli import migrate_legacy_api_keys
+    from app.models import hash_api_key
+
+    engine = _legacy_db(tmp_path)
+    assert migrate_legacy_api_keys(engine) == 1
+    assert migrate_legacy_api_keys(engine) == 0
+    with engine.connect() as conn:
+        row = conn.execute(text("SELECT id, prefix, key_hash, description FROM service_api_key")).one()
+    assert row == (1, "legacy-plain", hash_api_key("legacy-plaintext-key"), "site")
+    indexes = {ix["name"] for ix in inspect(engine).get_indexes("service_api_key")}
+    assert {"ix_service_api_key_prefix", "ix_service_api_key_key_hash"} <= indexes
+
+
+def test_interrupted_key_migration_can_be_rerun(tmp_path):
+    from app.cli import migrate_legacy_api_keys
+
+    engine = _legacy_db(tmp_path)
+    with engine.begin() as conn:  # a copy that died halfway
+        conn.execute(text("CREATE TABLE service_api_key_rebuild (id INTEGER PRIMARY KEY)"))
+    assert migrate_legacy_api_keys(engine) == 1
+
+    with engine.begin() as conn:  # died right after dropping the old table
+        conn.execute(text("ALTER TABLE service_api_key RENAME TO service_api_key_rebuild"))
+    migrate_legacy_api_keys(engine)
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT prefix FROM service_api_key")).scalar() == "legacy-plain"
+    assert not inspect(engine).has_table("service_api_key_rebuild")
+
+
+def test_added_indexes_are_logged_as_indexes(tmp_path):
+    import logging
+    from app.cli import add_missing_indexes
+    from app.logging_setup import JsonFormatter
+    from app.models import db
+
+    engine = create_engine(f"sqlite:///{tmp_path}/idx.db")
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX ix_service_api_key_prefix"))
+
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    logging.getLogger("migrate").addHandler(handler)
+    try:
+        assert add_missing_indexes(engine) == ["ix_service_api_key_prefix"]
+    finally:
+        logging.getLogger("migrate").removeHandler(handler)
+    out = json.loads(JsonFormatter().format(records[-1]))
+    assert out["indexes"] == ["ix_service_api_key_prefix"] and "columns" not in out
@@ -0,0 +1,75 @@
+import pytest
+
+from app.throttle import LoginThrottle, MemoryBackend, SqliteBackend, login_throttle
+
+TEST_API_KEY = "testkey123"
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def throttle(request, tmp_path):
+    backend = MemoryBackend() if request.param == "memory" else SqliteBackend(str(tmp_path / "t.db"))
+    return LoginThrottle(backend, {"user": (3, 60), "ip": (5, 60)})
+
+
+def test_locks_user_after_limit(throttle):
+    now = 1000.0
+    for _ in range(3):
+        assert throttle.check(now=now, user="bob", ip="1.1.1.1") is None
+        throttle.record_failure(now=now, user="bob", ip="1.1.1.1")
+    lock = throttle.check(now=now, user="bob", ip="1.1.1.1")
+    assert lock.scope == "user" and lock.retry_after > 0
+
+    # a different user from the same IP is still allowed, until the IP limit
+    assert throttle.check(now=now, user="amy", ip="1.1.1.1") is None
+    throttle.record_failure(now=now, user="amy", ip="1.1.1.1")
+    throttle.record_failure(now=now, user="amy", ip="1.1.1.1")
+    assert throttle.check(now=now, user="cat", ip="1.1.1.1").scope == "ip"
+
+
+def test_window_slides_and_success_resets(throttle):
+    for _ in range(3):
+        throttle.record_failure(now=1000.0, user="bob")
+    assert throttle.check(now=1000.0, user="bob")
+    assert throttle.check(now=1000.0 + 130, user="bob") is None  # two windows later
+
+    throttle.record_failure(now=2000.0, user="bob")
+    throttle.record_success(user="bob")
+    assert throttle.backend.get("user:bob", 60, 2000.0) == (0, 0)
+
+
+def test_memory_keys_expire_on_their_own_window():
+    backend = MemoryBackend()
+    backend.hit("user:bob", 60, 1000.0)
+    backend.hit("ip:1.1.1.1", 3600, 1000.0)
+    backend.prune(1000.0 + 200)
+    assert backend.get("user:bob", 60, 1200.0) == (0, 0)
+    assert backend.get("ip:1.1.1.1", 3600, 1200.0) == (0, 1)
+
+
+@pytest.mark.parametrize("fail_open", [True, False])
+def test_backend_errors_fail_open_or_closed(tmp_path, fail_open):
+    throttle = LoginThrottle(SqliteBackend(str(tmp_path / "missing" / "t.db")),
+                             {"user": (3, 60)}, fail_open=fail_open)
+    throttle.record_failure(user="bob")
+    throttle.record_success(user="bob")
+    lock = throttle.check(user="bob")
+    assert lock is None if fail_open else lock.scope == "unavailable"
+
+
+def test_api_login_throttled_before_hashing(client, monkeypatch):
+    from app import routes
+
+    calls = []
+    real = routes.verify_password
+    monkeypatch.setattr(routes, "verify_password", lambda *a: calls.append(1) or real(*a))
+    limit = login_throttle.rules["user"][0]
+    for _ in range(limit):
+        res = client.post("/auth/login", headers={"x-api-key": TEST_API_KEY},
+                          json={"username": "admin", "password": "wrong"})
+        assert res.status_code == 401
+
+    res = client.post("/auth/login", headers={"x-api-key": TEST_API_KEY},
+                      json={"username": "admin", "password": "adminpass"})
+    assert res.status_code == 429
+    assert int(res.headers["Retry-After"]) > 0
+    assert len(calls) == limit
@@ -68,3 +68,75 @@ def test_reset_password(client):
         "confirm_password": "newpass"
     }, follow_redirects=True)
     assert b"Password updated" in res.data
+
+
+def test_users_data_pages_with_cursor_and_searches(client, app):
+    from app.models import db, User
+    with app.app_context():
+        db.session.add_all([User(username=f"page{i:02d}", email=f"p{i}@example.com", password="x")
+                            for i in range(5)] + [User(username="pa_ge", password="x")])
+        db.session.commit()
+    login_admin(client)
+
+    seen, cursor = [], None
+    while True:
+        res = client.get("/users/data", query_string={"limit": 2, **({"cursor": cursor} if cursor else {})})
+        data = res.get_json()
+        seen += [u["username"] for u in data["users"]]
+        cursor = data["next_cursor"]
+        if not cursor:
+            break
+    assert len(seen) == len(set(seen)) == 7  # admin + 6
+
+    # "_" is matched literally, not as a LIKE wildcard
+    names = [u["username"] for u in client.get("/users/data?q=pa_").get_json()["users"]]
+    assert names == ["pa_ge"]
+    emails = [u["email"] for u in client.get("/users/data?q=p3@").get_json()["users"]]
+    assert emails == ["p3@example.com"]
+    assert client.get("/users/data?cursor=nonsense").status_code == 400
+
+
+def test_html_listings_recover_from_bad_cursor(client):
+    login_admin(client)
+    for path, first_page in (("/users", "/users?q=pa"), ("/dashboard", "/dashboard")):
+        res = client.get(path, query_string={"cursor": "zzz", "q": "pa" if path == "/users" else ""})
+        assert res.status_code == 302 and res.headers["Location"].endswith(first_page)
+        res = client.get(res.headers["Location"])
+        assert res.status_code == 200 and b"Invalid page link" in res.data
+
+
+def test_apikeys_data_pages(client):
+    login_admin(client)
+    for i in range(3):
+        client.post("/apikeys/add", data={"description": f"svc{i}"})
+    first = client.get("/apikeys/data?limit=2").get_json()
+    rest = client.get("/apikeys/data", query_string={"cursor": first["next_cursor"]}).get_json()
+    assert len(first["keys"]) == 2 and len(rest["keys"]) == 2 and rest["next_cursor"] is None
+    assert "key_hash" not in first["keys"][0]
+
+
+def test_session_user_is_cached_and_invalidated(client):
+    from app.cache import bump_version
+    from app.models import db
+    from app.utils import load_session_user, session_user_cache, users_version
+    login_admin(client)
+    client.post("/users/add", data={"username": "mo", "password": "pw", "confirm_password": "pw"})
+
+    session_user_cache.clear()
+    assert load_session_user(2).is_admin is False
+    hits = session_user_cache.hits
+    assert load_session_user(2).username == "mo"
+    assert session_user_cache.hits == hits + 1
+
+    client.post("/users/toggle/2")  # this worker drops its snapshot right away
+    assert load_session_user(2).is_admin is True
+
+    # a change made by another worker shows up once the "users" row is polled
+    cached = load_session_user(2)
+    bump_version("users")
+    db.session.commit()
+    users_version._next_poll = 0.0
+    assert load_session_user(2) is not cached
+
+    client.post("/users/delete/2")
+    assert load_session_user(2) is None